@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the tool layer and agent loop.
+
+Times the file tools across file sizes and directory fan-outs, one chat turn
+against an in-process fake Ollama client, _execute_tool dispatch, and cold
+start (importing main and running --help in a fresh interpreter). Results
+are written as JSON; pass --compare with an earlier run to flag regressions.
+
+    python benchmarks/bench_agent.py --output bench.json
+    python benchmarks/bench_agent.py --compare bench.json
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "ollama",
+#     "pydantic",
+# ]
+# ///
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+
+# Add the parent directory to the Python path so we can import main
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from main import AIAgent
+
+
+class FakeClient:
+    """Stands in for ollama.Client: one tool call, then a final answer"""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+
+    def chat(self, model, messages, tools, stream=False):
+        self.calls += 1
+        if self.calls % 2:
+            return {"message": {"content": "", "tool_calls": [
+                {"function": {"name": "read_file", "arguments": {"path": self.path}}}
+            ]}}
+        return {"message": {"content": "The file looks fine."}}
+
+
+def measure(name, fn, repeat, number, setup=None):
+    """Run fn number times per sample, repeat samples; report seconds per call"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    result = {
+        "name": name,
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "min": min(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "repeat": repeat,
+        "number": number,
+    }
+    print(f"  {name:<40} {result['median'] * 1e6:12.1f} us")
+    return result
+
+
+def write_file(path, size):
+    line = "x" * 79 + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(line * (size // len(line)))
+
+
+def bench_read_file(agent, root, sizes, repeat):
+    results = []
+    for size in sizes:
+        path = os.path.join(root, f"read_{size}.txt")
+        write_file(path, size)
+        results.append(measure(f"read_file/{size}", lambda: agent._read_file(path), repeat, 5))
+        results.append(measure(
+            f"read_file_range/{size}",
+            lambda: agent._read_file(path, start_line=100, end_line=120),
+            repeat, 20,
+        ))
+    return results
+
+
+def bench_list_files(agent, root, fanouts, repeat):
+    results = []
+    for fanout in fanouts:
+        directory = os.path.join(root, f"list_{fanout}")
+        for i in range(fanout):
+            sub = os.path.join(directory, f"d{i % 10}")
+            os.makedirs(sub, exist_ok=True)
+            with open(os.path.join(sub if i % 2 else directory, f"f{i}.txt"), "w") as f:
+                f.write("x")
+        results.append(measure(f"list_files/{fanout}", lambda: agent._list_files(directory), repeat, 5))
+        results.append(measure(
+            f"list_files_recursive/{fanout}",
+            lambda: agent._list_files(directory, depth=3, max_entries=100000),
+            repeat, 5,
+        ))
+    return results
+
+
+def bench_edit_file(agent, root, sizes, repeat):
+    results = []
+    for size in sizes:
+        path = os.path.join(root, f"edit_{size}.txt")
+        results.append(measure(
+            f"edit_file/{size}",
+            lambda: agent._edit_file(path, "xxxx", "yyyy"),
+            repeat, 1,
+            setup=lambda: write_file(path, size),
+        ))
+    return results
+
+
+def bench_agent_loop(root, repeat):
+    path = os.path.join(root, "chat.txt")
+    write_file(path, 4096)
+    agent = AIAgent()
+    agent.client = FakeClient(path)
+
+    def turn():
+        agent.messages = []
+        agent.chat("Is chat.txt fine?")
+
+    results = [measure("chat_turn/fake_client", turn, repeat, 20)]
+    results.append(measure(
+        "execute_tool/dispatch",
+        lambda: agent._execute_tool("no_such_tool", {}),
+        repeat, 1000,
+    ))
+    return results
+
+
+def bench_startup(repeat):
+    """Cold start in a fresh interpreter; an empty one is timed for reference"""
+    root = Path(__file__).parent.parent
+
+    def python(*args):
+        return lambda: subprocess.run(
+            [sys.executable, *args], cwd=root, check=True, stdout=subprocess.DEVNULL
+        )
+
+    return [
+        measure("startup/interpreter", python("-c", "pass"), repeat, 3),
+        measure("startup/import_main", python("-c", "import main"), repeat, 3),
+        measure("startup/main_help", python("main.py", "--help"), repeat, 3),
+    ]
+
+
+def run(quick=False):
+    repeat = 3 if quick else 7
+    sizes = [1024, 64 * 1024] if quick else [1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+    fanouts = [10, 100] if quick else [10, 100, 1000, 10000]
+    agent = AIAgent()
+
+    with tempfile.TemporaryDirectory() as root:
+        results = []
+        results += bench_read_file(agent, root, sizes, repeat)
+        results += bench_list_files(agent, root, fanouts, repeat)
+        results += bench_edit_file(agent, root, sizes, repeat)
+        results += bench_agent_loop(root, repeat)
+    results += bench_startup(repeat)
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print the median change per benchmark; return names that regressed"""
+    before = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"\n  {'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for result in current["results"]:
+        old = before.get(result["name"])
+        if old is None:
+            continue
+        change = result["median"] / old["median"] - 1 if old["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(result["name"])
+            flag = "  REGRESSION"
+        print(
+            f"  {result['name']:<40} {old['median'] * 1e6:10.1f}us "
+            f"{result['median'] * 1e6:10.1f}us {change:+7.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the agent's tool layer and chat loop")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Compare against results from an earlier --output run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown of the median that counts as a regression (default: 0.2)",
+    )
+    parser.add_argument("--quick", action="store_true", help="Fewer sizes and repeats, for smoke tests")
+    args = parser.parse_args()
+
+    print("Running benchmarks (median per call)...")
+    current = run(quick=args.quick)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        print("\n✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
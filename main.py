@@ -7,164 +7,2835 @@
 # ///
 
 import os
+import re
+import atexit
+import queue
+import uuid
+import sqlite3
 import sys
+import json
+import fnmatch
+import hashlib
+import contextlib
+import contextvars
+import mmap
+import time
+import shutil
+import tempfile
+import threading
 import argparse
+import importlib
+import importlib.util
 import logging
-from typing import List, Dict, Any
-import ollama  # type: ignore
-from ollama import Client  # type: ignore
-from pydantic import BaseModel  # type: ignore
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(message)s",
-    handlers=[logging.FileHandler("agent.log")],
-)
+import logging.handlers
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Iterator, AsyncIterator, Optional
+from typing import Annotated, NotRequired, Required, TypedDict, Union
+from typing import get_args, get_origin, get_type_hints, is_typeddict
+
+
+class _LazyModule:
+    """Stands in for a module and imports it on first attribute access.
+
+    ollama (with pydantic and httpx) and asyncio make up most of the
+    startup time, and many runs never need them.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+asyncio = _LazyModule("asyncio")
+httpx = _LazyModule("httpx")
+ollama = _LazyModule("ollama")
+http_server = _LazyModule("http.server")
+
+# Optional: zstd compression of stored sessions
+try:
+    from compression import zstd as _zstd  # Python 3.14+
+
+    _zstd_compress, _zstd_decompress = _zstd.compress, _zstd.decompress
+except ImportError:
+    try:
+        import zstandard as _zstd  # type: ignore
+
+        _zstd_compress = _zstd.ZstdCompressor().compress
+        _zstd_decompress = _zstd.ZstdDecompressor().decompress
+    except ImportError:
+        _zstd = None
+
+# agent.log rotates at this size, keeping LOG_BACKUP_COUNT old files
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# Longest value of a single logged field, e.g. a tool's new_text
+LOG_FIELD_MAX_CHARS = 500
+
+# Files the agent writes itself: its log, trace, cassette and batch results
+_OUTPUT_FILES: set = set()
+
+
+def add_output_file(path: str) -> None:
+    """Keep a file the agent writes, and its rotated copies, out of searches."""
+    _OUTPUT_FILES.add(os.path.abspath(path))
+
+
+def is_output_file(path: str) -> bool:
+    # agent.log also covers its rotated copies agent.log.1, agent.log.2...
+    return any(path == output or path.startswith(output + ".") for output in _OUTPUT_FILES)
+
+
+class LogField:
+    """Defers formatting a logged value, truncating it to a size cap.
+
+    Nothing is formatted unless a handler actually emits the record, and
+    even then a large payload costs at most `limit` characters.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = LOG_FIELD_MAX_CHARS):
+        self.value = value
+        self.limit = limit
+
+    def _cap(self, text: str) -> str:
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text)} chars)"
+
+    def __str__(self) -> str:
+        if isinstance(self.value, dict):
+            return "{" + ", ".join(
+                f"{key!r}: {self._cap(repr(item))}" for key, item in self.value.items()
+            ) + "}"
+        return self._cap(str(self.value))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records as they are, leaving all formatting to the listener.
+
+    The stock prepare() formats the message on the calling thread and drops
+    exc_info, which would also lose JsonFormatter's "exception" field.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(
+    level: str = "INFO",
+    path: str = "agent.log",
+    log_format: str = "text",
+    max_bytes: int = LOG_MAX_BYTES,
+    backup_count: int = LOG_BACKUP_COUNT,
+) -> logging.handlers.QueueListener:
+    """Send log records through a queue to a rotating file on a background thread.
+
+    The calling thread only enqueues the record; formatting and disk writes
+    happen in the QueueListener, so a slow disk never stalls a turn.
+    """
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    add_output_file(path)
+    if log_format == "json":
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    return listener
+
+
+def _stop_listener(listener: logging.handlers.QueueListener) -> None:
+    # Flush what is queued; stop() may already have been called by the owner
+    if listener._thread is not None:
+        listener.stop()
+
 
 # Suppress verbose HTTP logs
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
 
-class Tool(BaseModel):
+# Tools that never modify the filesystem and can safely run side by side
+READ_ONLY_TOOLS = {"read_file", "list_files", "search_code"}
+
+SYSTEM_PROMPT = "You are a helpful coding assistant operating in a terminal environment. Output only plain text without markdown formatting, as your responses appear directly in the terminal. Be concise but thorough, providing clear and practical advice with a friendly tone. Don't use any asterisk characters in your responses."
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate: roughly four characters per token."""
+    return (len(text) + 3) // 4
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    # A few tokens of role/formatting overhead per message
+    tokens = 4 + estimate_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += estimate_tokens(function.get("name") or "")
+        tokens += estimate_tokens(json.dumps(function.get("arguments") or {}, default=str))
+    return tokens
+
+
+class ContextWindow:
+    """Keeps the history sent to the model within a token budget.
+
+    Old messages are evicted from the front of the window. Eviction only
+    stops on a user or assistant message, so an assistant tool_call is never
+    separated from its tool results, and never goes past the latest user
+    message. When the budget is exceeded the window is shrunk to low_water of
+    the budget in one step, so the request prefix stays stable for several
+    turns instead of shifting on every request.
+    """
+
+    def __init__(self, budget: int = 8192, low_water: float = 0.75):
+        self.budget = budget
+        self.low_water = low_water
+        self.start = 0
+        self.last_request_tokens = 0
+        self._counts: List[int] = []
+
+    def reset(self) -> None:
+        self.start = 0
+        self._counts = []
+
+    def window(self, messages: List[Dict[str, Any]], fixed_tokens: int = 0) -> List[Dict[str, Any]]:
+        if len(messages) < len(self._counts):
+            # History was replaced or truncated behind our back
+            self.reset()
+        for message in messages[len(self._counts):]:
+            self._counts.append(estimate_message_tokens(message))
+
+        available = self.budget - fixed_tokens
+        total = sum(self._counts[self.start:])
+        if total > available:
+            last_user = max(
+                (i for i, m in enumerate(messages) if m.get("role") == "user"),
+                default=len(messages) - 1,
+            )
+            target = available * self.low_water
+            start = self.start
+            while total > target and start < last_user:
+                total -= self._counts[start]
+                start += 1
+                # Never start the window on a tool result
+                while start < last_user and messages[start].get("role") == "tool":
+                    total -= self._counts[start]
+                    start += 1
+            if start != self.start:
+                logging.info("Context window evicted %d messages", start - self.start)
+            self.start = start
+
+        self.last_request_tokens = fixed_tokens + total
+        return messages[self.start:]
+
+
+# Files at least this large are read through mmap instead of f.read()
+MMAP_THRESHOLD = 64 * 1024
+# Whole-file reads larger than this are cut short; ask for a range instead
+READ_FILE_MAX_BYTES = 256 * 1024
+
+_line_index_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_line_index_lock = threading.Lock()
+_LINE_INDEX_CACHE_SIZE = 32
+
+
+def _build_line_index(data) -> array:
+    """Byte offsets at which each line starts, plus the end of the data."""
+    offsets = array("Q", [0])
+    find = data.find
+    size = len(data)
+    pos = find(b"\n")
+    while pos != -1:
+        offsets.append(pos + 1)
+        pos = find(b"\n", pos + 1)
+    if offsets[-1] != size:
+        offsets.append(size)
+    return offsets
+
+
+def get_line_index(path: str, data, stat: os.stat_result) -> array:
+    """Line index for path, cached while its (mtime, size) stays the same."""
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _line_index_lock:
+        cached = _line_index_cache.get(path)
+        if cached is not None and cached[0] == key:
+            _line_index_cache.move_to_end(path)
+            return cached[1]
+    offsets = _build_line_index(data)
+    with _line_index_lock:
+        _line_index_cache[path] = (key, offsets)
+        _line_index_cache.move_to_end(path)
+        while len(_line_index_cache) > _LINE_INDEX_CACHE_SIZE:
+            _line_index_cache.popitem(last=False)
+    return offsets
+
+
+def read_file_range(
+    path: str,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+    offset: Optional[int] = None,
+    length: Optional[int] = None,
+    tail: Optional[int] = None,
+) -> str:
+    """Read all or part of a file.
+
+    Lines are 1-based and end_line is inclusive. offset/length select a byte
+    range and tail selects the last N lines. Without any of them the whole
+    file is returned, up to READ_FILE_MAX_BYTES.
+    """
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        if size == 0:
+            return f"File contents of {path}:\n"
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size >= MMAP_THRESHOLD else f.read()
+        try:
+            if offset is not None or length is not None:
+                start = min(max(int(offset or 0), 0), size)
+                stop = size if length is None else min(start + max(int(length), 0), size)
+                text = data[start:stop].decode("utf-8", errors="replace")
+                return f"Bytes {start}-{stop} of {size} in {path}:\n{text}"
+
+            if start_line is None and end_line is None and tail is None:
+                if size <= READ_FILE_MAX_BYTES:
+                    return f"File contents of {path}:\n" + data[:].decode("utf-8", errors="replace")
+                text = data[:READ_FILE_MAX_BYTES].decode("utf-8", errors="ignore")
+                return (
+                    f"File contents of {path} (first {READ_FILE_MAX_BYTES} of {size} bytes; "
+                    f"use start_line/end_line, offset/length or tail to read more):\n{text}"
+                )
+
+            offsets = get_line_index(os.path.abspath(path), data, stat)
+            total = len(offsets) - 1
+            if tail is not None:
+                first = max(total - int(tail), 0) + 1
+                last = total
+            else:
+                first = max(int(start_line or 1), 1)
+                last = min(int(end_line) if end_line is not None else total, total)
+            if first > last:
+                return f"No lines {first}-{last} in {path} ({total} lines)"
+            text = data[offsets[first - 1]:offsets[last]].decode("utf-8", errors="replace")
+            return f"Lines {first}-{last} of {total} in {path}:\n{text}"
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+
+def _as_patterns(value: Any) -> List[str]:
+    # Models send either a list or a comma-separated string
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(",")
+    return [pattern.strip() for pattern in value if pattern.strip()]
+
+
+def _matches(name: str, rel: str, patterns: List[str]) -> bool:
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in patterns)
+
+
+def list_directory(
+    path: str,
+    depth: int = 1,
+    include: Any = None,
+    exclude: Any = None,
+    max_entries: int = 500,
+    cursor: Optional[str] = None,
+) -> str:
+    """List a directory tree with os.scandir, in sorted depth-first order.
+
+    include patterns filter which files are shown, exclude patterns hide
+    files and prune whole directories. At most max_entries lines are
+    returned; pass the reported cursor back to continue after the last one.
+    """
+    if not os.path.exists(path):
+        return f"Path not found: {path}"
+
+    depth = max(int(depth), 1)
+    max_entries = max(int(max_entries), 1)
+    include_patterns = _as_patterns(include)
+    exclude_patterns = _as_patterns(exclude)
+    # Sorted depth-first order is the order of relative paths compared
+    # component by component, so the cursor can prune whole subtrees
+    after = tuple(cursor.split("/")) if cursor else None
+
+    items: List[str] = []
+    last: Optional[str] = None
+    truncated = False
+
+    def walk(directory: str, prefix: tuple, level: int) -> bool:
+        nonlocal last, truncated
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            parts = prefix + (entry.name,)
+            rel = "/".join(parts)
+            is_dir = entry.is_dir()
+            if exclude_patterns and _matches(entry.name, rel, exclude_patterns):
+                continue
+            if after is not None and parts <= after and after[:len(parts)] != parts:
+                continue  # Subtree entirely before the cursor
+            if after is None or parts > after:
+                if is_dir and not include_patterns:
+                    line = f"[DIR]  {rel}/"
+                elif not is_dir and (not include_patterns or _matches(entry.name, rel, include_patterns)):
+                    line = f"[FILE] {rel}"
+                else:
+                    line = None
+                if line is not None:
+                    if len(items) == max_entries:
+                        truncated = True
+                        return False
+                    items.append(line)
+                    last = rel
+            if is_dir and level < depth and not entry.is_symlink():
+                if not walk(entry.path, parts, level + 1):
+                    return False
+        return True
+
+    walk(path, (), 1)
+
+    if not items:
+        if cursor:
+            return f"No more entries in {path}"
+        return f"Empty directory: {path}"
+
+    result = f"Contents of {path}:\n" + "\n".join(items)
+    if truncated:
+        result += f"\nMore entries available; call list_files again with cursor=\"{last}\""
+    return result
+
+
+# Directories never worth indexing or searching
+SKIP_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox"}
+# Files larger than this are left out of the search index
+SEARCH_MAX_FILE_BYTES = 1024 * 1024
+
+
+def _gitignore_patterns(root: str) -> List[tuple]:
+    """(pattern, anchored, directory only) for each rule of root's .gitignore.
+
+    A subset of gitignore: negated rules are skipped and nested .gitignore
+    files are not read.
+    """
+    try:
+        with open(os.path.join(root, ".gitignore"), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    patterns = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", "!")):
+            continue
+        directory_only = line.endswith("/")
+        line = line.rstrip("/")
+        # A slash anywhere but the end anchors the rule to the root
+        patterns.append((line.lstrip("/"), "/" in line, directory_only))
+    return patterns
+
+
+def _gitignored(rel: str, is_dir: bool, patterns: List[tuple]) -> bool:
+    """Whether a root-relative, slash-separated path or a parent is ignored."""
+    parts = rel.split("/")
+    for i, part in enumerate(parts):
+        prefix = "/".join(parts[:i + 1])
+        part_is_dir = is_dir or i < len(parts) - 1
+        for pattern, anchored, directory_only in patterns:
+            if directory_only and not part_is_dir:
+                continue
+            if fnmatch.fnmatch(prefix if anchored else part, pattern):
+                return True
+    return False
+
+_REGEX_META = set(".^$*+?{}[]()|\\")
+# Hex digits following \x, \u and \U
+_ESCAPE_DIGITS = {"x": 2, "u": 4, "U": 8}
+
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _required_literals(pattern: str) -> List[str]:
+    """Literal runs every match of a regex must contain.
+
+    Conservative: any alternation or group means nothing is required, since
+    a group may be optional, repeated or not capture text at all.
+    """
+    if "|" in pattern:
+        return []
+    runs: List[str] = []
+    current: List[str] = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+            if escaped.isalnum():
+                literal = None  # \w, \d, \b and friends
+                # Skip the payload of escapes that spell out a character
+                if escaped in _ESCAPE_DIGITS:
+                    i += _ESCAPE_DIGITS[escaped]
+                elif escaped == "N":
+                    end = pattern.find("}", i)
+                    i = len(pattern) if end == -1 else end + 1
+                elif escaped.isdigit():
+                    while i < len(pattern) and pattern[i].isdigit():
+                        i += 1
+            else:
+                literal = escaped
+        elif char == "(":
+            return []
+        elif char == "[":
+            # Skip the class: a leading ^ or ] is part of it, as is any \x pair
+            i += 1
+            if i < len(pattern) and pattern[i] == "^":
+                i += 1
+            if i < len(pattern) and pattern[i] == "]":
+                i += 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+            literal = None
+        elif char in _REGEX_META:
+            if char in "*?{" and current:
+                current.pop()  # The previous character is optional
+            i += 1
+            literal = None
+            if char == "{":
+                end = pattern.find("}", i)
+                i = len(pattern) if end == -1 else end + 1
+        else:
+            literal = char
+            i += 1
+        if literal is None:
+            runs.append("".join(current))
+            current = []
+        else:
+            current.append(literal)
+    runs.append("".join(current))
+    return [run for run in runs if len(run) >= 3]
+
+
+class TrigramIndex:
+    """In-memory trigram index over the text files of a workspace.
+
+    Every file's lowercased trigrams are posted to a set of file ids. A
+    query only opens the files containing all trigrams of its required
+    literals, then confirms matches line by line. Files matched by the
+    workspace's .gitignore and the agent's own output files are left out.
+    """
+
+    def __init__(self, root: str = "."):
+        self.root = os.path.abspath(root)
+        self.built = False
+        self._paths: List[Optional[str]] = []
+        self._ids: Dict[str, int] = {}
+        self._file_trigrams: Dict[int, set] = {}
+        self._postings: Dict[str, set] = {}
+        self._gitignore: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def _ignored(self, path: str, is_dir: bool = False) -> bool:
+        if is_output_file(path):
+            return True
+        rel = os.path.relpath(path, self.root)
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            # Outside the workspace, e.g. an edit_file to /tmp
+            return any(part in SKIP_DIRS for part in path.split(os.sep))
+        rel = rel.replace(os.sep, "/")
+        return any(part in SKIP_DIRS for part in rel.split("/")) or _gitignored(rel, is_dir, self._gitignore)
+
+    def build(self) -> None:
+        with self._lock:
+            if self.built:
+                return
+            self._gitignore = _gitignore_patterns(self.root)
+            for directory, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = sorted(d for d in dirnames if not self._ignored(os.path.join(directory, d), True))
+                for filename in sorted(filenames):
+                    path = os.path.join(directory, filename)
+                    if not self._ignored(path):
+                        self._add(path)
+            self.built = True
+            logging.info("Search index built: %d files, %d trigrams", len(self._ids), len(self._postings))
+
+    def _load(self, path: str) -> Optional[str]:
+        try:
+            if os.path.getsize(path) > SEARCH_MAX_FILE_BYTES:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if b"\0" in data[:8192]:
+            return None  # Binary file
+        return data.decode("utf-8", errors="replace")
+
+    def _add(self, path: str) -> None:
+        text = self._load(path)
+        if text is None:
+            return
+        file_id = len(self._paths)
+        self._paths.append(path)
+        self._ids[path] = file_id
+        trigrams = _trigrams(text.lower())
+        self._file_trigrams[file_id] = trigrams
+        for trigram in trigrams:
+            self._postings.setdefault(trigram, set()).add(file_id)
+
+    def _remove(self, path: str) -> None:
+        file_id = self._ids.pop(path, None)
+        if file_id is None:
+            return
+        self._paths[file_id] = None
+        for trigram in self._file_trigrams.pop(file_id):
+            postings = self._postings[trigram]
+            postings.discard(file_id)
+            if not postings:
+                del self._postings[trigram]
+
+    def update_file(self, path: str) -> None:
+        """Re-index one file after it was created, changed or deleted."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if not self.built:
+                return
+            self._remove(path)
+            if not self._ignored(path) and os.path.isfile(path):
+                self._add(path)
+
+    def search(
+        self,
+        query: str,
+        regex: bool = False,
+        case_sensitive: bool = False,
+        path: Optional[str] = None,
+        max_results: int = 50,
+    ) -> List[str]:
+        self.build()
+        flags = 0 if case_sensitive else re.IGNORECASE
+        matcher = re.compile(query if regex else re.escape(query), flags)
+        literals = _required_literals(query) if regex else [query]
+
+        with self._lock:
+            candidates: Optional[set] = None
+            for literal in literals:
+                for trigram in _trigrams(literal.lower()):
+                    postings = self._postings.get(trigram, set())
+                    candidates = set(postings) if candidates is None else candidates & postings
+            if candidates is None:
+                candidates = set(self._ids.values())
+            paths = sorted(self._paths[i] for i in candidates)
+
+        prefix = os.path.abspath(path) if path else None
+        results: List[str] = []
+        for file_path in paths:
+            if prefix and not (file_path == prefix or file_path.startswith(prefix + os.sep)):
+                continue
+            text = self._load(file_path)
+            if text is None:
+                continue
+            rel = os.path.relpath(file_path)
+            for number, line in enumerate(text.splitlines(), 1):
+                if matcher.search(line):
+                    results.append(f"{rel}:{number}: {line.strip()[:200]}")
+                    if len(results) >= max_results:
+                        return results
+        return results
+
+
+class WorkspaceWatcher:
+    """Background thread keeping a stat snapshot of a workspace current.
+
+    Uses inotify on Linux and falls back to polling with os.scandir
+    elsewhere. Every created, modified or deleted file is passed to the
+    registered callbacks so caches and indexes can update just that path.
+    """
+
+    _IN_MODIFY = 0x2
+    _IN_ATTRIB = 0x4
+    _IN_CLOSE_WRITE = 0x8
+    _IN_MOVED_FROM = 0x40
+    _IN_MOVED_TO = 0x80
+    _IN_CREATE = 0x100
+    _IN_DELETE = 0x200
+    _IN_Q_OVERFLOW = 0x4000
+    _IN_ISDIR = 0x40000000
+    _WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+    def __init__(self, root: str = ".", interval: float = 1.0, use_inotify: bool = True):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.backend: Optional[str] = None
+        self._callbacks: List[Any] = []
+        self._snapshot: Dict[str, tuple] = {}
+        self._baseline: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify_fd: Optional[int] = None
+        self._watches: Dict[int, str] = {}
+
+    def subscribe(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._snapshot = self._scan(self.root)
+        self._baseline = dict(self._snapshot)
+        if self.use_inotify and self._start_inotify():
+            self.backend = "inotify"
+            target = self._run_inotify
+        else:
+            self.backend = "polling"
+            target = self._run_polling
+        self._thread = threading.Thread(target=target, name="workspace-watcher", daemon=True)
+        self._thread.start()
+        logging.info("Watching %s with %s (%d files)", self.root, self.backend, len(self._snapshot))
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def changed_since_start(self) -> Dict[str, str]:
+        """Map of path to "added", "modified" or "deleted" since start()."""
+        with self._lock:
+            snapshot = dict(self._snapshot)
+        changes = {}
+        for path, signature in snapshot.items():
+            before = self._baseline.get(path)
+            if before is None:
+                changes[path] = "added"
+            elif before != signature:
+                changes[path] = "modified"
+        for path in self._baseline.keys() - snapshot.keys():
+            changes[path] = "deleted"
+        return changes
+
+    def _scan(self, directory: str) -> Dict[str, tuple]:
+        snapshot: Dict[str, tuple] = {}
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in SKIP_DIRS:
+                                stack.append(entry.path)
+                        elif entry.is_file():
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            except OSError:
+                continue
+        return snapshot
+
+    def _apply(self, changes: Dict[str, Optional[tuple]]) -> None:
+        """Record new signatures (None for deleted) and notify subscribers."""
+        changed = []
+        with self._lock:
+            for path, signature in changes.items():
+                if self._snapshot.get(path) == signature:
+                    continue
+                if signature is None:
+                    self._snapshot.pop(path, None)
+                else:
+                    self._snapshot[path] = signature
+                changed.append(path)
+        for path in changed:
+            for callback in self._callbacks:
+                try:
+                    callback(path)
+                except Exception as e:
+                    logging.error("Watcher callback failed for %s: %s", path, e)
+
+    def _rescan(self, directory: str) -> None:
+        """Diff everything under directory against the snapshot."""
+        current = self._scan(directory)
+        prefix = directory + os.sep
+        with self._lock:
+            known = {p for p in self._snapshot if p.startswith(prefix)}
+        changes: Dict[str, Optional[tuple]] = dict(current)
+        for path in known - current.keys():
+            changes[path] = None
+        self._apply(changes)
+
+    def _run_polling(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._rescan(self.root)
+
+    def _start_inotify(self) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self._add_watch_fn = libc.inotify_add_watch
+            self._add_watch_fn.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+        self._inotify_fd = fd
+        self._add_watches(self.root)
+        return True
+
+    def _add_watches(self, directory: str) -> None:
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = self._add_watch_fn(self._inotify_fd, os.fsencode(current), self._WATCH_MASK)
+            if wd >= 0:
+                self._watches[wd] = current
+            try:
+                with os.scandir(current) as it:
+                    stack.extend(
+                        entry.path for entry in it
+                        if entry.is_dir(follow_symlinks=False) and entry.name not in SKIP_DIRS
+                    )
+            except OSError:
+                continue
+
+    def _run_inotify(self) -> None:
+        import select
+        import struct
+
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._inotify_fd], [], [], self.interval)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._inotify_fd, 64 * 1024)
+            except (BlockingIOError, OSError):
+                continue
+            changes: Dict[str, Optional[tuple]] = {}
+            rescans = set()
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+                offset += 16 + length
+                if mask & self._IN_Q_OVERFLOW:
+                    rescans.add(self.root)
+                    continue
+                directory = self._watches.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, os.fsdecode(name))
+                if mask & self._IN_ISDIR:
+                    if os.path.basename(path) in SKIP_DIRS:
+                        continue
+                    if mask & (self._IN_CREATE | self._IN_MOVED_TO):
+                        self._add_watches(path)
+                    rescans.add(path)
+                    continue
+                try:
+                    stat = os.stat(path)
+                    changes[path] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                except OSError:
+                    changes[path] = None
+            self._apply(changes)
+            for directory in rescans:
+                self._rescan(directory)
+
+
+# Files are edited this many characters at a time
+EDIT_CHUNK_CHARS = 1024 * 1024
+# When edits fsync: "never", "file" (the new file before it replaces the old
+# one) or "full" (also the containing directory, so the rename is durable)
+FSYNC_POLICIES = ("never", "file", "full")
+
+# Read once at import: os.umask can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _replace_stream(src, dst, old_text: str, new_text: str, chunk_chars: int = EDIT_CHUNK_CHARS) -> int:
+    """Copy src to dst replacing every old_text, holding one chunk at a time.
+
+    Matches are found left to right without overlap, like str.replace. The
+    last len(old_text) - 1 characters of each chunk are carried over so a
+    match spanning a chunk boundary is not missed.
+    """
+    count = 0
+    pending = ""
+    while True:
+        chunk = src.read(chunk_chars)
+        # split() finds the same left-to-right, non-overlapping matches as
+        # str.replace, at C speed
+        parts = (pending + chunk).split(old_text)
+        count += len(parts) - 1
+        if not chunk:
+            dst.write(new_text.join(parts))
+            return count
+        last = parts.pop()
+        if parts:
+            dst.write(new_text.join(parts))
+            dst.write(new_text)
+        # Carry over a tail that could be the start of a match
+        keep = max(len(last) - len(old_text) + 1, 0)
+        dst.write(last[:keep])
+        pending = last[keep:]
+
+
+def write_temp_copy(path: str, old_text: Optional[str], new_text: str) -> tuple:
+    """Write the edited contents of path to a temporary file beside it.
+
+    With old_text the existing file is streamed through _replace_stream,
+    otherwise the temporary file simply holds new_text. Returns the
+    temporary path and the number of replacements made. A symlink is
+    followed, so the temporary file sits beside the file it will replace.
+    """
+    path = os.path.realpath(path)
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with open(fd, "w", encoding="utf-8", newline="") as dst:
+            if old_text:
+                with open(path, "r", encoding="utf-8", newline="") as src:
+                    count = _replace_stream(src, dst, old_text, new_text)
+            else:
+                dst.write(new_text)
+                count = 0
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        else:
+            # mkstemp creates files readable only by the owner
+            os.chmod(temp_path, 0o666 & ~_UMASK)
+        return temp_path, count
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def commit_temp_copy(temp_path: str, path: str, fsync: str = "never") -> None:
+    """Atomically move a file from write_temp_copy into place.
+
+    If path is a symlink its target is replaced and the link is kept.
+    """
+    path = os.path.realpath(path)
+    if fsync in ("file", "full"):
+        with open(temp_path, "rb") as f:
+            os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    if fsync == "full" and hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def apply_edits(edits: List[Dict[str, Any]], fsync: str = "never") -> str:
+    """Apply a batch of edits to one or more files as a single transaction.
+
+    Edits are grouped by file and applied in order, so each file is read and
+    written once. Every edit is checked before anything is written; if any
+    fails, no file changes. The new files are then moved into place one by
+    one, and if a move fails the files already replaced are restored.
+    Symlinks are followed, so edits through a link change its target.
+    """
+    by_path: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for edit in edits:
+        by_path.setdefault(os.path.realpath(edit["path"]), []).append(edit)
+
+    # Phase 1: compute and validate every file's new contents in memory
+    contents: Dict[str, str] = {}
+    problems: List[str] = []
+    for path, file_edits in by_path.items():
+        content: Optional[str] = None
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                content = f.read()
+        for edit in file_edits:
+            old_text = edit.get("old_text") or ""
+            new_text = edit.get("new_text", "")
+            if not old_text or content is None:
+                content = new_text
+                continue
+            count = content.count(old_text)
+            expected = edit.get("expected_occurrences")
+            if count == 0:
+                problems.append(f"{edit['path']}: text not found: {old_text}")
+            elif expected is not None and count != int(expected):
+                problems.append(f"{edit['path']}: expected {expected} occurrence(s) but found {count}")
+            else:
+                content = content.replace(old_text, new_text)
+        contents[path] = content
+    if problems:
+        return "No files changed; some edits could not be applied:\n" + "\n".join(problems)
+
+    # Phase 2: write every new file beside its original
+    staged: List[tuple] = []
+    try:
+        for path, content in contents.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path, _ = write_temp_copy(path, None, content)
+            staged.append((path, temp_path))
+    except BaseException:
+        for _, temp_path in staged:
+            os.unlink(temp_path)
+        raise
+
+    # Phase 3: swap them in, keeping a hard link to each original for rollback
+    committed: List[tuple] = []
+    try:
+        for path, temp_path in staged:
+            backup = None
+            if os.path.exists(path):
+                backup = f"{temp_path}.orig"
+                os.link(path, backup)
+            commit_temp_copy(temp_path, path, fsync)
+            committed.append((path, backup))
+    except BaseException:
+        for path, backup in reversed(committed):
+            if backup is not None:
+                os.replace(backup, path)
+            else:
+                os.unlink(path)
+        for path, temp_path in staged[len(committed):]:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            if os.path.exists(f"{temp_path}.orig"):
+                os.unlink(f"{temp_path}.orig")
+        raise
+    for _, backup in committed:
+        if backup is not None:
+            os.unlink(backup)
+
+    return f"Successfully applied {len(edits)} edits to {len(contents)} files:\n" + "\n".join(
+        os.path.relpath(path) for path in contents
+    )
+
+
+class ToolResultCache:
+    """LRU cache of read-only tool results, capped by total size in bytes.
+
+    Each entry remembers the (mtime_ns, size, inode) of the path it was
+    computed from and is dropped on lookup if the path has changed since.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._keys_by_path: Dict[str, set] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def get(self, key: tuple, path: str) -> Optional[str]:
+        signature = self.signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and signature is not None and entry[1] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, path: str, signature: Optional[tuple], value: str) -> None:
+        if signature is None:
+            return
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (path, signature, value, size)
+            self._keys_by_path.setdefault(path, set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, path: str) -> None:
+        """Drop entries for path and for listings of its parent directory."""
+        path = os.path.abspath(path)
+        with self._lock:
+            for stale in (path, os.path.dirname(path)):
+                for key in list(self._keys_by_path.get(stale, ())):
+                    self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+            }
+
+    def _remove(self, key: tuple) -> None:
+        path, _, _, size = self._entries.pop(key)
+        self.bytes -= size
+        keys = self._keys_by_path.get(path)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_path[path]
+
+
+class Workspace:
+    """The tool result cache, search index and optional watcher of a directory.
+
+    Agents built one per prompt or per session share a Workspace, so the
+    index is built once and there is a single watcher thread and inotify
+    instance per process.
+    """
+
+    def __init__(self, root: str = ".", watch: bool = False):
+        self.root = os.path.abspath(root)
+        self.tool_cache = ToolResultCache()
+        # Built lazily on the first search_code call
+        self.search_index = TrigramIndex(self.root)
+        self.watcher: Optional[WorkspaceWatcher] = None
+        if watch:
+            self.watcher = WorkspaceWatcher(self.root)
+            self.watcher.subscribe(self.tool_cache.invalidate)
+            self.watcher.subscribe(self.search_index.update_file)
+            self.watcher.start()
+
+    def close(self) -> None:
+        if self.watcher is not None:
+            self.watcher.stop()
+
+
+def to_jsonable(value: Any) -> Any:
+    """Plain JSON data from ollama's pydantic responses, tool calls and dicts."""
+    if hasattr(value, "model_dump"):
+        value = value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {key: to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    return value
+
+
+def request_key(model: str, messages: Any, tools: Any, **options: Any) -> str:
+    """Stable hash of a chat request, independent of dict ordering."""
+    # keep_alive only affects how long the model stays loaded, not the reply
+    options.pop("keep_alive", None)
+    canonical = json.dumps(
+        to_jsonable({"model": model, "messages": messages, "tools": tools, "options": options}),
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CassetteClient:
+    """Records Ollama chat exchanges to a JSONL cassette and replays them.
+
+    Wraps a client with the same chat() signature. In "record" mode the
+    cassette is emptied on open, then every request goes to the wrapped
+    client and the response is appended to it; "append" records without
+    emptying it first, for several agents sharing one cassette. In "replay"
+    mode responses are served from the cassette, after an optional injected
+    latency, and an unknown request raises LookupError. "auto" replays what
+    it has and records the rest. Identical requests are replayed in the
+    order they were recorded.
+    """
+
+    MODES = ("record", "append", "replay", "auto")
+    RECORDING_MODES = ("record", "append")
+
+    def __init__(self, inner: Any, path: str, mode: str = "replay", latency: float = 0.0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.inner = inner
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        add_output_file(path)
+        self._lock = threading.Lock()
+        self._recorded: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        if mode == "record":
+            # Re-recording must not leave stale answers to be replayed first
+            open(path, "w", encoding="utf-8").close()
+        elif mode != "append" and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._recorded.setdefault(entry["key"], []).append(entry)
+
+    def __getattr__(self, name: str) -> Any:
+        # Anything other than chat() goes straight to the wrapped client
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries = self._recorded.get(key)
+            if not entries:
+                return None
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    def _store(self, key: str, request: Dict[str, Any], **payload: Any) -> None:
+        entry = {"key": key, "request": to_jsonable(request), **to_jsonable(payload)}
+        with self._lock:
+            self._recorded.setdefault(key, []).append(entry)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def chat(self, model: str = "", messages: Any = None, tools: Any = None, stream: bool = False, **options: Any) -> Any:
+        key = request_key(model, messages, tools, stream=stream, **options)
+        entry = self._lookup(key) if self.mode not in self.RECORDING_MODES else None
+        if entry is not None:
+            if stream:
+                return self._replay_stream(entry["chunks"])
+            if self.latency:
+                time.sleep(self.latency)
+            return entry["response"]
+        if self.mode == "replay":
+            raise LookupError(f"No recorded response for request {key[:12]} in {self.path}")
+
+        request = {"model": model, "messages": messages, "tools": tools, "stream": stream, **options}
+        response = self.inner.chat(model=model, messages=messages, tools=tools, stream=stream, **options)
+        if stream:
+            return self._record_stream(key, request, response)
+        self._store(key, request, response=response)
+        return to_jsonable(response)
+
+    def _replay_stream(self, chunks: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / max(len(chunks), 1))
+            yield chunk
+
+    def _record_stream(self, key: str, request: Dict[str, Any], stream: Any) -> Iterator[Dict[str, Any]]:
+        chunks = []
+        for chunk in stream:
+            chunk = to_jsonable(chunk)
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, request, chunks=chunks)
+
+
+class AsyncCassetteClient(CassetteClient):
+    """CassetteClient for AsyncAIAgent, wrapping an ollama.AsyncClient."""
+
+    async def chat(self, model: str = "", messages: Any = None, tools: Any = None, stream: bool = False, **options: Any) -> Any:
+        key = request_key(model, messages, tools, stream=stream, **options)
+        entry = self._lookup(key) if self.mode not in self.RECORDING_MODES else None
+        if entry is not None:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if stream:
+                return self._replay_stream_async(entry["chunks"])
+            return entry["response"]
+        if self.mode == "replay":
+            raise LookupError(f"No recorded response for request {key[:12]} in {self.path}")
+
+        request = {"model": model, "messages": messages, "tools": tools, "stream": stream, **options}
+        response = await self.inner.chat(model=model, messages=messages, tools=tools, stream=stream, **options)
+        if stream:
+            return self._record_stream_async(key, request, response)
+        self._store(key, request, response=response)
+        return to_jsonable(response)
+
+    async def _replay_stream_async(self, chunks: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        for chunk in chunks:
+            yield chunk
+
+    async def _record_stream_async(self, key: str, request: Dict[str, Any], stream: Any) -> AsyncIterator[Dict[str, Any]]:
+        chunks = []
+        async for chunk in stream:
+            chunk = to_jsonable(chunk)
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, request, chunks=chunks)
+
+
+# Timing fields Ollama reports with each response, in nanoseconds or tokens
+SERVER_TIMING_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _running_loop() -> Any:
+    # No loop can be running before asyncio is imported; don't import it here
+    if "asyncio" not in sys.modules:
+        return None
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_span_id", "start", "end", "attributes", "error")
+
+    def __init__(self, name: str, kind: int, trace_id: str, parent_span_id: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    @staticmethod
+    def _value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """The span in the OTLP/JSON span encoding."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [
+                {"key": key, "value": self._value(value)}
+                for key, value in self.attributes.items()
+                if value is not None
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+class _NullSpan:
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Writes timing spans as JSONL in the OTLP/JSON span shape.
+
+    Spans nest through a context variable, so tool spans run in worker
+    threads or asyncio.to_thread still find their parent turn. With no path
+    every span is a shared no-op object. Generators must not hold the
+    context variable across a yield, where their caller's code runs: they
+    open detached_span()s and activate() them only between yields.
+    """
+
+    KIND_INTERNAL = 1
+    KIND_CLIENT = 3
+
+    def __init__(self, path: Optional[str] = None, service_name: str = "single-file-ai-agent"):
+        self.path = path
+        if path is not None:
+            add_output_file(path)
+        self.resource = {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def current() -> Any:
+        return _current_span.get() or _NULL_SPAN
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Any]:
+        """A span that is the current span, and so the parent of new ones, while open."""
+        with self.detached_span(name, kind, **attributes) as span:
+            with self.activate(span):
+                yield span
+
+    @contextlib.contextmanager
+    def detached_span(
+        self, name: str, kind: int = KIND_INTERNAL, parent: Optional[Span] = None, **attributes: Any
+    ) -> Iterator[Any]:
+        """A span that is not made current; parent defaults to the current span."""
+        if self.path is None:
+            yield _NULL_SPAN
+            return
+        if parent is None:
+            parent = _current_span.get()
+        span = Span(
+            name,
+            kind,
+            parent.trace_id if parent else os.urandom(16).hex(),
+            parent.span_id if parent else "",
+            attributes,
+        )
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)
+            raise
+        finally:
+            span.end = time.time_ns()
+            self._export(span)
+
+    @contextlib.contextmanager
+    def activate(self, span: Any) -> Iterator[None]:
+        """Make span the current span for a block that does not yield."""
+        if span is _NULL_SPAN:
+            yield
+            return
+        token = _current_span.set(span)
+        try:
+            yield
+        finally:
+            _current_span.reset(token)
+
+    def _export(self, span: Span) -> None:
+        line = json.dumps({"resource": self.resource, **span.to_otlp()})
+        loop = _running_loop()
+        if loop is not None:
+            # Keep the file append off the event loop thread
+            loop.run_in_executor(None, self._write, line)
+        else:
+            self._write(line)
+
+    def _write(self, line: str) -> None:
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+def default_session_path() -> str:
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(data_home, "single-file-ai-agent", "sessions.db")
+
+
+class SessionStore:
+    """Append-only conversation store in a single SQLite file.
+
+    Every message is one row keyed by (session, sequence number), so saving
+    a turn inserts only that turn's messages and resuming is one indexed
+    query. Rows can be zstd-compressed when a zstd module is available.
+    """
+
+    def __init__(self, path: Optional[str] = None, compress: bool = False):
+        self.path = path or default_session_path()
+        if compress and _zstd is None:
+            raise RuntimeError("Session compression needs zstd: pip install zstandard")
+        self.compress = compress
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                model TEXT,
+                created REAL,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def create(self, model: str) -> str:
+        session_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO sessions (id, model, created, updated) VALUES (?, ?, ?, ?)",
+                (session_id, model, now, now),
+            )
+        return session_id
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def append(self, session_id: str, first_seq: int, messages: List[Dict[str, Any]]) -> None:
+        """Store messages as sequence numbers first_seq, first_seq + 1, ..."""
+        rows = []
+        for seq, message in enumerate(messages, first_seq):
+            data = json.dumps(to_jsonable(message), separators=(",", ":"), default=str).encode("utf-8")
+            if self.compress:
+                rows.append((session_id, seq, "zstd", _zstd_compress(data)))
+            else:
+                rows.append((session_id, seq, "json", data))
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO messages (session_id, seq, codec, data) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.execute("UPDATE sessions SET updated = ? WHERE id = ?", (time.time(), session_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def load(self, session_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT codec, data FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        messages = []
+        for codec, data in rows:
+            if codec == "zstd":
+                if _zstd is None:
+                    raise RuntimeError("This session is zstd-compressed: pip install zstandard")
+                data = _zstd_decompress(data)
+            messages.append(json.loads(data))
+        return messages
+
+    def sessions(self) -> List[tuple]:
+        """(id, model, updated) of every session, most recent first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, model, updated FROM sessions ORDER BY updated DESC"
+            ).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def default_cache_dir() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "single-file-ai-agent", "responses")
+
+
+def _tool_call_paths(messages: Any) -> List[str]:
+    """Paths named by the tool calls in a message list."""
+    paths = set()
+    for message in messages or []:
+        for tool_call in message.get("tool_calls") or []:
+            arguments = tool_call.get("function", {}).get("arguments") or {}
+            if arguments.get("path"):
+                paths.add(os.path.abspath(arguments["path"]))
+            for edit in arguments.get("edits") or []:
+                if isinstance(edit, dict) and edit.get("path"):
+                    paths.add(os.path.abspath(edit["path"]))
+    return sorted(paths)
+
+
+class ResponseCache:
+    """On-disk cache of model responses, one JSON file per request hash.
+
+    Each entry records the stat signature of every file the conversation's
+    tool calls touched; if any of them has changed, the entry is ignored.
+    Entries older than max_age seconds are dropped, and the oldest entries
+    are evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_age: float = 7 * 24 * 3600,
+    ):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._sizes: Dict[str, int] = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    self._sizes[entry.path] = entry.stat().st_size
+        self.bytes = sum(self._sizes.values())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        fresh = time.time() - entry["created"] <= self.max_age
+        unchanged = all(
+            ToolResultCache.signature(dep) == (tuple(signature) if signature else None)
+            for dep, signature in entry["deps"].items()
+        )
+        with self._lock:
+            if fresh and unchanged:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            if not fresh:
+                self._remove(path)
+        return None
+
+    def put(self, key: str, messages: Any, **payload: Any) -> None:
+        entry = {
+            "key": key,
+            "created": time.time(),
+            "deps": {path: ToolResultCache.signature(path) for path in _tool_call_paths(messages)},
+            **to_jsonable(payload),
+        }
+        data = json.dumps(entry, default=str)
+        path = self._path(key)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.bytes += len(data) - self._sizes.get(path, 0)
+            self._sizes[path] = len(data)
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently written entries until under max_bytes."""
+        def written(path: str) -> float:
+            try:
+                return os.stat(path).st_mtime
+            except OSError:
+                return 0.0
+
+        for path in sorted(self._sizes, key=written):
+            if self.bytes <= self.max_bytes * 0.9:
+                break
+            self._remove(path)
+
+    def _remove(self, path: str) -> None:
+        self.bytes -= self._sizes.pop(path, 0)
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class CachingClient:
+    """Answers chat requests from a ResponseCache, asking the wrapped client on a miss."""
+
+    def __init__(self, inner: Any, cache: ResponseCache):
+        self.inner = inner
+        self.cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def chat(self, model: str = "", messages: Any = None, tools: Any = None, stream: bool = False, **options: Any) -> Any:
+        key = request_key(model, messages, tools, stream=stream, **options)
+        entry = self.cache.get(key)
+        if entry is not None:
+            return iter(entry["chunks"]) if stream else entry["response"]
+
+        response = self.inner.chat(model=model, messages=messages, tools=tools, stream=stream, **options)
+        if stream:
+            return self._store_stream(key, messages, response)
+        self.cache.put(key, messages, response=response)
+        return to_jsonable(response)
+
+    def _store_stream(self, key: str, messages: Any, stream: Any) -> Iterator[Dict[str, Any]]:
+        chunks = []
+        for chunk in stream:
+            chunk = to_jsonable(chunk)
+            chunks.append(chunk)
+            yield chunk
+        self.cache.put(key, messages, chunks=chunks)
+
+
+class AsyncCachingClient(CachingClient):
+    """CachingClient for AsyncAIAgent."""
+
+    async def chat(self, model: str = "", messages: Any = None, tools: Any = None, stream: bool = False, **options: Any) -> Any:
+        key = request_key(model, messages, tools, stream=stream, **options)
+        entry = await asyncio.to_thread(self.cache.get, key)
+        if entry is not None:
+            return self._replay_async(entry["chunks"]) if stream else entry["response"]
+
+        response = await self.inner.chat(model=model, messages=messages, tools=tools, stream=stream, **options)
+        if stream:
+            return self._store_stream_async(key, messages, response)
+        await asyncio.to_thread(self.cache.put, key, messages, response=response)
+        return to_jsonable(response)
+
+    async def _replay_async(self, chunks: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        for chunk in chunks:
+            yield chunk
+
+    async def _store_stream_async(self, key: str, messages: Any, stream: Any) -> AsyncIterator[Dict[str, Any]]:
+        chunks = []
+        async for chunk in stream:
+            chunk = to_jsonable(chunk)
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(self.cache.put, key, messages, chunks=chunks)
+
+
+POOL_MAX_CONNECTIONS = 10
+POOL_KEEPALIVE_EXPIRY = 30.0  # seconds an idle connection is kept open
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT: Optional[float] = None  # model replies can take minutes
+
+
+class PoolStats:
+    """Request and connection counters of one pooled transport."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def begin(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def connected(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+
+class _RequestTrace:
+    """httpcore trace callback for one request.
+
+    Counts the TCP connection it opens, if any, and ends the request once
+    its response is closed, since a streamed body keeps the connection busy.
+    """
+
+    def __init__(self, stats: PoolStats):
+        self.stats = stats
+        self.finished = False
+
+    def __call__(self, event: str, info: Dict[str, Any]) -> None:
+        # Requests that never open a connection reused one from the pool
+        if event == "connection.connect_tcp.complete":
+            self.stats.connected()
+        elif event.endswith("response_closed.started"):
+            self.finish()
+
+    async def acall(self, event: str, info: Dict[str, Any]) -> None:
+        self(event, info)
+
+    def finish(self) -> None:
+        if not self.finished:
+            self.finished = True
+            self.stats.end()
+
+
+class PooledTransport:
+    """Counts requests and connections of an httpx connection pool.
+
+    Wraps an httpx transport rather than subclassing it, so httpx is only
+    imported once the first client is built.
+    """
+
+    def __init__(self, limits: Any, asynchronous: bool = False):
+        transport_class = httpx.AsyncHTTPTransport if asynchronous else httpx.HTTPTransport
+        self._inner = transport_class(limits=limits)
+        self.stats = PoolStats()
+
+    @property
+    def connections(self) -> List[Any]:
+        return self._inner._pool.connections
+
+    def handle_request(self, request: Any) -> Any:
+        trace = _RequestTrace(self.stats)
+        request.extensions["trace"] = trace
+        self.stats.begin()
+        try:
+            return self._inner.handle_request(request)
+        except Exception:
+            trace.finish()
+            raise
+
+    async def handle_async_request(self, request: Any) -> Any:
+        trace = _RequestTrace(self.stats)
+        request.extensions["trace"] = trace.acall
+        self.stats.begin()
+        try:
+            return await self._inner.handle_async_request(request)
+        except Exception:
+            trace.finish()
+            raise
+
+    def close(self) -> None:
+        self._inner.close()
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+    def __enter__(self) -> "PooledTransport":
+        self._inner.__enter__()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._inner.__exit__(*exc_info)
+
+    async def __aenter__(self) -> "PooledTransport":
+        await self._inner.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self._inner.__aexit__(*exc_info)
+
+
+class ClientFactory:
+    """Process-wide source of Ollama clients that share connections per host.
+
+    Every client for the same host is built on one pooled transport, so
+    agents created in the same process reuse keep-alive connections instead
+    of each opening their own. Async transports are also keyed by event
+    loop, since their connections cannot move between loops, and are
+    dropped once their loop has closed.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: Optional[float] = READ_TIMEOUT,
+    ):
+        self._lock = threading.Lock()
+        self._transports: Dict[Any, Any] = {}
+        # One router per server list, so every agent sees the same load and health
+        self._routers: Dict[Any, Any] = {}
+        self.configure(max_connections, keepalive_expiry, connect_timeout, read_timeout)
+
+    def configure(
+        self,
+        max_connections: int = POOL_MAX_CONNECTIONS,
+        keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: Optional[float] = READ_TIMEOUT,
+    ) -> None:
+        """Set the pool limits and timeouts used by clients created from now on."""
+        if max_connections < 1:
+            raise ValueError("The connection pool needs at least one connection")
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+
+    @property
+    def limits(self) -> Any:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> Any:
+        return httpx.Timeout(None, connect=self.connect_timeout, read=self.read_timeout)
+
+    def _prune_closed_loops(self) -> None:
+        # Called with the lock held. The loop object itself is the key, so a
+        # new loop can never inherit the connections of a dead one
+        for key in [key for key in self._transports if key[0] == "async" and key[2] is not None]:
+            if key[2].is_closed():
+                del self._transports[key]
+        for key in [key for key in self._routers if key[0] == "async" and key[2] is not None]:
+            if key[2].is_closed():
+                self._routers.pop(key).close()
+
+    def _transport(self, key: Any, asynchronous: bool) -> PooledTransport:
+        with self._lock:
+            self._prune_closed_loops()
+            transport = self._transports.get(key)
+            if transport is None:
+                transport = PooledTransport(self.limits, asynchronous)
+                self._transports[key] = transport
+            return transport
+
+    def client(self, host: Optional[str] = None) -> Any:
+        transport = self._transport(("sync", host), asynchronous=False)
+        return ollama.Client(host=host, timeout=self.timeout, transport=transport)
+
+    def async_client(self, host: Optional[str] = None) -> Any:
+        transport = self._transport(("async", host, _running_loop()), asynchronous=True)
+        return ollama.AsyncClient(host=host, timeout=self.timeout, transport=transport)
+
+    def _router(self, key: Any, build: Any) -> Any:
+        with self._lock:
+            self._prune_closed_loops()
+            router = self._routers.get(key)
+        if router is not None:
+            return router
+        # Built outside the lock: building clients takes it too
+        router = build()
+        with self._lock:
+            shared = self._routers.setdefault(key, router)
+        if shared is not router:
+            router.close()
+        return shared
+
+    def router(self, hosts: List[str]) -> "RoutingClient":
+        """The process-wide RoutingClient for this list of servers."""
+        return self._router(("sync", tuple(hosts)), lambda: RoutingClient(hosts, make_client=self.client))
+
+    def async_router(self, hosts: List[str]) -> "AsyncRoutingClient":
+        key = ("async", tuple(hosts), _running_loop())
+        return self._router(key, lambda: AsyncRoutingClient(hosts, make_client=self.async_client))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Utilisation and connection reuse of every pool, one entry per host."""
+        with self._lock:
+            self._prune_closed_loops()
+            items = list(self._transports.items())
+        result = []
+        for key, transport in items:
+            stats = transport.stats
+            connections = transport.connections
+            result.append({
+                "host": key[1] or "default",
+                "async": key[0] == "async",
+                "requests": stats.requests,
+                "connections_opened": stats.connections,
+                "reused": max(stats.requests - stats.connections, 0),
+                "reuse_ratio": (stats.requests - stats.connections) / stats.requests if stats.requests else 0.0,
+                "in_flight": stats.in_flight,
+                "peak_in_flight": stats.peak_in_flight,
+                "open_connections": len(connections),
+                "idle_connections": sum(1 for connection in connections if connection.is_idle()),
+                "max_connections": self.max_connections,
+                "utilisation": stats.in_flight / self.max_connections,
+            })
+        return result
+
+
+# Shared by every agent in the process; main() applies the CLI settings
+client_factory = ClientFactory()
+
+
+def _log_pool_stats() -> None:
+    for stats in client_factory.stats():
+        logging.info("Connection pool stats: %s", stats)
+
+
+def parse_servers(server: Any) -> List[str]:
+    """Server addresses from a comma-separated string or a list."""
+    if not server:
+        return []
+    if isinstance(server, str):
+        server = server.split(",")
+    return [host.strip() for host in server if host and host.strip()]
+
+
+def _is_node_failure(error: Exception) -> bool:
+    """Errors that mean the node, not the request, is at fault."""
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, OSError, httpx.TransportError))
+
+
+# Marks a stream that ended before its first chunk
+_STREAM_END = object()
+
+
+class ServerNode:
+    __slots__ = ("host", "client", "probe_client", "outstanding", "latency", "healthy", "failures")
+
+    def __init__(self, host: str, client: Any, probe_client: Any):
+        self.host = host
+        self.client = client
+        self.probe_client = probe_client
+        self.outstanding = 0
+        # Exponentially weighted moving average of request latency, in seconds
+        self.latency = 0.0
+        self.healthy = True
+        self.failures = 0
+
+
+class RoutingClient:
+    """Spreads chat requests over several Ollama servers.
+
+    Requests go to the healthy node with the fewest outstanding requests,
+    ties broken by observed latency ("least_outstanding"), or simply to the
+    lowest-latency node ("latency"). A node that fails is marked unhealthy
+    and the request is retried on the next one; a background thread probes
+    every node and brings recovered ones back.
+    """
+
+    STRATEGIES = ("least_outstanding", "latency")
+
+    def __init__(
+        self,
+        hosts: List[str],
+        make_client: Any = None,
+        strategy: str = "least_outstanding",
+        probe_interval: float = 10.0,
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.strategy = strategy
+        self.probe_interval = probe_interval
+        make_client = make_client or client_factory.client
+        self.nodes = [ServerNode(host, make_client(host), ollama.Client(host=host, timeout=2.0)) for host in hosts]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        if probe_interval > 0:
+            self._prober = threading.Thread(target=self._probe_loop, name="ollama-health", daemon=True)
+            self._prober.start()
+
+    def __getattr__(self, name: str) -> Any:
+        # Non-chat calls (list, ps, show...) go to the preferred node
+        if name == "nodes":
+            raise AttributeError(name)
+        return getattr(self._ranked()[0].client, name)
+
+    def _ranked(self) -> List[ServerNode]:
+        """Nodes in the order they should be tried, healthy ones first."""
+        with self._lock:
+            if self.strategy == "latency":
+                key = lambda node: (not node.healthy, node.latency)
+            else:
+                key = lambda node: (not node.healthy, node.outstanding, node.latency)
+            return sorted(self.nodes, key=key)
+
+    def _begin(self, node: ServerNode) -> float:
+        with self._lock:
+            node.outstanding += 1
+        return time.perf_counter()
+
+    def _finish(self, node: ServerNode, started: float, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            node.outstanding -= 1
+            if error is None:
+                elapsed = time.perf_counter() - started
+                node.latency = elapsed if node.latency == 0.0 else 0.8 * node.latency + 0.2 * elapsed
+                node.failures = 0
+            else:
+                node.healthy = False
+                node.failures += 1
+        if error is not None:
+            logging.warning("Ollama server %s failed, failing over: %s", node.host, error)
+
+    def chat(self, **kwargs: Any) -> Any:
+        last_error: Optional[Exception] = None
+        for node in self._ranked():
+            started = self._begin(node)
+            try:
+                response = node.client.chat(**kwargs)
+                if kwargs.get("stream"):
+                    # Streams connect lazily; pulling the first chunk here lets
+                    # a dead node fail over before anything reaches the caller
+                    response = iter(response)
+                    first = next(response, _STREAM_END)
+            except Exception as e:
+                if not _is_node_failure(e):
+                    self._finish(node, started)
+                    raise
+                self._finish(node, started, e)
+                last_error = e
+                continue
+            if kwargs.get("stream"):
+                return self._track_stream(node, started, first, response)
+            self._finish(node, started)
+            return response
+        raise ConnectionError(f"All Ollama servers failed; last error: {last_error}")
+
+    def _track_stream(self, node: ServerNode, started: float, first: Any, stream: Iterator[Any]) -> Iterator[Any]:
+        try:
+            if first is not _STREAM_END:
+                yield first
+                for chunk in stream:
+                    yield chunk
+        except Exception as e:
+            # Tokens were already shown, so a stream cannot move to another node
+            self._finish(node, started, e if _is_node_failure(e) else None)
+            raise
+        self._finish(node, started)
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self.probe_interval):
+            self.probe()
+
+    def probe(self) -> None:
+        """Check every node once and update its health."""
+        for node in self.nodes:
+            try:
+                node.probe_client.ps()
+                healthy = True
+            except Exception:
+                healthy = False
+            with self._lock:
+                if healthy and not node.healthy:
+                    logging.info("Ollama server %s is healthy again", node.host)
+                node.healthy = healthy
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "host": node.host,
+                    "healthy": node.healthy,
+                    "outstanding": node.outstanding,
+                    "latency": node.latency,
+                    "failures": node.failures,
+                }
+                for node in self.nodes
+            ]
+
+    def close(self) -> None:
+        self._stop.set()
+
+
+class AsyncRoutingClient(RoutingClient):
+    """RoutingClient over ollama.AsyncClient nodes, for AsyncAIAgent."""
+
+    def __init__(self, hosts: List[str], **kwargs: Any):
+        kwargs.setdefault("make_client", client_factory.async_client)
+        super().__init__(hosts, **kwargs)
+
+    async def chat(self, **kwargs: Any) -> Any:
+        last_error: Optional[Exception] = None
+        for node in self._ranked():
+            started = self._begin(node)
+            try:
+                response = await node.client.chat(**kwargs)
+                if kwargs.get("stream"):
+                    response = aiter(response)
+                    first = await anext(response, _STREAM_END)
+            except Exception as e:
+                if not _is_node_failure(e):
+                    self._finish(node, started)
+                    raise
+                self._finish(node, started, e)
+                last_error = e
+                continue
+            if kwargs.get("stream"):
+                return self._track_stream_async(node, started, first, response)
+            self._finish(node, started)
+            return response
+        raise ConnectionError(f"All Ollama servers failed; last error: {last_error}")
+
+    async def _track_stream_async(
+        self, node: ServerNode, started: float, first: Any, stream: AsyncIterator[Any]
+    ) -> AsyncIterator[Any]:
+        try:
+            if first is not _STREAM_END:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+        except Exception as e:
+            self._finish(node, started, e if _is_node_failure(e) else None)
+            raise
+        self._finish(node, started)
+
+
+def parse_keep_alive(value: Any) -> Any:
+    """Ollama keep_alive from the CLI: seconds as a number, or a duration like "30m"."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _warm_targets(client: Any) -> List[Any]:
+    """The clients to warm: every node of a RoutingClient, else the client itself."""
+    nodes = getattr(client, "nodes", None)
+    if nodes:
+        return [node.client for node in nodes]
+    return [client]
+
+
+class ModelWarmer:
+    """Loads the model on a background thread before the first question.
+
+    Sends an empty generate request, which makes Ollama load the model and
+    leaves a pooled connection open for the first real request. With
+    several servers every node is warmed. keep_alive says how long the
+    server keeps the model in memory once idle; unload() frees it at once.
+    get_client returns the client to warm. It is called on the warm-up
+    thread, since building the first client imports ollama and httpx.
+    """
+
+    def __init__(self, get_client: Any, model: str, keep_alive: Any = None):
+        self.get_client = get_client
+        self.model = model
+        self.keep_alive = keep_alive
+        self.ready = threading.Event()
+        self.load_seconds: Optional[float] = None
+        self.error: Optional[Exception] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def _generate(self, keep_alive: Any) -> None:
+        options = {} if keep_alive is None else {"keep_alive": keep_alive}
+        for target in _warm_targets(self.get_client()):
+            target.generate(model=self.model, **options)
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        try:
+            self._generate(self.keep_alive)
+            self.load_seconds = time.perf_counter() - started
+            logging.info("Model %s warmed up in %.3fs", self.model, self.load_seconds)
+        except Exception as e:
+            self.error = e
+            logging.warning("Warm-up of model %s failed: %s", self.model, e)
+        finally:
+            self.ready.set()
+
+    def start(self) -> "ModelWarmer":
+        self._thread = threading.Thread(target=self._run, name="ollama-warmup", daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.ready.wait(timeout)
+
+    def unload(self) -> None:
+        """Ask the server to drop the model from memory now."""
+        try:
+            self._generate(0)
+            logging.info("Model %s unloaded", self.model)
+        except Exception as e:
+            logging.warning("Unloading model %s failed: %s", self.model, e)
+
+
+@dataclass(frozen=True, slots=True)
+class Tool:
     name: str
     description: str
     input_schema: Dict[str, Any]
 
 
+_JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", dict: "object"}
+
+
+def json_schema(hint: Any) -> Dict[str, Any]:
+    """JSON schema of a type hint; Annotated[T, "text"] becomes a description."""
+    origin, args = get_origin(hint), get_args(hint)
+    if origin is Annotated:
+        schema = json_schema(args[0])
+        descriptions = [meta for meta in args[1:] if isinstance(meta, str)]
+        if descriptions:
+            schema["description"] = descriptions[0]
+        return schema
+    if origin in (Required, NotRequired):
+        return json_schema(args[0])
+    if origin is Union:
+        # Optional[T]: the model leaves the argument out rather than passing null
+        members = [arg for arg in args if arg is not type(None)]
+        return json_schema(members[0]) if len(members) == 1 else {}
+    if origin in (list, List) or hint in (list, List):
+        return {"type": "array", "items": json_schema(args[0])} if args else {"type": "array"}
+    if is_typeddict(hint):
+        fields = get_type_hints(hint, include_extras=True)
+        return {
+            "type": "object",
+            "properties": {name: json_schema(field) for name, field in fields.items()},
+            "required": [name for name in fields if name in hint.__required_keys__],
+        }
+    if origin in (dict, Dict):
+        return {"type": "object"}
+    if hint in _JSON_TYPES:
+        return {"type": _JSON_TYPES[hint]}
+    return {}
+
+
+def _coerce(value: Any, schema: Dict[str, Any]) -> Any:
+    # Small models sometimes send numbers and booleans as strings
+    if isinstance(value, str):
+        if schema.get("type") == "integer":
+            return int(value)
+        if schema.get("type") == "boolean":
+            return value.strip().lower() in ("true", "1", "yes")
+    return value
+
+
+class RegisteredTool:
+    """A tool in a ToolRegistry: its callable, or the file to load it from."""
+
+    __slots__ = ("name", "function", "source", "method", "description", "hints", "required", "_schemas")
+
+    def __init__(
+        self,
+        name: str,
+        function: Any = None,
+        source: Optional[str] = None,
+        method: bool = False,
+        description: str = "",
+        hints: Optional[Dict[str, Any]] = None,
+        required: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.function = function
+        self.source = source
+        self.method = method
+        self.description = description
+        self.hints = hints
+        self.required = required
+        self._schemas: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def schemas(self) -> Dict[str, Dict[str, Any]]:
+        """JSON schema of each parameter, built once from the type hints."""
+        if self._schemas is None:
+            if self.hints is None:
+                self.hints, self.required = _signature_hints(self.function, skip_first=self.method)
+            self._schemas = {name: json_schema(hint) for name, hint in self.hints.items()}
+        return self._schemas
+
+    def tool(self) -> Tool:
+        return Tool(
+            name=self.name,
+            description=self.description,
+            input_schema={"type": "object", "properties": self.schemas(), "required": list(self.required)},
+        )
+
+
+def _signature_hints(function: Any, skip_first: bool = False) -> tuple:
+    """Parameter type hints of a function, in order, and the required names."""
+    code = function.__code__
+    names = code.co_varnames[:code.co_argcount + code.co_kwonlyargcount]
+    if skip_first:
+        names = names[1:]
+    hints = get_type_hints(function, include_extras=True)
+    positional_defaults = len(function.__defaults__ or ())
+    optional = set(code.co_varnames[code.co_argcount - positional_defaults:code.co_argcount])
+    optional |= set(function.__kwdefaults__ or {})
+    return {name: hints.get(name, Any) for name in names}, [name for name in names if name not in optional]
+
+
+# Names a tool module may use in its annotations
+_ANNOTATION_NAMES = {
+    "str": str, "int": int, "float": float, "bool": bool, "list": list, "dict": dict,
+    "List": List, "Dict": Dict, "Any": Any, "Optional": Optional, "Annotated": Annotated,
+}
+
+
+class ToolRegistry:
+    """Maps tool names to their implementations and JSON schemas.
+
+    Agent methods register with the register() decorator; schemas come
+    from their type hints, with Annotated[T, "text"] for parameter
+    descriptions and the docstring as the tool description, and are built
+    once per process. Modules in a tools directory are registered from
+    their source without importing it, and loaded on their first call.
+    """
+
+    def __init__(self):
+        self._tools: Dict[str, RegisteredTool] = {}
+        self._tool_list: Optional[List[Tool]] = None
+        self._directories: List[str] = []
+        # Agents may be built on several threads at once, e.g. by --batch
+        self._lock = threading.RLock()
+
+    def register(self, name: str) -> Any:
+        """Decorator registering an AIAgent method as the tool `name`."""
+
+        def decorator(function: Any) -> Any:
+            description = " ".join((function.__doc__ or "").split())
+            self._add(RegisteredTool(name, function, method=True, description=description))
+            return function
+
+        return decorator
+
+    def _add(self, tool: RegisteredTool) -> None:
+        with self._lock:
+            if tool.name in self._tools:
+                raise ValueError(f"Tool already registered: {tool.name}")
+            self._tools[tool.name] = tool
+            self._tool_list = None
+
+    def add_directory(self, directory: str) -> None:
+        """Register the tool modules in a directory, when schemas are first needed."""
+        with self._lock:
+            self._directories.append(directory)
+            self._tool_list = None
+
+    def _discover(self) -> None:
+        # Called with the lock held
+        while self._directories:
+            directory = self._directories.pop(0)
+            if not os.path.isdir(directory):
+                continue
+            for entry in sorted(os.listdir(directory)):
+                name, extension = os.path.splitext(entry)
+                # Built-in tools win over standalone copies of themselves
+                if extension == ".py" and not name.startswith("_") and name not in self._tools:
+                    path = os.path.join(directory, entry)
+                    try:
+                        tool = _module_tool(name, path)
+                    except (SyntaxError, ValueError, OSError) as e:
+                        # One broken plugin must not stop the agent from starting
+                        logging.warning("Skipping tool module %s: %s", path, e)
+                        continue
+                    if tool is not None:
+                        self._add(tool)
+
+    def tools(self) -> List[Tool]:
+        """Every registered tool with its schema, in registration order."""
+        tool_list = self._tool_list
+        if tool_list is not None and not self._directories:
+            return tool_list
+        with self._lock:
+            if self._tool_list is None or self._directories:
+                self._discover()
+                self._tool_list = [tool.tool() for tool in self._tools.values()]
+            return self._tool_list
+
+    def names(self) -> List[str]:
+        with self._lock:
+            self._discover()
+            return list(self._tools)
+
+    def call(self, agent: Any, name: str, arguments: Dict[str, Any]) -> str:
+        tool = self._tools.get(name)
+        if tool is None:
+            return f"Unknown tool: {name}"
+        schemas = tool.schemas()
+        # Arguments the tool does not declare are dropped, as before
+        kwargs = {key: _coerce(value, schemas[key]) for key, value in arguments.items() if key in schemas}
+        if tool.method:
+            return tool.function(agent, **kwargs)
+        if tool.function is None:
+            # Parallel tool calls must not execute the module twice
+            with self._lock:
+                if tool.function is None:
+                    tool.function = _load_module_function(tool)
+        return tool.function(**kwargs)
+
+
+def _module_tool(name: str, path: str) -> Optional[RegisteredTool]:
+    """Describe the function `name` of a tool module by parsing, not importing, it."""
+    import ast
+
+    with open(path, encoding="utf-8") as f:
+        module = ast.parse(f.read(), path)
+    for node in module.body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            break
+    else:
+        return None
+
+    arguments = node.args
+    params = arguments.args + arguments.kwonlyargs
+    optional = {arg.arg for arg in arguments.args[len(arguments.args) - len(arguments.defaults):]}
+    optional |= {arg.arg for arg, default in zip(arguments.kwonlyargs, arguments.kw_defaults) if default is not None}
+    hints = {}
+    for arg in params:
+        try:
+            hints[arg.arg] = eval(
+                compile(ast.Expression(arg.annotation), path, "eval"), {"__builtins__": {}}, _ANNOTATION_NAMES
+            ) if arg.annotation is not None else Any
+        except Exception:
+            hints[arg.arg] = Any
+    description = " ".join((ast.get_docstring(node) or f"Run {name} from {os.path.basename(path)}").split())
+    return RegisteredTool(
+        name,
+        source=path,
+        description=description,
+        hints=hints,
+        required=[arg.arg for arg in params if arg.arg not in optional],
+    )
+
+
+def _load_module_function(tool: RegisteredTool) -> Any:
+    spec = importlib.util.spec_from_file_location(f"agent_tools.{tool.name}", tool.source)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    logging.info("Loaded tool module %s", tool.source)
+    return getattr(module, tool.name)
+
+
+tool_registry = ToolRegistry()
+# Extra tools: any tools/<name>.py defining a function <name>
+tool_registry.add_directory(os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools"))
+
+
+class FileEdit(TypedDict):
+    path: Annotated[str, "The path to the file to edit"]
+    old_text: NotRequired[Annotated[str, "The text to search for and replace (leave empty to create or overwrite the file)"]]
+    new_text: Annotated[str, "The text to replace old_text with"]
+    expected_occurrences: NotRequired[Annotated[int, "Refuse the batch unless old_text occurs exactly this many times"]]
+
+
 class AIAgent:
-    def __init__(self, model: str = "qwen3:4b", server: str = None):
+    _cassette_class = CassetteClient
+    _caching_class = CachingClient
+
+    def __init__(
+        self,
+        model: str = "qwen3:4b",
+        server: str = None,
+        max_tool_workers: int = 4,
+        context_budget: int = 8192,
+        watch: bool = False,
+        fsync: str = "never",
+        cassette: Optional[str] = None,
+        cassette_mode: str = "replay",
+        cassette_latency: float = 0.0,
+        trace_path: Optional[str] = None,
+        session_store: Optional[SessionStore] = None,
+        session_id: Optional[str] = None,
+        response_cache: Optional[ResponseCache] = None,
+        keep_alive: Any = None,
+        workspace: Optional[Workspace] = None,
+    ):
         self.model = model
         self.server = server
-        
-        # Initialize Ollama client
-        if server:
-            self.client = Client(host=server)
-        else:
-            self.client = Client()  # Uses default local server
-            
+        self.max_tool_workers = max_tool_workers
+        self.fsync = fsync
+        self.keep_alive = keep_alive
+        # Passed with every request so the server applies the same idle timeout
+        self._chat_options: Dict[str, Any] = {} if keep_alive is None else {"keep_alive": keep_alive}
+        self.tracer = Tracer(trace_path)
+        self.context = ContextWindow(context_budget)
+        self._tool_executor: Optional[ThreadPoolExecutor] = None
+        # A shared workspace decides for itself whether it is watched
+        self._owns_workspace = workspace is None
+        self.workspace = workspace or Workspace(os.getcwd(), watch)
+        self.tool_cache = self.workspace.tool_cache
+        self.search_index = self.workspace.search_index
+        self.watcher = self.workspace.watcher
+
+        # The Ollama client is built on first use, see the client property
+        self._client: Any = None
+        self._client_lock = threading.Lock()
+        self._cassette = (cassette, cassette_mode, cassette_latency)
+        self._response_cache = response_cache
+
         self.messages: List[Dict[str, Any]] = []
+        self.session_store = session_store
+        self.session_id = session_id
+        self._saved_messages = 0
+        if session_store is not None:
+            if session_id is not None:
+                if not session_store.exists(session_id):
+                    raise ValueError(f"Unknown session: {session_id}")
+                self.messages = session_store.load(session_id)
+                self._saved_messages = len(self.messages)
+            else:
+                self.session_id = session_store.create(model)
+        elif session_id is not None:
+            raise ValueError(f"Cannot resume session {session_id} without a session store")
         self.tools: List[Tool] = []
+        # Timings of the most recent turn, in seconds, and its token counts
+        self.last_turn_stats: Dict[str, Optional[float]] = {}
+        self._turn_tokens: Dict[str, int] = {"prompt_tokens": 0, "completion_tokens": 0}
+        # Server-reported prompt evaluation figures of the most recent request
+        self.last_prompt_eval: Dict[str, Any] = {}
         self._setup_tools()
 
+        # Built once so every request starts with the same bytes and Ollama
+        # can reuse the KV cache of the system prompt and tool definitions
+        self.system_message = {"role": "system", "content": SYSTEM_PROMPT}
+        self.ollama_tools = self._ollama_tools()
+        self._fixed_tokens = estimate_message_tokens(self.system_message) + estimate_tokens(
+            json.dumps(self.ollama_tools)
+        )
+
+    @property
+    def client(self) -> Any:
+        if self._client is not None:
+            return self._client
+        # The warm-up thread may build the client while the first turn starts
+        with self._client_lock:
+            if self._client is not None:
+                return self._client
+            client = self._create_client()
+            cassette, cassette_mode, cassette_latency = self._cassette
+            if cassette:
+                client = self._cassette_class(client, cassette, cassette_mode, cassette_latency)
+            if self._response_cache is not None:
+                client = self._caching_class(client, self._response_cache)
+            self._client = client
+        return self._client
+
+    @client.setter
+    def client(self, client: Any) -> None:
+        self._client = client
+
+    def warm_up(self) -> ModelWarmer:
+        """Start loading the model in the background."""
+        return ModelWarmer(lambda: self.client, self.model, self.keep_alive).start()
+
+    def unload(self) -> None:
+        """Release the model's memory on the server."""
+        ModelWarmer(lambda: self.client, self.model).unload()
+
+    def close(self) -> None:
+        """Stop background work and store any unsaved messages.
+
+        The client is not closed: its connections and any router belong to
+        client_factory and are shared with the other agents, as is a
+        workspace passed in by the caller.
+        """
+        self._save_session()
+        if self._owns_workspace:
+            self.workspace.close()
+        if self._tool_executor is not None:
+            self._tool_executor.shutdown(wait=False)
+            self._tool_executor = None
+
+    def changes_since_start(self) -> Dict[str, str]:
+        """Files added, modified or deleted since the agent started watching."""
+        if self.watcher is None:
+            return {}
+        return self.watcher.changed_since_start()
+
+    def _create_client(self):
+        servers = parse_servers(self.server)
+        if len(servers) > 1:
+            return client_factory.router(servers)
+        # Uses the default local server when no address is given
+        return client_factory.client(servers[0] if servers else None)
+
     def _setup_tools(self):
-        self.tools = [
-            Tool(
-                name="read_file",
-                description="Read the contents of a file at the specified path",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "path": {
-                            "type": "string",
-                            "description": "The path to the file to read",
-                        }
-                    },
-                    "required": ["path"],
-                },
-            ),
-            Tool(
-                name="list_files",
-                description="List all files and directories in the specified path",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "path": {
-                            "type": "string",
-                            "description": "The directory path to list (defaults to current directory)",
-                        }
-                    },
-                    "required": [],
-                },
-            ),
-            Tool(
-                name="edit_file",
-                description="Edit a file by replacing old_text with new_text. Creates the file if it doesn't exist.",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "path": {
-                            "type": "string",
-                            "description": "The path to the file to edit",
-                        },
-                        "old_text": {
-                            "type": "string",
-                            "description": "The text to search for and replace (leave empty to create new file)",
-                        },
-                        "new_text": {
-                            "type": "string",
-                            "description": "The text to replace old_text with",
-                        },
-                    },
-                    "required": ["path", "new_text"],
-                },
-            ),
-        ]
+        # Shared by every agent; built from the registered tools' type hints
+        self.tools = tool_registry.tools()
+
+    @tool_registry.register("read_file")
+    def _read_file_tool(
+        self,
+        path: Annotated[str, "The path to the file to read"],
+        start_line: Annotated[Optional[int], "First line to read, starting at 1"] = None,
+        end_line: Annotated[Optional[int], "Last line to read (inclusive)"] = None,
+        offset: Annotated[Optional[int], "Byte offset to start reading at"] = None,
+        length: Annotated[Optional[int], "Number of bytes to read from offset"] = None,
+        tail: Annotated[Optional[int], "Read only the last N lines"] = None,
+    ) -> str:
+        """Read the contents of a file at the specified path. For large files, read a range of lines or bytes, or the last lines."""
+        ranges = {"start_line": start_line, "end_line": end_line, "offset": offset, "length": length, "tail": tail}
+        return self._cached_tool("read_file", {"path": path, **ranges}, lambda: self._read_file(path, **ranges))
+
+    @tool_registry.register("list_files")
+    def _list_files_tool(
+        self,
+        path: Annotated[str, "The directory path to list (defaults to current directory)"] = ".",
+        depth: Annotated[Optional[int], "How many directory levels to list (defaults to 1)"] = None,
+        include: Annotated[Optional[List[str]], "Glob patterns of files to show, e.g. *.py"] = None,
+        exclude: Annotated[Optional[List[str]], "Glob patterns of files and directories to skip, e.g. .git"] = None,
+        max_entries: Annotated[Optional[int], "Maximum number of entries to return (defaults to 500)"] = None,
+        cursor: Annotated[Optional[str], "Continue a previous listing after this entry"] = None,
+    ) -> str:
+        """List files and directories in the specified path, optionally recursing into subdirectories"""
+        options = {
+            key: value
+            for key, value in (
+                ("depth", depth), ("include", include), ("exclude", exclude),
+                ("max_entries", max_entries), ("cursor", cursor),
+            )
+            if value is not None
+        }
+
+        def run() -> str:
+            return self._list_files(path, **options)
+
+        # A directory's stat only reflects its own entries, so only
+        # single-level listings can be validated by the cache
+        if (depth or 1) > 1:
+            return run()
+        return self._cached_tool("list_files", {"path": path, **options}, run)
+
+    @tool_registry.register("search_code")
+    def _search_code_tool(
+        self,
+        query: Annotated[str, "The text or regular expression to search for"],
+        regex: Annotated[bool, "Treat query as a regular expression (defaults to false)"] = False,
+        case_sensitive: Annotated[bool, "Match case exactly (defaults to false)"] = False,
+        path: Annotated[Optional[str], "Only search under this directory or file"] = None,
+        max_results: Annotated[Optional[int], "Maximum number of matching lines to return (defaults to 50)"] = None,
+    ) -> str:
+        """Search the text files under the current directory for a literal string or regular expression. Returns matching lines as path:line: text."""
+        return self._search_code(
+            query, regex=regex, case_sensitive=case_sensitive, path=path, max_results=max_results or 50
+        )
+
+    @tool_registry.register("edit_file")
+    def _edit_file_tool(
+        self,
+        path: Annotated[str, "The path to the file to edit"],
+        old_text: Annotated[str, "The text to search for and replace (leave empty to create new file)"] = "",
+        *,
+        new_text: Annotated[str, "The text to replace old_text with"],
+        expected_occurrences: Annotated[Optional[int], "Refuse the edit unless old_text occurs exactly this many times"] = None,
+    ) -> str:
+        """Edit a file by replacing old_text with new_text. Creates the file if it doesn't exist."""
+        return self._edit_file(path, old_text, new_text, expected_occurrences=expected_occurrences)
+
+    @tool_registry.register("apply_edits")
+    def _apply_edits_tool(self, edits: Annotated[List[FileEdit], "The edits to apply, in order"]) -> str:
+        """Apply several edits across one or more files at once. Either every edit is applied or, if any edit fails, no file is changed."""
+        return self._apply_edits(edits)
 
     def _execute_tool(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
-        logging.info(f"Executing tool: {tool_name} with input: {tool_input}")
-        try:
-            if tool_name == "read_file":
-                return self._read_file(tool_input["path"])
-            elif tool_name == "list_files":
-                return self._list_files(tool_input.get("path", "."))
-            elif tool_name == "edit_file":
-                return self._edit_file(
-                    tool_input["path"],
-                    tool_input.get("old_text", ""),
-                    tool_input["new_text"],
-                )
-            else:
-                return f"Unknown tool: {tool_name}"
+        with self.tracer.span("tool.execute", **{"tool.name": tool_name}) as span:
+            result = self._dispatch_tool(tool_name, tool_input)
+            span.set(**{"tool.result_chars": len(result)})
+            return result
+
+    def _dispatch_tool(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
+        logging.info("Executing tool: %s with input: %s", tool_name, LogField(tool_input))
+        try:
+            result = tool_registry.call(self, tool_name, tool_input)
+            # Plugin tools may return anything; the model only reads text
+            return result if isinstance(result, str) else str(result)
         except Exception as e:
-            logging.error(f"Error executing {tool_name}: {str(e)}")
+            logging.error("Error executing %s: %s", tool_name, e)
             return f"Error executing {tool_name}: {str(e)}"
 
-    def _read_file(self, path: str) -> str:
+    def _cached_tool(self, tool_name: str, tool_input: Dict[str, Any], run) -> str:
+        path = os.path.abspath(tool_input.get("path") or ".")
+        key = (tool_name, json.dumps(tool_input, sort_keys=True, default=str))
+        cached = self.tool_cache.get(key, path)
+        if cached is not None:
+            return cached
+        # Stat before running, so a write that races with us makes the entry stale
+        signature = self.tool_cache.signature(path)
+        result = run()
+        self.tool_cache.put(key, path, signature, result)
+        return result
+
+    def _read_file(self, path: str, **ranges: Optional[int]) -> str:
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read()
-            return f"File contents of {path}:\n{content}"
+            return read_file_range(path, **ranges)
         except FileNotFoundError:
             return f"File not found: {path}"
         except Exception as e:
             return f"Error reading file: {str(e)}"
 
-    def _list_files(self, path: str) -> str:
+    def _list_files(self, path: str, **options: Any) -> str:
         try:
-            if not os.path.exists(path):
-                return f"Path not found: {path}"
-
-            items = []
-            for item in sorted(os.listdir(path)):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    items.append(f"[DIR]  {item}/")
-                else:
-                    items.append(f"[FILE] {item}")
-
-            if not items:
-                return f"Empty directory: {path}"
-
-            return f"Contents of {path}:\n" + "\n".join(items)
+            return list_directory(path, **options)
         except Exception as e:
             return f"Error listing files: {str(e)}"
 
-    def _edit_file(self, path: str, old_text: str, new_text: str) -> str:
+    def _search_code(self, query: str, **options: Any) -> str:
         try:
-            if os.path.exists(path) and old_text:
-                with open(path, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-                if old_text not in content:
-                    return f"Text not found in file: {old_text}"
+            matches = self.search_index.search(query, **options)
+        except re.error as e:
+            return f"Invalid regular expression: {str(e)}"
+        except Exception as e:
+            return f"Error searching code: {str(e)}"
+        if not matches:
+            return f"No matches for: {query}"
+        return f"Matches for {query}:\n" + "\n".join(matches)
 
-                content = content.replace(old_text, new_text)
+    def _edit_file(
+        self,
+        path: str,
+        old_text: str,
+        new_text: str,
+        expected_occurrences: Optional[int] = None,
+    ) -> str:
+        try:
+            if os.path.exists(path) and old_text:
+                # Edit a temporary copy, so a crash never leaves a truncated file
+                temp_path, count = write_temp_copy(path, old_text, new_text)
 
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(content)
+                if count == 0 or (expected_occurrences is not None and count != expected_occurrences):
+                    os.unlink(temp_path)
+                    if count == 0:
+                        return f"Text not found in file: {old_text}"
+                    return (
+                        f"Expected {expected_occurrences} occurrence(s) of old_text in {path} "
+                        f"but found {count}; file not changed"
+                    )
 
+                commit_temp_copy(temp_path, path, self.fsync)
                 return f"Successfully edited {path}"
             else:
                 # Only create directory if path contains subdirectories
@@ -172,19 +2843,31 @@ class AIAgent:
                 if dir_name:
                     os.makedirs(dir_name, exist_ok=True)
 
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(new_text)
-
+                temp_path, _ = write_temp_copy(path, None, new_text)
+                commit_temp_copy(temp_path, path, self.fsync)
                 return f"Successfully created {path}"
         except Exception as e:
             return f"Error editing file: {str(e)}"
+        finally:
+            self.tool_cache.invalidate(path)
+            self.search_index.update_file(path)
 
-    def chat(self, user_input: str) -> str:
-        logging.info(f"User input: {user_input}")
-        self.messages.append({"role": "user", "content": user_input})
+    def _apply_edits(self, edits: List[Dict[str, Any]]) -> str:
+        if not edits:
+            return "No edits given"
+        try:
+            return apply_edits(edits, self.fsync)
+        except Exception as e:
+            return f"Error applying edits: {str(e)}"
+        finally:
+            for edit in edits:
+                if edit.get("path"):
+                    self.tool_cache.invalidate(edit["path"])
+                    self.search_index.update_file(edit["path"])
 
+    def _ollama_tools(self) -> List[Dict[str, Any]]:
         # Convert tools to Ollama format
-        ollama_tools = [
+        return [
             {
                 "type": "function",
                 "function": {
@@ -196,59 +2879,844 @@ class AIAgent:
             for tool in self.tools
         ]
 
-        while True:
-            try:
-                # Create system message for Ollama
-                messages_with_system = [
-                    {
-                        "role": "system",
-                        "content": "You are a helpful coding assistant operating in a terminal environment. Output only plain text without markdown formatting, as your responses appear directly in the terminal. Be concise but thorough, providing clear and practical advice with a friendly tone. Don't use any asterisk characters in your responses."
-                    }
-                ] + self.messages
-
-                # Use the client to make the chat request
-                response = self.client.chat(
-                    model=self.model,
-                    messages=messages_with_system,
-                    tools=ollama_tools,
+    @staticmethod
+    def _plan_tool_lanes(calls: List[tuple]) -> List[List[int]]:
+        """Group tool calls into lanes that may run concurrently.
+
+        Calls within a lane run in their original order. Every call touching a
+        path that some edit_file call in the batch writes shares that path's
+        lane; other read-only calls get a lane each, and unknown tools share a
+        single serial lane. A batch containing apply_edits, which may touch any
+        path, runs entirely in order.
+        """
+        if any(name == "apply_edits" for name, _ in calls):
+            return [list(range(len(calls)))]
+
+        def call_path(args: Any) -> str:
+            # The model may send a null, non-string or missing path
+            path = args.get("path") if isinstance(args, dict) else None
+            return os.path.normpath(path) if isinstance(path, str) and path else "."
+
+        edited = {call_path(args) for name, args in calls if name == "edit_file"}
+        lanes: Dict[Any, List[int]] = {}
+        for index, (name, args) in enumerate(calls):
+            path = call_path(args)
+            if name == "edit_file" or (name in READ_ONLY_TOOLS and path in edited):
+                key = ("path", path)
+            elif name in READ_ONLY_TOOLS:
+                key = ("call", index)
+            else:
+                key = ("serial",)
+            lanes.setdefault(key, []).append(index)
+        return list(lanes.values())
+
+    @staticmethod
+    def _tool_call_args(tool_call: Any) -> tuple:
+        function = tool_call.get("function", {})
+        return function.get("name"), function.get("arguments") or {}
+
+    @staticmethod
+    def _tool_result_message(tool_call: Any, result: str) -> Dict[str, Any]:
+        logging.info("Tool result: %s", LogField(result))
+        return {
+            "role": "tool",
+            "content": result,
+            "tool_call_id": tool_call.get("id", "")
+        }
+
+    def _run_tool_call(self, tool_name: str, tool_input: Any) -> str:
+        """Run one tool call, turning any failure into its result.
+
+        Every tool call must be answered by a tool message, or the history
+        is left with a call the model never sees the outcome of.
+        """
+        try:
+            return self._execute_tool(tool_name, tool_input)
+        except Exception as e:
+            logging.error("Error executing %s: %s", tool_name, e)
+            return f"Error executing {tool_name}: {str(e)}"
+
+    def _run_tool_calls(self, tool_calls: List[Any]) -> None:
+        calls = [self._tool_call_args(tool_call) for tool_call in tool_calls]
+        results: List[str] = [""] * len(calls)
+
+        def run_lane(lane: List[int]) -> None:
+            for index in lane:
+                results[index] = self._run_tool_call(*calls[index])
+
+        lanes = self._plan_tool_lanes(calls)
+        if len(lanes) == 1 or self.max_tool_workers <= 1:
+            for lane in lanes:
+                run_lane(lane)
+        else:
+            if self._tool_executor is None:
+                self._tool_executor = ThreadPoolExecutor(
+                    max_workers=self.max_tool_workers,
+                    thread_name_prefix="agent-tool",
                 )
+            # Each lane runs in a copy of our context so its spans nest under this turn
+            context = contextvars.copy_context()
+            # list() waits for every lane and re-raises worker errors
+            list(self._tool_executor.map(lambda lane: context.copy().run(run_lane, lane), lanes))
 
-                # Handle the response
-                message = response.get("message", {})
-                
-                # Add assistant message to conversation
-                self.messages.append({
-                    "role": "assistant",
-                    "content": message.get("content", ""),
-                    "tool_calls": message.get("tool_calls", [])
-                })
-
-                # Check if there are tool calls to execute
-                tool_calls = message.get("tool_calls", [])
-                if tool_calls:
-                    tool_results = []
-                    for tool_call in tool_calls:
-                        function = tool_call.get("function", {})
-                        tool_name = function.get("name")
-                        tool_args = function.get("arguments", {})
-                        
-                        result = self._execute_tool(tool_name, tool_args)
-                        logging.info(f"Tool result: {result[:500]}...")  # Log first 500 chars
-                        
-                        tool_results.append({
-                            "role": "tool",
-                            "content": result,
-                            "tool_call_id": tool_call.get("id", "")
-                        })
-                    
-                    # Add tool results to messages
-                    self.messages.extend(tool_results)
-                else:
-                    # No tool calls, return the response
-                    return message.get("content", "")
+        # Add tool results to messages, in the order the model asked for them
+        self.messages.extend(
+            self._tool_result_message(tool_call, result)
+            for tool_call, result in zip(tool_calls, results)
+        )
 
-            except Exception as e:
-                return f"Error: {str(e)}"
+    def _request_messages(self) -> List[Dict[str, Any]]:
+        window = self.context.window(self.messages, self._fixed_tokens)
+        logging.info(
+            "Request tokens: ~%d (%d of %d messages)",
+            self.context.last_request_tokens, len(window), len(self.messages),
+        )
+        return [self.system_message] + window
+
+    def _start_turn(self, user_input: str) -> float:
+        logging.info("User input: %s", LogField(user_input))
+        self.messages.append({"role": "user", "content": user_input})
+        self._turn_tokens = {"prompt_tokens": 0, "completion_tokens": 0}
+        return time.perf_counter()
+
+    def _log_prompt_eval(self, response: Any) -> None:
+        self.tracer.current().set(**{
+            f"ollama.{field}": response.get(field) for field in SERVER_TIMING_FIELDS
+        })
+        # A low prompt_eval_count relative to the request size means Ollama
+        # reused the cached prefix
+        self.last_prompt_eval = {
+            "prompt_eval_count": response.get("prompt_eval_count"),
+            "prompt_eval_duration": response.get("prompt_eval_duration"),
+        }
+        self._turn_tokens["prompt_tokens"] += response.get("prompt_eval_count") or 0
+        self._turn_tokens["completion_tokens"] += response.get("eval_count") or 0
+        logging.info(
+            "Prompt eval: count=%s duration=%sns",
+            self.last_prompt_eval["prompt_eval_count"], self.last_prompt_eval["prompt_eval_duration"],
+        )
+
+    def _save_session(self) -> None:
+        # Only the messages added since the last save are written
+        if self.session_store is None or self._saved_messages >= len(self.messages):
+            return
+        try:
+            self.session_store.append(
+                self.session_id, self._saved_messages, self.messages[self._saved_messages:]
+            )
+            self._saved_messages = len(self.messages)
+        except Exception as e:
+            logging.error("Error saving session %s: %s", self.session_id, e)
+
+    def _record_turn_stats(self, started: float, first_token: Optional[float]) -> None:
+        total = time.perf_counter() - started
+        ttft = first_token - started if first_token is not None else None
+        self.last_turn_stats = {"time_to_first_token": ttft, "total": total, **self._turn_tokens}
+        self.tracer.current().set(time_to_first_token=ttft)
+        if ttft is not None:
+            logging.info("Turn latency: ttft=%.3fs total=%.3fs", ttft, total)
+        else:
+            logging.info("Turn latency: total=%.3fs", total)
+
+    def chat(self, user_input: str) -> str:
+        started = self._start_turn(user_input)
+
+        with self.tracer.span("agent.turn", stream=False, model=self.model):
+            while True:
+                try:
+                    with self.tracer.span("request.build"):
+                        messages_with_system = self._request_messages()
+
+                    # Use the client to make the chat request
+                    with self.tracer.span("model.call", Tracer.KIND_CLIENT, model=self.model):
+                        response = self.client.chat(
+                            model=self.model,
+                            messages=messages_with_system,
+                            tools=self.ollama_tools,
+                            **self._chat_options,
+                        )
+                        self._log_prompt_eval(response)
+
+                    # Handle the response
+                    message = response.get("message", {})
+                    tool_calls = message.get("tool_calls") or []
+
+                    # Add assistant message to conversation
+                    self.messages.append({
+                        "role": "assistant",
+                        "content": message.get("content", ""),
+                        "tool_calls": tool_calls
+                    })
+
+                    # Check if there are tool calls to execute
+                    if tool_calls:
+                        self._run_tool_calls(tool_calls)
+                    else:
+                        # No tool calls, return the response
+                        self._record_turn_stats(started, None)
+                        self._save_session()
+                        return message.get("content", "")
+
+                except Exception as e:
+                    self.tracer.current().set(error=str(e))
+                    self._save_session()
+                    return f"Error: {str(e)}"
+
+    def chat_stream(self, user_input: str) -> Iterator[str]:
+        """Like chat(), but yields reply text as the model produces it.
+
+        Tool calls are collected from the streamed chunks and executed once
+        the model has finished its message, exactly as in chat().
+        """
+        started = self._start_turn(user_input)
+        first_token: Optional[float] = None
+
+        # The spans are only made current between yields, so the caller's
+        # own spans never nest under this turn
+        with self.tracer.detached_span("agent.turn", stream=True, model=self.model) as turn:
+            while True:
+                try:
+                    with self.tracer.activate(turn), self.tracer.span("request.build"):
+                        messages_with_system = self._request_messages()
+
+                    with self.tracer.detached_span(
+                        "model.call", Tracer.KIND_CLIENT, parent=turn, model=self.model
+                    ) as call:
+                        with self.tracer.activate(call):
+                            stream = self.client.chat(
+                                model=self.model,
+                                messages=messages_with_system,
+                                tools=self.ollama_tools,
+                                **self._chat_options,
+                                stream=True,
+                            )
+
+                        content_parts: List[str] = []
+                        tool_calls: List[Any] = []
+                        for chunk in stream:
+                            message = chunk.get("message", {})
+                            text = message.get("content", "")
+                            if text:
+                                if first_token is None:
+                                    first_token = time.perf_counter()
+                                content_parts.append(text)
+                                yield text
+                            # Ollama sends each tool call whole, in one chunk
+                            tool_calls.extend(message.get("tool_calls") or [])
+                            if chunk.get("done"):
+                                with self.tracer.activate(call):
+                                    self._log_prompt_eval(chunk)
+
+                    self.messages.append({
+                        "role": "assistant",
+                        "content": "".join(content_parts),
+                        "tool_calls": tool_calls
+                    })
+
+                    with self.tracer.activate(turn):
+                        if tool_calls:
+                            self._run_tool_calls(tool_calls)
+                        else:
+                            self._record_turn_stats(started, first_token)
+                            self._save_session()
+                    if not tool_calls:
+                        return
+
+                except Exception as e:
+                    turn.set(error=str(e))
+                    self._save_session()
+                    yield f"Error: {str(e)}"
+                    return
+
+
+class AsyncAIAgent(AIAgent):
+    """AIAgent for asyncio applications, built on ollama.AsyncClient.
+
+    Model requests are awaited and tool calls run in the event loop's default
+    executor, so many sessions can share one process and one event loop.
+    """
+
+    _cassette_class = AsyncCassetteClient
+    _caching_class = AsyncCachingClient
+
+    def _create_client(self):
+        servers = parse_servers(self.server)
+        if len(servers) > 1:
+            return client_factory.async_router(servers)
+        return client_factory.async_client(servers[0] if servers else None)
+
+    async def warm_up(self) -> None:
+        """Load the model on every server before the first question."""
+        await asyncio.gather(*(
+            target.generate(model=self.model, **self._chat_options)
+            for target in _warm_targets(self.client)
+        ))
+
+    async def unload(self) -> None:
+        await asyncio.gather(*(
+            target.generate(model=self.model, keep_alive=0)
+            for target in _warm_targets(self.client)
+        ))
+
+    async def _run_tool_calls(self, tool_calls: List[Any]) -> None:
+        calls = [self._tool_call_args(tool_call) for tool_call in tool_calls]
+        results: List[str] = [""] * len(calls)
+        semaphore = asyncio.Semaphore(max(self.max_tool_workers, 1))
+
+        async def run_lane(lane: List[int]) -> None:
+            async with semaphore:
+                for index in lane:
+                    results[index] = await asyncio.to_thread(self._run_tool_call, *calls[index])
+
+        await asyncio.gather(*(run_lane(lane) for lane in self._plan_tool_lanes(calls)))
+
+        self.messages.extend(
+            self._tool_result_message(tool_call, result)
+            for tool_call, result in zip(tool_calls, results)
+        )
+
+    async def chat(self, user_input: str) -> str:
+        started = self._start_turn(user_input)
+
+        with self.tracer.span("agent.turn", stream=False, model=self.model):
+            while True:
+                try:
+                    with self.tracer.span("request.build"):
+                        messages_with_system = self._request_messages()
+
+                    with self.tracer.span("model.call", Tracer.KIND_CLIENT, model=self.model):
+                        response = await self.client.chat(
+                            model=self.model,
+                            messages=messages_with_system,
+                            tools=self.ollama_tools,
+                            **self._chat_options,
+                        )
+                        self._log_prompt_eval(response)
+
+                    message = response.get("message", {})
+                    tool_calls = message.get("tool_calls") or []
+
+                    self.messages.append({
+                        "role": "assistant",
+                        "content": message.get("content", ""),
+                        "tool_calls": tool_calls
+                    })
+
+                    if tool_calls:
+                        await self._run_tool_calls(tool_calls)
+                    else:
+                        self._record_turn_stats(started, None)
+                        await asyncio.to_thread(self._save_session)
+                        return message.get("content", "")
+
+                except Exception as e:
+                    self.tracer.current().set(error=str(e))
+                    await asyncio.to_thread(self._save_session)
+                    return f"Error: {str(e)}"
+
+    async def chat_stream(self, user_input: str) -> AsyncIterator[str]:
+        started = self._start_turn(user_input)
+        first_token: Optional[float] = None
+
+        with self.tracer.detached_span("agent.turn", stream=True, model=self.model) as turn:
+            while True:
+                try:
+                    with self.tracer.activate(turn), self.tracer.span("request.build"):
+                        messages_with_system = self._request_messages()
+
+                    with self.tracer.detached_span(
+                        "model.call", Tracer.KIND_CLIENT, parent=turn, model=self.model
+                    ) as call:
+                        with self.tracer.activate(call):
+                            stream = await self.client.chat(
+                                model=self.model,
+                                messages=messages_with_system,
+                                tools=self.ollama_tools,
+                                **self._chat_options,
+                                stream=True,
+                            )
+
+                        content_parts: List[str] = []
+                        tool_calls: List[Any] = []
+                        async for chunk in stream:
+                            message = chunk.get("message", {})
+                            text = message.get("content", "")
+                            if text:
+                                if first_token is None:
+                                    first_token = time.perf_counter()
+                                content_parts.append(text)
+                                yield text
+                            tool_calls.extend(message.get("tool_calls") or [])
+                            if chunk.get("done"):
+                                with self.tracer.activate(call):
+                                    self._log_prompt_eval(chunk)
+
+                    self.messages.append({
+                        "role": "assistant",
+                        "content": "".join(content_parts),
+                        "tool_calls": tool_calls
+                    })
+
+                    with self.tracer.activate(turn):
+                        if tool_calls:
+                            await self._run_tool_calls(tool_calls)
+                        else:
+                            self._record_turn_stats(started, first_token)
+                            await asyncio.to_thread(self._save_session)
+                    if not tool_calls:
+                        return
+
+                except Exception as e:
+                    turn.set(error=str(e))
+                    await asyncio.to_thread(self._save_session)
+                    yield f"Error: {str(e)}"
+                    return
+
+
+class SessionBusyError(Exception):
+    """A session is already handling a message."""
+
+
+class SessionPool:
+    """A bounded set of live agents, one per HTTP session.
+
+    Each session has a lock so it handles one message at a time. Sessions
+    idle for longer than idle_timeout are evicted, and when the pool is
+    full the least recently used idle session makes room. With a session
+    store, an evicted session is reloaded from it on its next message.
+    Idle sessions are also swept every sweep_interval seconds, so they do
+    not linger when no new sessions arrive.
+    """
+
+    def __init__(
+        self,
+        make_agent: Any,
+        max_sessions: int = 32,
+        idle_timeout: float = 900.0,
+        sweep_interval: float = 60.0,
+    ):
+        self.make_agent = make_agent
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        # session id -> [agent, lock, last used]; oldest first
+        self._sessions: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self.evictions = 0
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        if sweep_interval > 0:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="session-sweep", daemon=True)
+            self._sweeper.start()
+
+    def _evict(self, session_id: str) -> None:
+        agent, _, _ = self._sessions.pop(session_id)
+        agent.close()
+        self.evictions += 1
+        logging.info("Evicted session %s", session_id)
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        for session_id, (_, lock, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_timeout and not lock.locked():
+                self._evict(session_id)
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+    def sweep(self) -> None:
+        """Evict every session idle for longer than idle_timeout."""
+        with self._lock:
+            self._evict_idle()
+
+    def _make_room(self) -> None:
+        self._evict_idle()
+        if len(self._sessions) < self.max_sessions:
+            return
+        for session_id, (_, lock, _) in self._sessions.items():
+            if not lock.locked():
+                self._evict(session_id)
+                return
+        raise SessionBusyError("All sessions are busy; try again later")
+
+    def _add(self, agent: Any) -> str:
+        session_id = agent.session_id or uuid.uuid4().hex
+        self._sessions[session_id] = [agent, threading.Lock(), time.monotonic()]
+        return session_id
+
+    def create(self) -> str:
+        with self._lock:
+            self._make_room()
+            return self._add(self.make_agent())
+
+    @contextlib.contextmanager
+    def use(self, session_id: str) -> Iterator[Any]:
+        """Hold a session's lock for one message; KeyError if it is unknown."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                # Evicted or from an earlier run: reload it from the session store
+                try:
+                    agent = self.make_agent(session_id)
+                except ValueError:
+                    raise KeyError(session_id)
+                self._make_room()
+                self._add(agent)
+                entry = self._sessions[session_id]
+            agent, lock, _ = entry
+            if not lock.acquire(blocking=False):
+                raise SessionBusyError(f"Session {session_id} is busy")
+            self._sessions.move_to_end(session_id)
+        try:
+            yield agent
+        finally:
+            entry[2] = time.monotonic()
+            lock.release()
+
+    def close(self, session_id: str) -> bool:
+        """End a session; SessionBusyError while it is handling a message."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return False
+            # use() takes session locks under the pool lock, so this cannot race
+            if entry[1].locked():
+                raise SessionBusyError(f"Session {session_id} is busy")
+            self._evict(session_id)
+            return True
+
+    def shutdown(self) -> None:
+        """Stop the sweeper and close every session that is not busy."""
+        self._stop.set()
+        with self._lock:
+            for session_id, (_, lock, _) in list(self._sessions.items()):
+                if not lock.locked():
+                    self._evict(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            busy = sum(1 for _, lock, _ in self._sessions.values() if lock.locked())
+            return {
+                "sessions": len(self._sessions),
+                "busy": busy,
+                "max_sessions": self.max_sessions,
+                "evictions": self.evictions,
+            }
+
+
+class AgentRequestHandler:
+    """JSON API over a SessionPool, mixed into http.server's request handler.
+
+    POST   /sessions                      create a session
+    POST   /sessions/<id>/messages        send a message, get the whole reply
+    POST   /sessions/<id>/messages/stream send a message, get the reply as SSE
+    DELETE /sessions/<id>                 end a session
+    GET    /health                        pool and connection statistics
+    """
+
+    server_version = "SingleFileAgent/1.0"
+    pool: SessionPool
+    # Host headers accepted, e.g. "127.0.0.1:8765"; see make_server
+    allowed_hosts: set = set()
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.info("HTTP %s - " + format, self.address_string(), *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length))
+        if not isinstance(body, dict):
+            raise ValueError("Expected a JSON object")
+        return body
+
+    def _route(self) -> List[str]:
+        return [part for part in self.path.split("?", 1)[0].split("/") if part]
+
+    def _host_allowed(self) -> bool:
+        # A page in the browser can point its own domain at 127.0.0.1 (DNS
+        # rebinding), but its requests still carry that domain as Host
+        if (self.headers.get("Host") or "").lower() in self.allowed_hosts:
+            return True
+        self._send_json(403, {"error": "Host not allowed"})
+        return False
+
+    def do_GET(self) -> None:
+        if not self._host_allowed():
+            return
+        if self._route() == ["health"]:
+            self._send_json(200, {"status": "ok", "pool": self.pool.stats(), "connections": client_factory.stats()})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self) -> None:
+        if not self._host_allowed():
+            return
+        route = self._route()
+        if len(route) == 2 and route[0] == "sessions":
+            try:
+                closed = self.pool.close(route[1])
+            except SessionBusyError as e:
+                self._send_json(409, {"error": str(e)})
+                return
+            if closed:
+                self._send_json(200, {"session_id": route[1], "closed": True})
+            else:
+                self._send_json(404, {"error": f"Unknown session: {route[1]}"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self) -> None:
+        if not self._host_allowed():
+            return
+        route = self._route()
+        try:
+            if route == ["sessions"]:
+                self._send_json(201, {"session_id": self.pool.create()})
+                return
+            if len(route) >= 3 and route[0] == "sessions" and route[2] == "messages" and len(route) <= 4:
+                stream = route[3:] == ["stream"]
+                if len(route) == 4 and not stream:
+                    raise LookupError
+                content = self._read_json().get("content")
+                if not isinstance(content, str) or not content:
+                    self._send_json(400, {"error": 'Expected {"content": "<message>"}'})
+                    return
+                # The reply is finished after the session is released, so a
+                # client that sends its next message at once never sees 409
+                with self.pool.use(route[1]) as agent:
+                    if stream:
+                        stats = self._stream_reply(agent, content)
+                    else:
+                        reply = agent.chat(content)
+                        stats = agent.last_turn_stats
+                if not stream:
+                    self._send_json(200, {"session_id": route[1], "reply": reply, "stats": stats})
+                elif stats is not None:
+                    self._send_event("done", {"stats": stats})
+                return
+            raise LookupError
+        except KeyError as e:
+            self._send_json(404, {"error": f"Unknown session: {e.args[0]}"})
+        except LookupError:
+            self._send_json(404, {"error": "Not found"})
+        except SessionBusyError as e:
+            self._send_json(409 if len(route) > 1 else 503, {"error": str(e)})
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid request body: {e}"})
+
+    def _send_event(self, event: str, body: Dict[str, Any]) -> None:
+        try:
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(body)}\n\n".encode("utf-8"))
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Client disconnected during a streamed reply")
+
+    def _stream_reply(self, agent: Any, content: str) -> Optional[Dict[str, Any]]:
+        """Stream the reply as SSE; its turn stats, or None if the client left."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            for text in agent.chat_stream(content):
+                self.wfile.write(f"data: {json.dumps({'text': text})}\n\n".encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info("Client disconnected during a streamed reply")
+            return None
+        return agent.last_turn_stats
+
+
+def make_server(pool: SessionPool, host: str = "127.0.0.1", port: int = 8765) -> Any:
+    """An HTTP server for the agent API; call serve_forever() to run it.
+
+    Only requests addressed to localhost or the bind address are served.
+    """
+    handler = type(
+        "BoundAgentRequestHandler", (AgentRequestHandler, http_server.BaseHTTPRequestHandler), {"pool": pool}
+    )
+    server = http_server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    port = server.server_address[1]
+    names = {"localhost", "127.0.0.1", "[::1]", f"[{host}]" if ":" in host else host}
+    handler.allowed_hosts = {f"{name.lower()}:{port}" for name in names}
+    if port == 80:
+        handler.allowed_hosts |= {name.lower() for name in names}
+    return server
+
+
+def read_batch(path: str) -> List[Dict[str, Any]]:
+    """Prompts of a batch file: one JSON string or {"id", "prompt"} object per line."""
+    items: List[Dict[str, Any]] = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{number}: invalid JSON: {e}")
+            if isinstance(record, str):
+                record = {"prompt": record}
+            if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+                raise ValueError(f'{path}:{number}: expected a string or an object with a "prompt"')
+            item_id = record.get("id", number)
+            if item_id in seen:
+                raise ValueError(f"{path}:{number}: duplicate id {item_id!r}")
+            seen.add(item_id)
+            items.append({"id": item_id, "prompt": record["prompt"]})
+    return items
+
+
+def finished_batch_ids(output_path: str) -> set:
+    """Ids that already have a successful result in an earlier run's output."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn last line of an interrupted run
+            if isinstance(record, dict) and "error" not in record:
+                done.add(record.get("id"))
+    return done
+
+
+def run_batch(
+    prompts_path: str,
+    output_path: str,
+    make_agent: Any,
+    workers: int = 4,
+    on_result: Any = None,
+) -> Dict[str, int]:
+    """Answer every prompt of a batch file, each in a fresh agent.
+
+    Prompts run on a thread pool and each result is appended to
+    output_path as soon as it completes, so the output is in completion
+    order. The output doubles as the checkpoint: prompts that already have
+    a successful result are skipped, and failed ones run again, with the
+    newer line superseding the old one.
+    """
+    items = read_batch(prompts_path)
+    done = finished_batch_ids(output_path)
+    add_output_file(output_path)
+    pending = [item for item in items if item["id"] not in done]
+    summary = {"total": len(items), "skipped": len(items) - len(pending), "succeeded": 0, "failed": 0}
+    lock = threading.Lock()
+
+    def run_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        record: Dict[str, Any] = {"id": item["id"], "prompt": item["prompt"]}
+        agent = None
+        try:
+            agent = make_agent()
+            reply = agent.chat(item["prompt"])
+            record["session_id"] = agent.session_id
+            stats = agent.last_turn_stats
+        except Exception as e:
+            reply, stats = f"Error: {str(e)}", {}
+        finally:
+            # Each prompt's agent owns a session and tool threads
+            if agent is not None:
+                try:
+                    agent.close()
+                except Exception as e:
+                    logging.warning("Closing agent for batch item %s failed: %s", item["id"], e)
+        record["latency"] = time.perf_counter() - started
+        # chat() reports failures as its reply and then records no turn stats
+        if stats:
+            record["response"] = reply
+            record["prompt_tokens"] = stats.get("prompt_tokens")
+            record["completion_tokens"] = stats.get("completion_tokens")
+        else:
+            record["error"] = reply
+        return record
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        if out.tell() > 0:
+            with open(output_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    out.write("\n")
+
+        def run_and_write(item: Dict[str, Any]) -> Dict[str, Any]:
+            record = run_item(item)
+            with lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                summary["failed" if "error" in record else "succeeded"] += 1
+            logging.info("Batch item %s finished in %.3fs", record["id"], record["latency"])
+            if on_result is not None:
+                on_result(record)
+            return record
+
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="batch")
+        try:
+            for future in [executor.submit(run_and_write, item) for item in pending]:
+                future.result()
+        finally:
+            # On Ctrl-C only the prompts already running are finished and written
+            executor.shutdown(wait=True, cancel_futures=True)
+    return summary
+
+
+def run_batch_command(args: argparse.Namespace, make_agent: Any) -> None:
+    output = args.batch_output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+    if not args.no_warmup and not args.replay:
+        # A throwaway agent, so no empty session is stored for it
+        AIAgent(args.model, args.server, keep_alive=args.keep_alive).warm_up().wait()
+
+    def report(record: Dict[str, Any]) -> None:
+        status = "❌" if "error" in record else "✅"
+        print(f"{status} {record['id']} ({record['latency']:.2f}s)", flush=True)
+
+    print(f"📦 Running {args.batch} with {args.workers} workers, results in {output}")
+    try:
+        summary = run_batch(args.batch, output, make_agent, args.workers, on_result=report)
+    except (OSError, ValueError) as e:
+        print(f"Error: {str(e)}")
+        return
+    except KeyboardInterrupt:
+        print(f"\nInterrupted - rerun the same command to resume from {output}")
+        return
+    print(
+        f"Done: {summary['succeeded']} succeeded, {summary['failed']} failed, "
+        f"{summary['skipped']} already finished of {summary['total']}"
+    )
+
+
+def run_serve_command(args: argparse.Namespace, make_agent: Any) -> None:
+    if not args.no_warmup and not args.replay:
+        AIAgent(args.model, args.server, keep_alive=args.keep_alive).warm_up()
+    pool = SessionPool(make_agent, args.max_sessions, args.session_idle)
+    try:
+        server = make_server(pool, args.bind, args.port)
+    except OSError as e:
+        pool.shutdown()
+        print(f"Error: {str(e)}")
+        return
+    print(f"🌐 Serving {args.model} on http://{args.bind}:{args.port} - press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nGoodbye!")
+    finally:
+        server.server_close()
+        pool.shutdown()
 
 
 def main():
@@ -262,11 +3730,235 @@ def main():
     )
     parser.add_argument(
         "--server",
-        help="Ollama server address for remote execution (default: localhost - keeps data private)"
+        help="Ollama server address for remote execution, or a comma-separated list to spread requests over several servers (default: localhost - keeps data private)"
+    )
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=8192,
+        help="Approximate token budget for each request; keep it within the model's num_ctx (default: 8192)"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Watch the working directory and keep caches and the search index fresh in the background"
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=FSYNC_POLICIES,
+        default="never",
+        help="Flush edited files to disk before replacing the original: never, file, or full (file and directory) (default: never)"
+    )
+    parser.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        help="Record every model request and response to this JSONL cassette, replacing its contents"
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        help="Answer model requests from a cassette recorded with --record instead of Ollama"
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before each replayed response (default: 0)"
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="PATH",
+        help="Write per-turn timing spans as OpenTelemetry-style JSONL to this file"
+    )
+    parser.add_argument(
+        "--log-level",
+        default="INFO",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Minimum level written to agent.log (default: INFO)"
+    )
+    parser.add_argument(
+        "--log-format",
+        default="text",
+        choices=["text", "json"],
+        help="Write agent.log as plain text or one JSON object per line (default: text)"
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="SESSION_ID",
+        help="Continue a previous conversation"
+    )
+    parser.add_argument(
+        "--session-db",
+        help=f"SQLite file that stores conversations (default: {default_session_path()})"
+    )
+    parser.add_argument(
+        "--compress-sessions",
+        action="store_true",
+        help="zstd-compress stored messages (needs the zstandard package before Python 3.14)"
+    )
+    parser.add_argument(
+        "--no-session",
+        action="store_true",
+        help="Do not store this conversation"
+    )
+    parser.add_argument(
+        "--cache-responses",
+        action="store_true",
+        help="Reuse model responses for identical requests from an on-disk cache"
+    )
+    parser.add_argument(
+        "--response-cache-dir",
+        help=f"Directory of the response cache (default: {default_cache_dir()})"
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=POOL_MAX_CONNECTIONS,
+        help=f"Maximum pooled connections per Ollama server (default: {POOL_MAX_CONNECTIONS})"
+    )
+    parser.add_argument(
+        "--keepalive-expiry",
+        type=float,
+        default=POOL_KEEPALIVE_EXPIRY,
+        help=f"Seconds an idle pooled connection stays open (default: {POOL_KEEPALIVE_EXPIRY:g})"
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        default=CONNECT_TIMEOUT,
+        help=f"Seconds to wait for a connection to the server (default: {CONNECT_TIMEOUT:g})"
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        default=READ_TIMEOUT,
+        help="Seconds to wait for data from the server (default: no limit)"
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=parse_keep_alive,
+        help="How long the server keeps the model loaded once idle, in seconds or as a duration like 30m; -1 keeps it forever (default: server setting)"
+    )
+    parser.add_argument(
+        "--no-warmup",
+        action="store_true",
+        help="Do not preload the model while waiting for the first question"
+    )
+    parser.add_argument(
+        "--unload-on-exit",
+        action="store_true",
+        help="Release the model's memory on the server when the session ends"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="PROMPTS_JSONL",
+        help="Answer every prompt in a JSONL file, each in its own session, instead of chatting"
+    )
+    parser.add_argument(
+        "--batch-output",
+        help="Where --batch appends its results; rerunning resumes from it (default: <prompts>.results.jsonl)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Prompts answered concurrently in --batch mode (default: 4)"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve the agent over a local HTTP API instead of chatting in the terminal"
+    )
+    parser.add_argument(
+        "--bind",
+        default="127.0.0.1",
+        help="Address --serve listens on; only requests for localhost or this address are served (default: 127.0.0.1)"
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port --serve listens on (default: 8765)"
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=32,
+        help="Live sessions kept in memory by --serve (default: 32)"
+    )
+    parser.add_argument(
+        "--session-idle",
+        type=float,
+        default=900.0,
+        help="Seconds before --serve evicts an idle session from memory (default: 900)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Print the reply token by token as it is generated"
     )
     args = parser.parse_args()
 
-    agent = AIAgent(args.model, args.server)
+    setup_logging(args.log_level, log_format=args.log_format)
+    try:
+        client_factory.configure(args.pool_size, args.keepalive_expiry, args.connect_timeout, args.read_timeout)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return
+    atexit.register(_log_pool_stats)
+
+    session_store = None
+    if not args.no_session:
+        session_store = SessionStore(args.session_db, compress=args.compress_sessions)
+
+    if args.record:
+        # Every agent of this run appends to one cassette, emptied once here
+        try:
+            open(args.record, "w", encoding="utf-8").close()
+        except OSError as e:
+            print(f"Error: {str(e)}")
+            return
+
+    response_cache = None
+    if args.cache_responses:
+        response_cache = ResponseCache(args.response_cache_dir)
+
+    # One search index, tool cache and watcher for every agent of this run
+    workspace = Workspace(os.getcwd(), watch=args.watch)
+    atexit.register(workspace.close)
+
+    def make_agent(session_id: Optional[str] = None) -> AIAgent:
+        return AIAgent(
+            args.model,
+            args.server,
+            context_budget=args.context_budget,
+            fsync=args.fsync,
+            cassette=args.replay or args.record,
+            cassette_mode="replay" if args.replay else "append",
+            cassette_latency=args.replay_latency,
+            trace_path=args.trace,
+            session_store=session_store,
+            session_id=session_id,
+            response_cache=response_cache,
+            keep_alive=args.keep_alive,
+            workspace=workspace,
+        )
+
+    if args.batch:
+        run_batch_command(args, make_agent)
+        return
+    if args.serve:
+        run_serve_command(args, make_agent)
+        return
+
+    try:
+        agent = make_agent(args.resume)
+    except ValueError as e:
+        print(f"Error: {str(e)}")
+        return
+    # A replayed session never talks to the server
+    if not args.no_warmup and not args.replay:
+        agent.warm_up()
 
     print("🏠 Local AI Code Assistant (Ollama)")
     print("=====================================")
@@ -278,6 +3970,11 @@ def main():
         print("💻 Using local Ollama server (completely private)")
     print("💡 Benefits: No API costs, offline capable, lightning fast!")
     print()
+    if agent.session_id:
+        if args.resume:
+            print(f"📂 Resumed session {agent.session_id} ({len(agent.messages)} messages)")
+        else:
+            print(f"📂 Session {agent.session_id} - continue it later with --resume {agent.session_id}")
     print("Type 'exit' or 'quit' to end the conversation.")
     print()
 
@@ -293,8 +3990,13 @@ def main():
                 continue
 
             print("\nAssistant: ", end="", flush=True)
-            response = agent.chat(user_input)
-            print(response)
+            if args.stream:
+                for text in agent.chat_stream(user_input):
+                    print(text, end="", flush=True)
+                print()
+            else:
+                response = agent.chat(user_input)
+                print(response)
             print()
 
         except KeyboardInterrupt:
@@ -304,6 +4006,9 @@ def main():
             print(f"\nError: {str(e)}")
             print()
 
+    if args.unload_on_exit and not args.replay:
+        agent.unload()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Test script to verify transactional multi-file edits through apply_edits
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import AIAgent
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_batch_applied_in_order():
+    """Edits are grouped per file and applied in order"""
+    print("Testing apply_edits...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b, c = (os.path.join(tmp, name) for name in ("a.py", "b.py", "pkg/c.py"))
+        write(a, "old_name()\nold_name()\n")
+        write(b, "import old_name\n")
+
+        result = agent._execute_tool("apply_edits", {"edits": [
+            {"path": a, "old_text": "old_name", "new_text": "mid_name", "expected_occurrences": 2},
+            {"path": b, "old_text": "old_name", "new_text": "new_name"},
+            {"path": a, "old_text": "mid_name", "new_text": "new_name"},
+            {"path": c, "new_text": "created\n"},
+        ]})
+        assert result.startswith("Successfully applied 4 edits to 3 files")
+        assert read(a) == "new_name()\nnew_name()\n"
+        assert read(b) == "import new_name\n"
+        assert read(c) == "created\n"
+        assert sorted(os.listdir(tmp)) == ["a.py", "b.py", "pkg"]
+    print("   ✅ All edits applied")
+
+
+def test_validation_failure_changes_nothing():
+    """One bad edit leaves every file untouched"""
+    print("Testing validation before writing...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = os.path.join(tmp, "a.py"), os.path.join(tmp, "b.py")
+        write(a, "x = 1\n")
+        write(b, "y = 1\n")
+        result = agent._execute_tool("apply_edits", {"edits": [
+            {"path": a, "old_text": "x = 1", "new_text": "x = 2"},
+            {"path": b, "old_text": "missing", "new_text": "z"},
+        ]})
+        assert result.startswith("No files changed")
+        assert "text not found: missing" in result
+        assert read(a) == "x = 1\n" and read(b) == "y = 1\n"
+    print("   ✅ Nothing written")
+
+
+def test_rollback_on_commit_failure():
+    """A failure while swapping files in restores the files already replaced"""
+    print("Testing rollback...")
+    agent = AIAgent()
+    original_commit = main.commit_temp_copy
+    calls = []
+
+    def failing_commit(temp_path, path, fsync="never"):
+        calls.append(path)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        original_commit(temp_path, path, fsync)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = os.path.join(tmp, "a.py"), os.path.join(tmp, "b.py")
+        write(a, "a1\n")
+        write(b, "b1\n")
+        main.commit_temp_copy = failing_commit
+        try:
+            result = agent._execute_tool("apply_edits", {"edits": [
+                {"path": a, "old_text": "a1", "new_text": "a2"},
+                {"path": b, "old_text": "b1", "new_text": "b2"},
+            ]})
+        finally:
+            main.commit_temp_copy = original_commit
+        assert "disk full" in result
+        assert read(a) == "a1\n" and read(b) == "b1\n"
+        assert sorted(os.listdir(tmp)) == ["a.py", "b.py"]
+    print("   ✅ Rolled back cleanly")
+
+
+def test_edits_follow_symlinks():
+    """Edits through a symlink change its target, grouped with edits to the target"""
+    print("Testing apply_edits through a symlink...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        real = os.path.join(tmp, "real.py")
+        link = os.path.join(tmp, "link.py")
+        write(real, "one\ntwo\n")
+        os.symlink("real.py", link)
+
+        result = agent._apply_edits([
+            {"path": link, "old_text": "one", "new_text": "1"},
+            {"path": real, "old_text": "two", "new_text": "2"},
+        ])
+        assert result.startswith("Successfully applied 2 edits to 1 files"), result
+        assert os.path.islink(link)
+        assert read(real) == "1\n2\n"
+        assert sorted(os.listdir(tmp)) == ["link.py", "real.py"]
+    print("   ✅ Symlink kept, target edited")
+
+
+if __name__ == "__main__":
+    test_batch_applied_in_order()
+    test_validation_failure_changes_nothing()
+    test_rollback_on_commit_failure()
+    test_edits_follow_symlinks()
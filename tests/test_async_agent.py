@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script to verify AsyncAIAgent matches AIAgent behaviour on asyncio
+"""
+
+import sys
+import os
+import json
+import asyncio
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama import AsyncClient
+from main import AsyncAIAgent, SessionStore
+
+
+class FakeAsyncClient:
+    """Returns canned responses, one per chat() call, after a short await"""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    async def chat(self, model, messages, tools, stream=False):
+        await asyncio.sleep(0.01)
+        return self.responses.pop(0)
+
+
+def test_async_client_type():
+    """AsyncAIAgent builds an AsyncClient for both default and custom servers"""
+    print("Testing AsyncAIAgent client construction...")
+    assert isinstance(AsyncAIAgent().client, AsyncClient)
+    custom = AsyncAIAgent(server="http://remote-host:11434")
+    assert "remote-host:11434" in str(custom.client._client.base_url)
+    print("   ✅ AsyncClient configured correctly")
+
+
+def test_async_chat_with_tools():
+    """Concurrent sessions each run their tool loop to completion"""
+    print("Testing concurrent AsyncAIAgent sessions...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "data.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("async contents")
+
+        def make_agent(i):
+            agent = AsyncAIAgent()
+            agent.client = FakeAsyncClient([
+                {"message": {"content": "", "tool_calls": [
+                    {"function": {"name": "read_file", "arguments": {"path": path}}}
+                ]}},
+                {"message": {"content": f"reply {i}"}},
+            ])
+            return agent
+
+        agents = [make_agent(i) for i in range(50)]
+
+        async def run_all():
+            return await asyncio.gather(*(a.chat("read") for a in agents))
+
+        replies = asyncio.run(run_all())
+        assert replies == [f"reply {i}" for i in range(50)]
+        assert all("async contents" in a.messages[2]["content"] for a in agents)
+    print("   ✅ 50 sessions completed on one event loop")
+
+
+def test_disk_writes_off_the_loop():
+    """Session saves and span exports never run on the event loop thread"""
+    print("Testing AsyncAIAgent disk writes...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.db"))
+        trace = os.path.join(tmp, "trace.jsonl")
+        agent = AsyncAIAgent(session_store=store, trace_path=trace)
+        agent.client = FakeAsyncClient([{"message": {"content": "done"}}])
+        writers = []
+        append, write = store.append, agent.tracer._write
+
+        def tracked_append(*args):
+            writers.append(threading.current_thread())
+            return append(*args)
+
+        def tracked_write(line):
+            writers.append(threading.current_thread())
+            return write(line)
+
+        store.append = tracked_append
+        agent.tracer._write = tracked_write
+        assert asyncio.run(agent.chat("hello")) == "done"
+
+        assert writers and threading.main_thread() not in writers
+        assert len(store.load(agent.session_id)) == 2
+        with open(trace, encoding="utf-8") as f:
+            assert "agent.turn" in [json.loads(line)["name"] for line in f]
+        store.close()
+    print("   ✅ Saves and exports ran in worker threads")
+
+
+if __name__ == "__main__":
+    test_async_client_type()
+    test_async_chat_with_tools()
+    test_disk_writes_off_the_loop()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Test script to verify --batch runs: results, completion order and resuming
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, Workspace, run_batch, read_batch
+
+
+class FakeClient:
+    """Answers with the prompt upper-cased; 'slow' prompts take longer, 'fail' ones raise"""
+
+    def chat(self, model, messages, tools, stream=False):
+        prompt = messages[-1]["content"]
+        if "fail" in prompt:
+            raise ConnectionError("server went away")
+        if "slow" in prompt:
+            time.sleep(0.3)
+        return {
+            "message": {"content": prompt.upper()},
+            "prompt_eval_count": 10,
+            "eval_count": len(prompt),
+        }
+
+
+def make_agent():
+    agent = AIAgent()
+    agent.client = FakeClient()
+    return agent
+
+
+def write_lines(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+def read_results(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_results_in_completion_order():
+    """Fast prompts are written before slow ones, with latency and tokens"""
+    print("Testing batch results...")
+    with tempfile.TemporaryDirectory() as tmp:
+        prompts = os.path.join(tmp, "prompts.jsonl")
+        output = os.path.join(tmp, "out.jsonl")
+        write_lines(prompts, [
+            json.dumps({"id": "a", "prompt": "slow one"}),
+            json.dumps("quick"),
+            json.dumps({"id": "c", "prompt": "fail please"}),
+        ])
+        summary = run_batch(prompts, output, make_agent, workers=3)
+        assert summary == {"total": 3, "skipped": 0, "succeeded": 2, "failed": 1}, summary
+
+        results = read_results(output)
+        assert results[-1]["id"] == "a", "the slow prompt should finish last"
+        by_id = {r["id"]: r for r in results}
+        assert by_id[2]["response"] == "QUICK"
+        assert by_id[2]["prompt_tokens"] == 10
+        assert by_id[2]["completion_tokens"] == 5
+        assert by_id[2]["latency"] >= 0
+        assert "server went away" in by_id["c"]["error"]
+    print("✅ Results stream out in completion order")
+
+
+def test_resume_skips_finished():
+    """A rerun only redoes prompts without a successful result"""
+    print("Testing batch resume...")
+    with tempfile.TemporaryDirectory() as tmp:
+        prompts = os.path.join(tmp, "prompts.jsonl")
+        output = os.path.join(tmp, "out.jsonl")
+        write_lines(prompts, [json.dumps("one"), json.dumps("two"), json.dumps("three")])
+        # An interrupted run: one success, one failure and a torn line
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": 1, "response": "ONE"}) + "\n")
+            f.write(json.dumps({"id": 2, "error": "Error: boom"}) + "\n")
+            f.write('{"id": 3, "resp')
+
+        ran = []
+        summary = run_batch(prompts, output, make_agent, workers=2, on_result=ran.append)
+        assert summary["skipped"] == 1
+        assert sorted(r["id"] for r in ran) == [2, 3]
+        with open(output, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines[2] == '{"id": 3, "resp'
+        assert {json.loads(line)["id"] for line in lines[3:]} == {2, 3}
+    print("✅ Finished prompts are not redone")
+
+
+def test_invalid_batch_file():
+    """Malformed lines and duplicate ids are reported with their line number"""
+    print("Testing batch validation...")
+    with tempfile.TemporaryDirectory() as tmp:
+        prompts = os.path.join(tmp, "prompts.jsonl")
+        write_lines(prompts, [json.dumps({"id": "x", "prompt": "a"}), json.dumps({"id": "x", "prompt": "b"})])
+        try:
+            read_batch(prompts)
+            assert False, "expected ValueError"
+        except ValueError as e:
+            assert ":2: duplicate id" in str(e)
+        write_lines(prompts, ["{not json"])
+        try:
+            read_batch(prompts)
+            assert False, "expected ValueError"
+        except ValueError as e:
+            assert ":1: invalid JSON" in str(e)
+    print("✅ Bad batch files are rejected")
+
+
+def test_agents_are_closed():
+    """Every prompt's agent is closed, whether its turn succeeded or failed"""
+    print("Testing batch agents are closed...")
+    agents = []
+
+    def tracking_agent():
+        agent = make_agent()
+        agent.closed = False
+        close = agent.close
+
+        def tracked_close():
+            agent.closed = True
+            close()
+
+        agent.close = tracked_close
+        agents.append(agent)
+        return agent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prompts = os.path.join(tmp, "prompts.jsonl")
+        write_lines(prompts, [json.dumps("fine"), json.dumps("fail now")])
+        run_batch(prompts, os.path.join(tmp, "out.jsonl"), tracking_agent, workers=2)
+    assert len(agents) == 2 and all(agent.closed for agent in agents)
+    print("✅ Batch agents closed")
+
+
+def test_agents_share_workspace():
+    """Agents built per prompt reuse one search index, cache and watcher"""
+    print("Testing shared workspace...")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "code.py"), "w", encoding="utf-8") as f:
+            f.write("needle = 1\n")
+        workspace = Workspace(tmp, watch=True)
+        agents = []
+
+        def shared_agent():
+            agent = AIAgent(workspace=workspace)
+            agent.client = FakeClient()
+            agents.append(agent)
+            agent._execute_tool("search_code", {"query": "needle"})
+            return agent
+
+        prompts = os.path.join(tmp, "prompts.jsonl")
+        write_lines(prompts, [json.dumps(f"prompt {i}") for i in range(4)])
+        run_batch(prompts, os.path.join(tmp, "out.jsonl"), shared_agent, workers=2)
+        try:
+            assert len(agents) == 4
+            assert all(a.search_index is workspace.search_index for a in agents)
+            assert all(a.tool_cache is workspace.tool_cache for a in agents)
+            # Closing an agent leaves the shared watcher running
+            assert workspace.watcher._thread is not None
+        finally:
+            workspace.close()
+    print("✅ One index and watcher for the whole batch")
+
+
+if __name__ == "__main__":
+    print("🧪 Running batch tests...\n")
+    test_results_in_completion_order()
+    test_resume_skips_finished()
+    test_invalid_batch_file()
+    test_agents_are_closed()
+    test_agents_share_workspace()
+    print("\n🎉 All batch tests passed!")
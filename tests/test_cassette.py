@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test script to verify record/replay of Ollama chat exchanges
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ollama import ChatResponse, Message
+from main import AIAgent, request_key
+
+
+class ScriptedClient:
+    """A fake Ollama server: asks to read a file, then answers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+
+    def chat(self, model, messages, tools, stream=False):
+        self.calls += 1
+        if messages[-1]["role"] == "user":
+            return ChatResponse(model=model, done=True, message=Message(
+                role="assistant",
+                content="",
+                tool_calls=[Message.ToolCall(function=Message.ToolCall.Function(
+                    name="read_file", arguments={"path": self.path}
+                ))],
+            ))
+        return ChatResponse(model=model, done=True, message=Message(
+            role="assistant", content="It says: " + messages[-1]["content"].splitlines()[-1]
+        ))
+
+
+def test_record_then_replay_full_loop():
+    """A recorded tool-calling session replays without any server"""
+    print("Testing record and replay...")
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data.txt")
+        with open(data, "w", encoding="utf-8") as f:
+            f.write("hello cassette")
+        cassette = os.path.join(tmp, "session.jsonl")
+
+        recorder = AIAgent(cassette=cassette, cassette_mode="record")
+        recorder.client.inner = ScriptedClient(data)
+        assert recorder.chat("What is in data.txt?") == "It says: hello cassette"
+        assert recorder.client.inner.calls == 2
+
+        player = AIAgent(cassette=cassette, cassette_mode="replay", cassette_latency=0.05)
+        player.client.inner = None  # Any real request would fail
+        started = time.perf_counter()
+        assert player.chat("What is in data.txt?") == "It says: hello cassette"
+        assert time.perf_counter() - started >= 0.1
+        assert "No recorded response" in player.chat("Something new")
+    print("   ✅ Session replayed offline")
+
+
+def test_request_key_is_order_independent():
+    """Dict key order does not change the request hash"""
+    print("Testing request normalization...")
+    a = request_key("m", [{"role": "user", "content": "x"}], [{"type": "function", "function": {}}])
+    b = request_key("m", [{"content": "x", "role": "user"}], [{"function": {}, "type": "function"}])
+    assert a == b
+    assert a != request_key("m2", [{"role": "user", "content": "x"}], [])
+    print("   ✅ Keys stable")
+
+
+def test_streamed_replay():
+    """Streamed responses are recorded chunk by chunk"""
+    print("Testing streamed replay...")
+
+    class StreamingClient:
+        def chat(self, model, messages, tools, stream=False):
+            return iter([{"message": {"content": "a"}}, {"message": {"content": "b"}, "done": True}])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cassette = os.path.join(tmp, "stream.jsonl")
+        recorder = AIAgent(cassette=cassette, cassette_mode="record")
+        recorder.client.inner = StreamingClient()
+        assert "".join(recorder.chat_stream("hi")) == "ab"
+
+        player = AIAgent(cassette=cassette)
+        player.client.inner = None
+        assert list(player.chat_stream("hi")) == ["a", "b"]
+    print("   ✅ Stream replayed")
+
+
+def test_rerecording_replaces_old_answers():
+    """Recording again starts a fresh cassette; append mode keeps what is there"""
+    print("Testing re-recording...")
+
+    class Answer:
+        def __init__(self, content):
+            self.content = content
+
+        def chat(self, model, messages, tools, stream=False):
+            return {"message": {"content": self.content}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cassette = os.path.join(tmp, "fixture.jsonl")
+        for content in ("old", "new"):
+            recorder = AIAgent(cassette=cassette, cassette_mode="record")
+            recorder.client.inner = Answer(content)
+            assert recorder.chat("hi") == content
+
+        player = AIAgent(cassette=cassette)
+        player.client.inner = None
+        assert player.chat("hi") == "new"
+
+        appender = AIAgent(cassette=cassette, cassette_mode="append")
+        appender.client.inner = Answer("other")
+        assert appender.chat("bye") == "other"
+        with open(cassette, encoding="utf-8") as f:
+            assert len(f.readlines()) == 2
+    print("   ✅ Stale answers dropped")
+
+
+if __name__ == "__main__":
+    test_record_then_replay_full_loop()
+    test_request_key_is_order_independent()
+    test_streamed_replay()
+    test_rerecording_replaces_old_answers()
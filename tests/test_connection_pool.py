@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that agents share pooled keep-alive connections
+"""
+
+import sys
+import os
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import AIAgent, ClientFactory
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """Minimal /api/chat endpoint that keeps connections alive"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({
+            "model": "m",
+            "message": {"role": "assistant", "content": "pong"},
+            "done": True,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_agents_share_connections():
+    """Several agents on one host reuse a single keep-alive connection"""
+    print("Testing shared connection pool...")
+    server, host = run_server()
+    factory = ClientFactory(max_connections=4, connect_timeout=2.0, read_timeout=10.0)
+    original = main.client_factory
+    main.client_factory = factory
+    try:
+        agents = [AIAgent(server=host) for _ in range(3)]
+        for agent in agents:
+            assert agent.chat("ping") == "pong"
+    finally:
+        main.client_factory = original
+        server.shutdown()
+
+    (stats,) = factory.stats()
+    print(f"Pool stats: {stats}")
+    assert stats["host"] == host
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["reused"] == 2
+    assert stats["in_flight"] == 0
+    assert stats["max_connections"] == 4
+    print("✅ Agents reuse pooled connections")
+
+
+def test_async_pools_follow_their_loop():
+    """Each event loop gets its own pool, dropped once the loop closes"""
+    print("Testing async pools per event loop...")
+    factory = ClientFactory()
+
+    async def make_clients():
+        first, second = factory.async_client("http://127.0.0.1:1"), factory.async_client("http://127.0.0.1:1")
+        return first._client._transport, second._client._transport
+
+    first, second = asyncio.run(make_clients())
+    assert first is second, "clients on one loop share a pool"
+    third, _ = asyncio.run(make_clients())
+    assert third is not first, "a new loop never reuses a closed loop's pool"
+    # Both loops have closed, so neither of their pools is kept
+    assert factory.stats() == []
+    print("✅ Async pools are per loop and released with it")
+
+
+def test_configure_timeouts():
+    """Pool limits and timeouts apply to clients created afterwards"""
+    print("Testing pool configuration...")
+    factory = ClientFactory()
+    factory.configure(max_connections=2, keepalive_expiry=5.0, connect_timeout=1.5, read_timeout=30.0)
+    client = factory.client("http://127.0.0.1:1")
+    assert client._client.timeout.connect == 1.5
+    assert client._client.timeout.read == 30.0
+    assert factory.limits.max_connections == 2
+    assert factory.limits.keepalive_expiry == 5.0
+    try:
+        factory.configure(max_connections=0)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print("✅ Pool settings are applied")
+
+
+if __name__ == "__main__":
+    print("🧪 Running connection pool tests...\n")
+    test_agents_share_connections()
+    test_async_pools_follow_their_loop()
+    test_configure_timeouts()
+    print("\n🎉 All connection pool tests passed!")
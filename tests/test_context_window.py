@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test script to verify token-budgeted eviction of conversation history
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, ContextWindow, estimate_tokens
+
+
+def build_history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "x" * 200})
+        messages.append({"role": "assistant", "content": "", "tool_calls": [
+            {"function": {"name": "read_file", "arguments": {"path": f"f{i}"}}}
+        ]})
+        messages.append({"role": "tool", "content": "y" * 400, "tool_call_id": ""})
+        messages.append({"role": "assistant", "content": f"answer {i}", "tool_calls": []})
+    return messages
+
+
+def test_estimator():
+    """The estimator is roughly four characters per token"""
+    print("Testing token estimator...")
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("a" * 4000) == 1000
+    print("   ✅ Estimates look sane")
+
+
+def test_eviction_respects_budget_and_tool_pairs():
+    """The window stays under budget and never starts on a tool result"""
+    print("Testing sliding window eviction...")
+    context = ContextWindow(budget=1000)
+    messages = build_history(20)
+
+    window = context.window(messages, fixed_tokens=100)
+    assert context.last_request_tokens <= 1000
+    assert window[0]["role"] != "tool"
+    assert window[-1] is messages[-1]
+    assert len(window) < len(messages)
+
+    # Adding one small message keeps the same prefix (hysteresis)
+    start = context.start
+    messages.append({"role": "user", "content": "short"})
+    context.window(messages, fixed_tokens=100)
+    assert context.start == start
+    print(f"   ✅ Sent {len(window)} of {len(messages) - 1} messages, ~{context.last_request_tokens} tokens")
+
+
+def test_latest_user_message_always_sent():
+    """Even an oversized turn keeps the user's question in the window"""
+    print("Testing that the latest question survives eviction...")
+    context = ContextWindow(budget=50)
+    messages = build_history(3)
+    messages.append({"role": "user", "content": "z" * 1000})
+    window = context.window(messages)
+    assert window == messages[-1:]
+    print("   ✅ Latest user message kept")
+
+
+def test_agent_request_messages():
+    """AIAgent prepends the system prompt to the budgeted window"""
+    print("Testing AIAgent request construction...")
+    agent = AIAgent(context_budget=1500)
+    agent.messages = build_history(30)
+    request = agent._request_messages()
+    assert request[0]["role"] == "system"
+    assert request[1]["role"] != "tool"
+    assert agent.context.last_request_tokens <= 1500
+    print("   ✅ Request stays within budget")
+
+
+if __name__ == "__main__":
+    test_estimator()
+    test_eviction_respects_budget_and_tool_pairs()
+    test_latest_user_message_always_sent()
+    test_agent_request_messages()
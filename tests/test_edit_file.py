@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test script to verify atomic, chunked edit_file behaviour
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import io
+import main
+from main import AIAgent
+
+
+def test_chunked_replace_matches_str_replace():
+    """Matches across chunk boundaries are replaced like str.replace"""
+    print("Testing chunked replacement...")
+    text = "abcab" * 1000 + "aaaa"
+    for old, new in [("ab", "X"), ("cab", ""), ("aa", "b"), ("abcabcab", "-")]:
+        for chunk in (1, 2, 3, 7, 64):
+            dst = io.StringIO()
+            count = main._replace_stream(io.StringIO(text), dst, old, new, chunk)
+            assert dst.getvalue() == text.replace(old, new), (old, chunk)
+            assert count == text.count(old)
+    print("   ✅ Chunked output identical to str.replace")
+
+
+def test_expected_occurrences_guard():
+    """The edit is refused when old_text matches a different number of times"""
+    print("Testing expected_occurrences guard...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("x = 1\nx = 1\n")
+
+        result = agent._execute_tool(
+            "edit_file", {"path": path, "old_text": "x = 1", "new_text": "x = 2", "expected_occurrences": 1}
+        )
+        assert "found 2" in result
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == "x = 1\nx = 1\n"
+
+        result = agent._execute_tool(
+            "edit_file", {"path": path, "old_text": "x = 1", "new_text": "x = 2", "expected_occurrences": 2}
+        )
+        assert result.startswith("Successfully edited")
+        assert os.listdir(tmp) == ["a.txt"], "temporary file left behind"
+    print("   ✅ Guard refused the ambiguous edit")
+
+
+def test_atomic_replace_keeps_mode_and_line_endings():
+    """The original is replaced in one step, keeping permissions and CRLF"""
+    print("Testing atomic replacement...")
+    agent = AIAgent(fsync="full")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "script.sh")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write("echo one\r\necho two\r\n")
+        os.chmod(path, 0o755)
+        inode = os.stat(path).st_ino
+
+        assert agent._edit_file(path, "one", "1").startswith("Successfully")
+        with open(path, encoding="utf-8", newline="") as f:
+            assert f.read() == "echo 1\r\necho two\r\n"
+        assert os.stat(path).st_mode & 0o777 == 0o755
+        assert os.stat(path).st_ino != inode
+
+        created = os.path.join(tmp, "new", "file.txt")
+        assert agent._edit_file(created, "", "fresh").startswith("Successfully created")
+        assert os.stat(created).st_mode & 0o777 == 0o666 & ~main._UMASK
+    print("   ✅ File replaced atomically")
+
+
+def test_edit_through_symlink():
+    """Editing a symlink changes its target and leaves the link in place"""
+    print("Testing edits through a symlink...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        real = os.path.join(tmp, "real.txt")
+        link = os.path.join(tmp, "link.txt")
+        with open(real, "w", encoding="utf-8") as f:
+            f.write("hello\n")
+        os.symlink("real.txt", link)
+
+        assert agent._edit_file(link, "hello", "bye").startswith("Successfully edited")
+        assert os.path.islink(link)
+        with open(real, encoding="utf-8") as f:
+            assert f.read() == "bye\n"
+
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+        from edit_file import edit_file
+        assert edit_file(link, "bye", "again").startswith("Successfully edited")
+        assert os.path.islink(link)
+        with open(real, encoding="utf-8") as f:
+            assert f.read() == "again\n"
+        assert sorted(os.listdir(tmp)) == ["link.txt", "real.txt"]
+    print("   ✅ Symlink kept, target edited")
+
+
+if __name__ == "__main__":
+    test_chunked_replace_matches_str_replace()
+    test_expected_occurrences_guard()
+    test_atomic_replace_keeps_mode_and_line_endings()
+    test_edit_through_symlink()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script to verify recursive list_files with filters and pagination
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, list_directory
+
+
+def make_tree(root):
+    for rel in ["a.py", "a-b/x.txt", "a/b/c.py", "a/b/d.txt", "a/z.py", ".git/HEAD", "z.md"]:
+        full = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w", encoding="utf-8") as f:
+            f.write(rel)
+
+
+def test_single_level_matches_old_format():
+    """depth=1 keeps the original one-level output"""
+    print("Testing single level listing...")
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tree(tmp)
+        result = AIAgent()._execute_tool("list_files", {"path": tmp})
+        assert result.splitlines()[1:] == [
+            "[DIR]  .git/", "[DIR]  a/", "[DIR]  a-b/", "[FILE] a.py", "[FILE] z.md",
+        ]
+    print("   ✅ Output unchanged for one level")
+
+
+def test_depth_and_filters():
+    """Recursion honours depth, include and exclude"""
+    print("Testing depth and glob filters...")
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tree(tmp)
+        result = list_directory(tmp, depth=5, include=["*.py"], exclude=".git")
+        assert result.splitlines()[1:] == ["[FILE] a/b/c.py", "[FILE] a/z.py", "[FILE] a.py"]
+        result = list_directory(tmp, depth=2, exclude=[".git"])
+        assert "[DIR]  a/b/" in result and "a/b/c.py" not in result
+    print("   ✅ Filters applied")
+
+
+def test_cursor_pagination():
+    """Pages joined together equal the full listing"""
+    print("Testing cursor pagination...")
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tree(tmp)
+        full = list_directory(tmp, depth=5, max_entries=1000).splitlines()[1:]
+
+        pages, cursor = [], None
+        while True:
+            result = list_directory(tmp, depth=5, max_entries=3, cursor=cursor)
+            lines = result.splitlines()[1:]
+            if lines and lines[-1].startswith("More entries"):
+                cursor = lines.pop().split('cursor="')[1].rstrip('"')
+                pages.extend(lines)
+            else:
+                pages.extend(lines)
+                break
+        assert pages == full
+    print(f"   ✅ {len(full)} entries paged in groups of 3")
+
+
+def test_standalone_copy_matches():
+    """tools/list_files.py pages and truncates exactly like list_directory"""
+    print("Testing the standalone list_files copy...")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+    from list_files import list_files
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tree(tmp)
+        total = len(list_directory(tmp, depth=5).splitlines()) - 1
+        # Exactly max_entries entries is a complete listing
+        assert "More entries" not in list_files(tmp, depth=5, max_entries=total)
+        for options in (
+            {"depth": 5, "max_entries": total},
+            {"depth": 5, "max_entries": 3},
+            {"depth": 5, "max_entries": 3, "cursor": "a/b"},
+            {"depth": 5, "include": "*.py", "exclude": ".git"},
+            {"depth": 2, "cursor": "z.md"},
+        ):
+            assert list_files(tmp, **options) == list_directory(tmp, **options), options
+    print("   ✅ Copies agree")
+
+
+if __name__ == "__main__":
+    test_single_level_matches_old_format()
+    test_depth_and_filters()
+    test_cursor_pagination()
+    test_standalone_copy_matches()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the queued, size-capped logging pipeline
+"""
+
+import sys
+import os
+import json
+import logging
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import LogField, setup_logging
+
+
+def test_log_field_caps_payloads():
+    """Large values are cut to the cap, dict values one by one"""
+    print("Testing LogField truncation...")
+    assert str(LogField("short")) == "short"
+    capped = str(LogField("x" * 10000, limit=100))
+    assert capped.startswith("x" * 100) and capped.endswith("(10000 chars)")
+    capped = str(LogField({"path": "a.py", "new_text": "y" * 10000}, limit=50))
+    assert "'a.py'" in capped and len(capped) < 200
+    print("   ✅ Payloads capped")
+
+
+def test_queued_rotating_json_log():
+    """Records pass through the queue to a rotating JSON log"""
+    print("Testing queued logging...")
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "agent.log")
+        listener = setup_logging("INFO", path, log_format="json", max_bytes=2000, backup_count=2)
+        try:
+            for i in range(100):
+                logging.info("Tool result: %s", LogField("z" * 1000, limit=20))
+            logging.debug("hidden")
+        finally:
+            listener.stop()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+
+        files = sorted(os.listdir(tmp))
+        assert files == ["agent.log", "agent.log.1", "agent.log.2"]
+        assert all(os.path.getsize(os.path.join(tmp, name)) <= 2000 for name in files)
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        assert entries[-1]["message"].startswith("Tool result: " + "z" * 20)
+        assert all(entry["level"] == "INFO" for entry in entries)
+    print("   ✅ Log rotated and capped")
+
+
+def test_formatting_on_listener_thread():
+    """Messages are formatted by the listener and exceptions reach the JSON log"""
+    print("Testing deferred formatting...")
+
+    class ThreadName:
+        def __str__(self):
+            return threading.current_thread().name
+
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "agent.log")
+        listener = setup_logging("INFO", path, log_format="json")
+        try:
+            logging.info("formatted on %s", ThreadName())
+            try:
+                raise ValueError("bad input")
+            except ValueError:
+                logging.exception("tool failed")
+        finally:
+            listener.stop()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            for handler in saved_handlers:
+                root.addHandler(handler)
+            root.setLevel(saved_level)
+
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+    assert entries[0]["message"] != "formatted on " + threading.current_thread().name
+    assert "ValueError: bad input" in entries[1]["exception"]
+    print("   ✅ Formatted on the listener, traceback kept")
+
+
+if __name__ == "__main__":
+    test_log_field_caps_payloads()
+    test_queued_rotating_json_log()
+    test_formatting_on_listener_thread()
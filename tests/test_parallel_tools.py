@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Test script to verify concurrent execution of tool calls within one turn
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent
+
+
+def call(name, call_id, **arguments):
+    return {"id": call_id, "function": {"name": name, "arguments": arguments}}
+
+
+def test_results_keep_order_and_ids():
+    """Parallel reads overlap but results come back in request order"""
+    print("Testing parallel read_file calls...")
+
+    agent = AIAgent(max_tool_workers=5)
+    original = agent._read_file
+
+    def slow_read(path, **ranges):
+        time.sleep(0.2)
+        return original(path, **ranges)
+
+    agent._read_file = slow_read
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(5):
+            path = os.path.join(tmp, f"f{i}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"content {i}")
+            paths.append(path)
+
+        started = time.perf_counter()
+        agent._run_tool_calls([call("read_file", f"c{i}", path=p) for i, p in enumerate(paths)])
+        elapsed = time.perf_counter() - started
+
+    assert elapsed < 0.6, f"reads did not overlap ({elapsed:.2f}s)"
+    assert [m["tool_call_id"] for m in agent.messages] == [f"c{i}" for i in range(5)]
+    assert all(f"content {i}" in m["content"] for i, m in enumerate(agent.messages))
+    print(f"   ✅ 5 reads took {elapsed:.2f}s and kept their order")
+
+
+def test_edits_on_same_path_stay_ordered():
+    """edit_file calls and reads of the same path run in their original order"""
+    print("Testing ordering of edits on one path...")
+
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.txt")
+        agent._run_tool_calls([
+            call("edit_file", "e1", path=path, old_text="", new_text="one"),
+            call("edit_file", "e2", path=path, old_text="one", new_text="two"),
+            call("read_file", "r1", path=path),
+            call("edit_file", "e3", path=path, old_text="two", new_text="three"),
+        ])
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == "three"
+
+    assert agent.messages[2]["content"].endswith("two")
+    lanes = AIAgent._plan_tool_lanes([
+        ("edit_file", {"path": "x"}),
+        ("read_file", {"path": "./x"}),
+        ("read_file", {"path": "y"}),
+    ])
+    assert lanes == [[0, 1], [2]]
+    print("   ✅ Same-path calls serialized, others independent")
+
+
+def test_bad_arguments_still_answered():
+    """A null path or a failing tool still gets a tool message"""
+    print("Testing tool calls with bad arguments...")
+
+    agent = AIAgent(max_tool_workers=3)
+    execute = agent._execute_tool
+
+    def failing_list(name, args):
+        if name == "list_files":
+            raise RuntimeError("boom")
+        return execute(name, args)
+
+    agent._execute_tool = failing_list
+    agent._run_tool_calls([
+        call("read_file", "r1", path=None),
+        call("edit_file", "e1", path=None, old_text="", new_text="x"),
+        {"id": "b1", "function": {"name": "read_file", "arguments": ["not", "a", "dict"]}},
+        call("list_files", "l1", path="."),
+    ])
+    assert [m["role"] for m in agent.messages] == ["tool"] * 4
+    assert [m["tool_call_id"] for m in agent.messages] == ["r1", "e1", "b1", "l1"]
+    assert agent.messages[3]["content"].startswith("Error executing list_files")
+    print("   ✅ Every call answered")
+
+
+if __name__ == "__main__":
+    test_results_keep_order_and_ids()
+    test_edits_on_same_path_stay_ordered()
+    test_bad_arguments_still_answered()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test script to verify paged reads of large files through read_file
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import AIAgent
+
+
+def write_lines(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(1, count + 1):
+            f.write(f"line {i}\n")
+
+
+def test_line_ranges_and_tail():
+    """start_line/end_line and tail return the requested lines"""
+    print("Testing line ranges...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.log")
+        write_lines(path, 50000)
+
+        result = agent._execute_tool("read_file", {"path": path, "start_line": 10, "end_line": 12})
+        assert result.endswith("line 10\nline 11\nline 12\n")
+        assert "of 50000" in result
+
+        result = agent._execute_tool("read_file", {"path": path, "tail": 2})
+        assert result.endswith("line 49999\nline 50000\n")
+
+        result = agent._execute_tool("read_file", {"path": path, "offset": 0, "length": 7})
+        assert result.endswith("line 1\n")
+    print("   ✅ Line, byte and tail ranges work")
+
+
+def test_line_index_cached_until_file_changes():
+    """The line index is reused until the file's mtime or size changes"""
+    print("Testing line index cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.log")
+        write_lines(path, 20000)
+
+        main.read_file_range(path, start_line=1, end_line=1)
+        key = os.path.abspath(path)
+        first_index = main._line_index_cache[key][1]
+        main.read_file_range(path, start_line=5, end_line=5)
+        assert main._line_index_cache[key][1] is first_index
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("appended\n")
+        assert main.read_file_range(path, tail=1).endswith("appended\n")
+        assert main._line_index_cache[key][1] is not first_index
+    print("   ✅ Index reused, then rebuilt after the file changed")
+
+
+def test_whole_file_read_is_capped():
+    """Whole-file reads of huge files are truncated with a hint"""
+    print("Testing whole-file cap...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "huge.log")
+        write_lines(path, 100000)
+        result = main.read_file_range(path)
+        assert "use start_line/end_line" in result
+        assert len(result) < main.READ_FILE_MAX_BYTES + 500
+    print("   ✅ Large whole-file read truncated")
+
+
+if __name__ == "__main__":
+    test_line_ranges_and_tail()
+    test_line_index_cached_until_file_changes()
+    test_whole_file_read_is_capped()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the request prefix stays byte-identical across turns
+"""
+
+import sys
+import os
+import json
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent
+
+
+class RecordingClient:
+    """Records every request and answers with prompt eval figures"""
+
+    def __init__(self):
+        self.requests = []
+
+    def chat(self, model, messages, tools, stream=False):
+        self.requests.append((list(messages), tools))
+        return {
+            "message": {"content": f"reply {len(self.requests)}"},
+            "prompt_eval_count": 7,
+            "prompt_eval_duration": 1000,
+        }
+
+
+def test_prefix_is_stable():
+    """System prompt, tools and earlier history serialize identically each turn"""
+    print("Testing request prefix stability...")
+    agent = AIAgent()
+    agent.client = RecordingClient()
+
+    agent.chat("first")
+    agent.chat("second")
+
+    (first_messages, first_tools), (second_messages, second_tools) = agent.client.requests
+    assert first_tools is second_tools
+    assert first_messages[0] is second_messages[0]
+    first_bytes = json.dumps([first_tools, first_messages])[:-2]
+    second_bytes = json.dumps([second_tools, second_messages])
+    assert second_bytes.startswith(first_bytes)
+    print("   ✅ Second request extends the first byte for byte")
+
+
+def test_prompt_eval_recorded():
+    """prompt_eval_count and prompt_eval_duration are kept from the response"""
+    print("Testing prompt eval reporting...")
+    agent = AIAgent()
+    agent.client = RecordingClient()
+    agent.chat("hello")
+    assert agent.last_prompt_eval == {"prompt_eval_count": 7, "prompt_eval_duration": 1000}
+    print("   ✅ Prompt eval figures recorded")
+
+
+if __name__ == "__main__":
+    test_prefix_is_stable()
+    test_prompt_eval_recorded()
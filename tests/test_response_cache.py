@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the on-disk model response cache
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, ResponseCache
+
+
+class CountingClient:
+    """Reads a file on the first request of a turn, then answers"""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+
+    def chat(self, model, messages, tools, stream=False):
+        self.calls += 1
+        if messages[-1]["role"] == "user":
+            return {"message": {"content": "", "tool_calls": [
+                {"function": {"name": "read_file", "arguments": {"path": self.path}}}
+            ]}}
+        return {"message": {"content": "answer " + str(self.calls)}}
+
+
+def test_repeat_run_served_from_cache():
+    """A repeated scripted prompt never reaches the model"""
+    print("Testing response cache hits...")
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data.txt")
+        with open(data, "w", encoding="utf-8") as f:
+            f.write("v1")
+        cache = ResponseCache(os.path.join(tmp, "cache"))
+
+        first = AIAgent(response_cache=cache)
+        first.client.inner = CountingClient(data)
+        answer = first.chat("summarize data.txt")
+
+        second = AIAgent(response_cache=cache)
+        second.client.inner = CountingClient(data)
+        assert second.chat("summarize data.txt") == answer
+        assert second.client.inner.calls == 0
+        assert cache.hits == 2
+    print("   ✅ Second run answered from cache")
+
+
+def test_changed_file_bypasses_cache():
+    """Entries whose tool calls touched a since-changed file are not reused"""
+    print("Testing dependency invalidation...")
+    with tempfile.TemporaryDirectory() as tmp:
+        data = os.path.join(tmp, "data.txt")
+        with open(data, "w", encoding="utf-8") as f:
+            f.write("v1")
+        cache = ResponseCache(os.path.join(tmp, "cache"))
+        messages = [
+            {"role": "user", "content": "q"},
+            {"role": "assistant", "content": "", "tool_calls": [
+                {"function": {"name": "edit_file", "arguments": {"path": data, "new_text": "v1"}}}
+            ]},
+            {"role": "tool", "content": "Successfully created " + data},
+        ]
+        cache.put("k", messages, response={"message": {"content": "ok"}})
+        assert cache.get("k") is not None
+
+        with open(data, "w", encoding="utf-8") as f:
+            f.write("version two")
+        assert cache.get("k") is None
+    print("   ✅ Stale dependency detected")
+
+
+def test_age_and_size_eviction():
+    """Old entries expire and the cache stays under its size cap"""
+    print("Testing eviction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "cache"), max_bytes=2000, max_age=0.2)
+        for i in range(20):
+            cache.put(f"k{i}", [], response={"message": {"content": "x" * 200}})
+        assert cache.bytes <= 2000
+        assert cache.get("k19") is not None and cache.get("k0") is None
+        time.sleep(0.3)
+        assert cache.get("k19") is None
+        assert not os.path.exists(os.path.join(cache.directory, "k19.json"))
+    print("   ✅ Size and age limits enforced")
+
+
+if __name__ == "__main__":
+    test_repeat_run_served_from_cache()
+    test_changed_file_bypasses_cache()
+    test_age_and_size_eviction()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Tests for RoutingClient: multi-server selection and failover
+"""
+
+import sys
+import os
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import RoutingClient, AsyncRoutingClient, AIAgent, parse_servers
+
+
+class FakeNodeClient:
+    """Stands in for ollama.Client; fails while self.down is set."""
+
+    def __init__(self, host=None):
+        self.host = host
+        self.down = False
+        self.calls = 0
+        self.gate = None
+
+    def chat(self, **kwargs):
+        self.calls += 1
+        if kwargs.get("stream"):
+            return self._stream()
+        if self.down:
+            raise ConnectionError(f"{self.host} unreachable")
+        if self.gate is not None:
+            self.gate.wait(5)
+        return {"message": {"role": "assistant", "content": self.host}}
+
+    def _stream(self):
+        # Like ollama.Client, a stream only connects once it is iterated
+        if self.down:
+            raise ConnectionError(f"{self.host} unreachable")
+        yield {"message": {"content": self.host}}
+
+
+class FakeAsyncNodeClient(FakeNodeClient):
+    """Stands in for ollama.AsyncClient"""
+
+    async def chat(self, **kwargs):
+        return self._astream()
+
+    async def _astream(self):
+        if self.down:
+            raise ConnectionError(f"{self.host} unreachable")
+        yield {"message": {"content": self.host}}
+
+
+def make_router(hosts, **kwargs):
+    clients = {}
+
+    def factory(host):
+        clients[host] = FakeNodeClient(host)
+        return clients[host]
+
+    router = RoutingClient(hosts, make_client=factory, probe_interval=0, **kwargs)
+    return router, clients
+
+
+def test_parse_servers():
+    """Comma-separated --server values become a list of hosts"""
+    print("Testing server list parsing...")
+    assert parse_servers(None) == []
+    assert parse_servers("http://a:11434") == ["http://a:11434"]
+    assert parse_servers("http://a:11434, http://b:11434,") == ["http://a:11434", "http://b:11434"]
+
+    agent = AIAgent(server="http://a:11434,http://b:11434")
+    assert isinstance(agent.client, RoutingClient)
+    assert [node.host for node in agent.client.nodes] == ["http://a:11434", "http://b:11434"]
+    print("✅ Server lists parse correctly")
+
+
+def test_agents_share_router():
+    """Agents with the same servers share one router and one probe thread"""
+    print("Testing shared routers...")
+    servers = "http://shared-a:11434,http://shared-b:11434"
+    agents = [AIAgent(server=servers) for _ in range(20)]
+    assert all(agent.client is agents[0].client for agent in agents)
+    for agent in agents:
+        agent.close()
+    probes = [t for t in threading.enumerate() if t.name == "ollama-health"]
+    assert len(probes) <= 2, f"{len(probes)} probe threads"
+    print("✅ One router per server list")
+
+
+def test_least_outstanding():
+    """A busy node is skipped in favour of an idle one"""
+    print("Testing least-outstanding routing...")
+    router, clients = make_router(["a", "b"])
+    clients["a"].gate = threading.Event()
+
+    busy = threading.Thread(target=router.chat, kwargs={"model": "m", "messages": []})
+    busy.start()
+    while router.nodes[0].outstanding == 0:
+        pass
+
+    response = router.chat(model="m", messages=[])
+    assert response["message"]["content"] == "b"
+    clients["a"].gate.set()
+    busy.join()
+    assert all(node.outstanding == 0 for node in router.nodes)
+    print("✅ Requests go to the least loaded server")
+
+
+def test_latency_strategy():
+    """The latency strategy prefers the node with the lowest observed latency"""
+    print("Testing latency routing...")
+    router, clients = make_router(["a", "b"], strategy="latency")
+    router.nodes[0].latency = 0.5
+    router.nodes[1].latency = 0.1
+    assert router.chat(model="m", messages=[])["message"]["content"] == "b"
+    print("✅ Requests go to the fastest server")
+
+
+def test_failover_and_recovery():
+    """A failing node is marked unhealthy, skipped, and restored by a probe"""
+    print("Testing failover...")
+    router, clients = make_router(["a", "b"])
+    clients["a"].down = True
+
+    assert router.chat(model="m", messages=[])["message"]["content"] == "b"
+    assert not router.nodes[0].healthy
+    assert router.nodes[0].failures == 1
+
+    # Unhealthy nodes go to the back of the queue
+    clients["a"].calls = 0
+    router.chat(model="m", messages=[])
+    assert clients["a"].calls == 0
+
+    clients["b"].down = True
+    try:
+        router.chat(model="m", messages=[])
+        assert False, "expected ConnectionError"
+    except ConnectionError as e:
+        assert "All Ollama servers failed" in str(e)
+
+    class Probe:
+        def ps(self):
+            return {}
+
+    router.nodes[0].probe_client = Probe()
+    router.probe()
+    assert router.nodes[0].healthy
+    print("✅ Failed servers are skipped and recover after probing")
+
+
+def test_streaming_routes():
+    """Streams are tracked until exhausted"""
+    print("Testing streamed routing...")
+    router, clients = make_router(["a", "b"])
+    clients["a"].down = True
+    stream = router.chat(model="m", messages=[], stream=True)
+    assert router.nodes[1].outstanding == 1
+    chunks = list(stream)
+    assert chunks[0]["message"]["content"] == "b"
+    assert router.nodes[1].outstanding == 0
+    assert not router.nodes[0].healthy
+    print("✅ Streams fail over before the first chunk")
+
+
+def test_async_streaming_failover():
+    """AsyncRoutingClient also fails over lazily connecting streams"""
+    print("Testing async streamed failover...")
+    clients = {}
+
+    def factory(host):
+        clients[host] = FakeAsyncNodeClient(host)
+        return clients[host]
+
+    router = AsyncRoutingClient(["a", "b"], make_client=factory, probe_interval=0)
+    clients["a"].down = True
+
+    async def run():
+        stream = await router.chat(model="m", messages=[], stream=True)
+        return [chunk async for chunk in stream]
+
+    chunks = asyncio.run(run())
+    assert [c["message"]["content"] for c in chunks] == ["b"]
+    assert not router.nodes[0].healthy
+    assert all(node.outstanding == 0 for node in router.nodes)
+    print("✅ Async streams fail over before the first chunk")
+
+
+if __name__ == "__main__":
+    print("🧪 Running routing tests...\n")
+    test_parse_servers()
+    test_agents_share_router()
+    test_least_outstanding()
+    test_latency_strategy()
+    test_failover_and_recovery()
+    test_streaming_routes()
+    test_async_streaming_failover()
+    print("\n🎉 All routing tests passed!")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the trigram-indexed search_code tool
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, TrigramIndex, _required_literals, add_output_file
+
+
+def make_workspace(root):
+    files = {
+        "pkg/models.py": "class UserModel:\n    def save(self):\n        pass\n",
+        "pkg/views.py": "from pkg.models import UserModel\n\ndef show(user_id):\n    return UserModel()\n",
+        "README.md": "Nothing to see here\n",
+        ".git/config": "UserModel in git metadata\n",
+    }
+    for rel, text in files.items():
+        full = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        with open(full, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def test_literal_and_regex_queries():
+    """Literal and regex searches return path:line results"""
+    print("Testing search_code queries...")
+    with tempfile.TemporaryDirectory() as tmp:
+        make_workspace(tmp)
+        index = TrigramIndex(tmp)
+        assert not index.built
+
+        matches = index.search("usermodel")
+        assert index.built
+        assert len(matches) == 3
+        assert all(".git" not in m for m in matches)
+        assert any(m.endswith("models.py:1: class UserModel:") for m in matches)
+
+        matches = index.search(r"def \w+\(user_id\)", regex=True)
+        assert len(matches) == 1 and "views.py:3:" in matches[0]
+
+        assert index.search("UserModel", case_sensitive=True, max_results=1)[0].endswith("class UserModel:")
+        assert index.search("usermodel", case_sensitive=True) == []
+    print("   ✅ Queries matched")
+
+
+def test_required_literals():
+    """Only text every regex match must contain is used to filter files"""
+    print("Testing regex literal extraction...")
+    assert _required_literals(r"def \w+\(user_id\)") == ["def ", "(user_id)"]
+    assert _required_literals(r"colou?r_name") == ["colo", "r_name"]
+    assert _required_literals(r"foo|bar") == []
+    # Groups may be optional or repeated, so they make nothing required
+    assert _required_literals(r"(abc)?def") == []
+    assert _required_literals(r"(?:abc)?def") == []
+    # Escapes that spell out a character are not literal text
+    assert _required_literals(r"\x64ef") == []
+    assert _required_literals(r"\u0064efghi") == ["efghi"]
+    assert _required_literals(r"\N{LATIN SMALL LETTER D}ef") == []
+    # Character classes are skipped whole, escaped or leading ] included
+    assert _required_literals(r"[\]abc]def") == ["def"]
+    assert _required_literals(r"[]abc]defg") == ["defg"]
+    assert _required_literals(r"[^]x]yz1") == ["yz1"]
+    print("   ✅ Literals extracted")
+
+
+def test_regex_with_optional_groups():
+    """Files are not skipped because of text in optional groups or escapes"""
+    print("Testing regex searches with groups and escapes...")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "a.py"), "w", encoding="utf-8") as f:
+            f.write("xadef\nxyz\n")
+        index = TrigramIndex(tmp)
+        for pattern in (r"(abc)?def", r"(foo)*xyz", r"(?:abc)?def", r"\x64ef", r"\N{LATIN SMALL LETTER D}ef", r"[\]abc]def"):
+            assert index.search(pattern, regex=True), pattern
+    print("   ✅ Matches found")
+
+
+def test_agent_tool_and_incremental_update():
+    """edit_file keeps an already built index current"""
+    print("Testing search_code through the agent...")
+    with tempfile.TemporaryDirectory() as tmp:
+        make_workspace(tmp)
+        agent = AIAgent()
+        agent.search_index = TrigramIndex(tmp)
+
+        assert "No matches" in agent._execute_tool("search_code", {"query": "brand_new_symbol"})
+        path = os.path.join(tmp, "pkg", "new.py")
+        agent._execute_tool("edit_file", {"path": path, "new_text": "brand_new_symbol = 1\n"})
+        result = agent._execute_tool("search_code", {"query": "brand_new_symbol"})
+        assert "new.py:1:" in result
+        assert "Invalid regular expression" in agent._execute_tool(
+            "search_code", {"query": "(", "regex": True}
+        )
+    print("   ✅ Index updated after edit")
+
+
+def test_ignored_and_output_files():
+    """.gitignore'd files and the agent's own log are never searched"""
+    print("Testing ignored files...")
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {
+            ".gitignore": "# build output\n/build/\n*.tmp\nagent.log*\n",
+            "code.py": "frobnicate()\n",
+            "build/out.py": "frobnicate()\n",
+            "sub/build/kept.py": "frobnicate()\n",
+            "notes.tmp": "frobnicate\n",
+            "agent.log": "Executing tool: search_code with input: {'query': 'frobnicate'}\n",
+            "trace.jsonl": '{"query": "frobnicate"}\n',
+            "trace.jsonl.1": '{"query": "frobnicate"}\n',
+        }
+        for rel, text in files.items():
+            full = os.path.join(tmp, rel)
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            with open(full, "w", encoding="utf-8") as f:
+                f.write(text)
+        add_output_file(os.path.join(tmp, "trace.jsonl"))
+
+        index = TrigramIndex(tmp)
+        found = sorted(m.split(":")[0] for m in index.search("frobnicate"))
+        assert [os.path.relpath(m, tmp) for m in found] == ["code.py", os.path.join("sub", "build", "kept.py")], found
+
+        # Writes to ignored files do not bring them back
+        with open(os.path.join(tmp, "agent.log"), "a", encoding="utf-8") as f:
+            f.write("frobnicate again\n")
+        index.update_file(os.path.join(tmp, "agent.log"))
+        index.update_file(os.path.join(tmp, "trace.jsonl"))
+        assert len(index.search("frobnicate")) == 2
+    print("   ✅ Ignored and output files left out")
+
+
+if __name__ == "__main__":
+    test_literal_and_regex_queries()
+    test_required_literals()
+    test_regex_with_optional_groups()
+    test_agent_tool_and_incremental_update()
+    test_ignored_and_output_files()
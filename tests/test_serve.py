@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the HTTP serve mode and its session pool
+"""
+
+import sys
+import os
+import json
+import time
+import tempfile
+import threading
+import http.client
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, SessionPool, SessionBusyError, SessionStore, Workspace, make_server
+
+
+class EchoClient:
+    """Replies with the number of user messages seen so far"""
+
+    def chat(self, model, messages, tools, stream=False):
+        turns = sum(1 for m in messages if m["role"] == "user")
+        reply = f"turn {turns}: {messages[-1]['content']}"
+        if stream:
+            return iter([{"message": {"content": reply[:5]}}, {"message": {"content": reply[5:]}, "done": True}])
+        return {"message": {"content": reply}}
+
+
+def agent_factory(store=None, workspace=None):
+    def make_agent(session_id=None):
+        agent = AIAgent(session_store=store, session_id=session_id, workspace=workspace)
+        agent.client = EchoClient()
+        return agent
+    return make_agent
+
+
+def request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read().decode("utf-8")
+    connection.close()
+    return response.status, response.getheader("Content-Type"), data
+
+
+def test_http_api():
+    """Create a session, chat in it, stream a reply and close it"""
+    print("Testing HTTP API...")
+    server = make_server(SessionPool(agent_factory()), port=0)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        status, _, data = request(port, "POST", "/sessions")
+        assert status == 201
+        session_id = json.loads(data)["session_id"]
+
+        status, _, data = request(port, "POST", f"/sessions/{session_id}/messages", {"content": "hi"})
+        assert status == 200, data
+        assert json.loads(data)["reply"] == "turn 1: hi"
+
+        status, content_type, data = request(port, "POST", f"/sessions/{session_id}/messages/stream", {"content": "again"})
+        assert status == 200 and content_type == "text/event-stream"
+        events = [block for block in data.split("\n\n") if block]
+        texts = [json.loads(e[len("data: "):])["text"] for e in events if e.startswith("data: ")]
+        assert "".join(texts) == "turn 2: again"
+        assert events[-1].startswith("event: done")
+
+        assert request(port, "POST", "/sessions/nope/messages", {"content": "x"})[0] == 404
+        assert request(port, "POST", f"/sessions/{session_id}/messages", {"wrong": 1})[0] == 400
+        assert request(port, "DELETE", f"/sessions/{session_id}")[0] == 200
+        assert request(port, "POST", f"/sessions/{session_id}/messages", {"content": "x"})[0] == 404
+
+        status, _, data = request(port, "GET", "/health")
+        assert status == 200 and json.loads(data)["pool"]["sessions"] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("✅ HTTP API works")
+
+
+def test_session_lock():
+    """A session handles one message at a time"""
+    print("Testing per-session locking...")
+    pool = SessionPool(agent_factory())
+    session_id = pool.create()
+    with pool.use(session_id):
+        try:
+            with pool.use(session_id):
+                assert False, "second use should fail"
+        except SessionBusyError:
+            pass
+    with pool.use(session_id) as agent:
+        assert agent.chat("ok") == "turn 1: ok"
+    print("✅ Concurrent messages to one session are rejected")
+
+
+def test_eviction_and_reload():
+    """Full or idle pools evict sessions; stored sessions come back on demand"""
+    print("Testing session eviction...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.db"))
+        pool = SessionPool(agent_factory(store), max_sessions=2)
+        first = pool.create()
+        with pool.use(first) as agent:
+            agent.chat("remember me")
+        pool.create()
+        pool.create()  # Evicts the least recently used session
+        assert pool.stats()["evictions"] == 1
+
+        # Reloaded from the session store with its history
+        with pool.use(first) as agent:
+            assert agent.chat("still there?") == "turn 2: still there?"
+
+        pool.idle_timeout = 0
+        pool.create()
+        assert pool.stats()["sessions"] == 1
+        store.close()
+    print("✅ Sessions are evicted and reloaded")
+
+
+def test_idle_sweep_and_busy_delete():
+    """Idle sessions are swept without new traffic; busy ones cannot be deleted"""
+    print("Testing idle sweep and busy DELETE...")
+    pool = SessionPool(agent_factory(), idle_timeout=0.1, sweep_interval=0.05)
+    server = make_server(pool, port=0)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        idle = pool.create()
+        busy = pool.create()
+        with pool.use(busy):
+            assert request(port, "DELETE", f"/sessions/{busy}")[0] == 409
+            deadline = time.monotonic() + 5
+            while idle in pool._sessions and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert idle not in pool._sessions, "idle session was not swept"
+            assert busy in pool._sessions, "a busy session was swept"
+        assert request(port, "DELETE", f"/sessions/{busy}")[0] == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.shutdown()
+    pool._sweeper.join(1)
+    assert not pool._sweeper.is_alive()
+    print("✅ Idle sessions swept, busy DELETE refused")
+
+
+def test_sessions_share_workspace():
+    """Sessions reuse one index and watcher, which outlive evicted sessions"""
+    print("Testing shared workspace across sessions...")
+    with tempfile.TemporaryDirectory() as tmp:
+        workspace = Workspace(tmp, watch=True)
+        pool = SessionPool(agent_factory(workspace=workspace), max_sessions=2, sweep_interval=0)
+        try:
+            ids = [pool.create() for _ in range(3)]  # The third evicts the first
+            assert pool.stats()["evictions"] == 1
+            for session_id in ids[1:]:
+                with pool.use(session_id) as agent:
+                    assert agent.search_index is workspace.search_index
+                    assert agent.watcher is workspace.watcher
+            assert workspace.watcher._thread is not None, "eviction stopped the shared watcher"
+        finally:
+            pool.shutdown()
+            workspace.close()
+    print("✅ Sessions share the workspace")
+
+
+def test_foreign_host_rejected():
+    """Requests naming another Host, as after DNS rebinding, are refused"""
+    print("Testing Host header check...")
+    pool = SessionPool(agent_factory(), sweep_interval=0)
+    server = make_server(pool, port=0)
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        evil = {"Host": f"attacker.example:{port}"}
+        assert request(port, "POST", "/sessions", headers=evil)[0] == 403
+        assert request(port, "GET", "/health", headers=evil)[0] == 403
+        assert request(port, "DELETE", "/sessions/x", headers=evil)[0] == 403
+        assert pool.stats()["sessions"] == 0
+        assert request(port, "GET", "/health", headers={"Host": f"localhost:{port}"})[0] == 200
+        assert request(port, "GET", "/health")[0] == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.shutdown()
+    print("✅ Foreign hosts rejected")
+
+
+if __name__ == "__main__":
+    print("🧪 Running serve tests...\n")
+    test_http_api()
+    test_session_lock()
+    test_eviction_and_reload()
+    test_idle_sweep_and_busy_delete()
+    test_sessions_share_workspace()
+    test_foreign_host_rejected()
+    print("\n🎉 All serve tests passed!")
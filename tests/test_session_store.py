@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script to verify persistent sessions and fast resume
+"""
+
+import sys
+import os
+import time
+import sqlite3
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+from main import AIAgent, SessionStore
+
+
+class EchoClient:
+    def chat(self, model, messages, tools, stream=False):
+        return {"message": {"content": "echo: " + messages[-1]["content"]}}
+
+
+def test_turns_saved_incrementally_and_resumed():
+    """Each turn appends only its own messages; resume restores them all"""
+    print("Testing session save and resume...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.db"))
+        agent = AIAgent(session_store=store)
+        agent.client = EchoClient()
+        agent.chat("one")
+        agent.chat("two")
+        session_id = agent.session_id
+
+        resumed = AIAgent(session_store=store, session_id=session_id)
+        assert resumed.messages == agent.messages
+        resumed.client = EchoClient()
+        assert resumed.chat("three") == "echo: three"
+
+        db = sqlite3.connect(store.path)
+        seqs = [row[0] for row in db.execute(
+            "SELECT seq FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        )]
+        assert seqs == list(range(6))
+        assert store.sessions()[0][0] == session_id
+    print("   ✅ Session resumed")
+
+
+def test_resume_500_turns_quickly():
+    """Resuming a long session is a single indexed query"""
+    print("Testing resume of a 500-turn session...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.db"))
+        session_id = store.create("qwen3:4b")
+        for turn in range(500):
+            store.append(session_id, turn * 2, [
+                {"role": "user", "content": f"question {turn} " + "x" * 200},
+                {"role": "assistant", "content": f"answer {turn} " + "y" * 400, "tool_calls": []},
+            ])
+        started = time.perf_counter()
+        agent = AIAgent(session_store=store, session_id=session_id)
+        elapsed = time.perf_counter() - started
+        assert len(agent.messages) == 1000
+        assert agent.messages[-1]["content"].startswith("answer 499")
+    print(f"   ✅ 1000 messages restored in {elapsed * 1000:.1f} ms")
+
+
+def test_unknown_session_and_compression():
+    """Unknown ids are refused; compression is optional"""
+    print("Testing unknown sessions and compression...")
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(os.path.join(tmp, "sessions.db"))
+        try:
+            AIAgent(session_store=store, session_id="missing")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+        if main._zstd is None:
+            try:
+                SessionStore(os.path.join(tmp, "z.db"), compress=True)
+                assert False, "expected RuntimeError"
+            except RuntimeError:
+                pass
+            print("   ✅ zstd not installed; compression refused")
+            return
+        compressed = SessionStore(os.path.join(tmp, "z.db"), compress=True)
+        session_id = compressed.create("m")
+        compressed.append(session_id, 0, [{"role": "user", "content": "z" * 5000}])
+        assert compressed.load(session_id)[0]["content"] == "z" * 5000
+    print("   ✅ Compressed session round-tripped")
+
+
+if __name__ == "__main__":
+    test_turns_saved_incrementally_and_resumed()
+    test_resume_500_turns_quickly()
+    test_unknown_session_and_compression()
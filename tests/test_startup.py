@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that startup stays light: heavy imports and the
+Ollama client are deferred until they are needed
+"""
+
+import sys
+import os
+import json
+import subprocess
+import dataclasses
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, Tool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_is_lazy():
+    """Importing main or building an agent does not load ollama, pydantic or httpx"""
+    print("Testing lazy imports...")
+    script = (
+        "import sys, json, main\n"
+        "agent = main.AIAgent()\n"
+        "heavy = ['ollama', 'pydantic', 'httpx', 'asyncio']\n"
+        "before = [m for m in heavy if m in sys.modules]\n"
+        "agent.client\n"
+        "after = [m for m in heavy if m in sys.modules]\n"
+        "print(json.dumps([before, after]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, check=True, capture_output=True, text=True
+    ).stdout
+    before, after = json.loads(output.strip().splitlines()[-1])
+    assert before == [], f"loaded at startup: {before}"
+    assert "ollama" in after
+    print("✅ Heavy modules load on first client use")
+
+
+def test_tool_is_frozen_dataclass():
+    """Tool keeps its fields but is a frozen slotted dataclass"""
+    print("Testing Tool...")
+    tool = Tool(name="t", description="d", input_schema={"type": "object"})
+    assert [f.name for f in dataclasses.fields(Tool)] == ["name", "description", "input_schema"]
+    assert not hasattr(tool, "__dict__")
+    try:
+        tool.name = "other"
+        assert False, "expected FrozenInstanceError"
+    except dataclasses.FrozenInstanceError:
+        pass
+    print("✅ Tool is a frozen dataclass")
+
+
+def test_client_created_on_first_use():
+    """The client is built once, on first access"""
+    print("Testing deferred client creation...")
+    agent = AIAgent(server="http://127.0.0.1:1")
+    assert agent._client is None
+    client = agent.client
+    assert agent.client is client
+    assert str(client._client.base_url).startswith("http://127.0.0.1:1")
+    print("✅ Client is created lazily")
+
+
+if __name__ == "__main__":
+    print("🧪 Running startup tests...\n")
+    test_import_is_lazy()
+    test_tool_is_frozen_dataclass()
+    test_client_created_on_first_use()
+    print("\n🎉 All startup tests passed!")
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test script to verify streaming output and tool call assembly in chat_stream
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent
+
+
+class FakeStreamingClient:
+    """Replays canned chunk lists, one list per chat() call"""
+
+    def __init__(self, turns):
+        self.turns = list(turns)
+        self.calls = []
+
+    def chat(self, model, messages, tools, stream=False):
+        self.calls.append(list(messages))
+        return iter(self.turns.pop(0))
+
+
+def test_stream_yields_tokens():
+    """Tokens are yielded one at a time and the full reply lands in history"""
+    print("Testing chat_stream token output...")
+
+    agent = AIAgent()
+    agent.client = FakeStreamingClient([[
+        {"message": {"content": "Hel"}},
+        {"message": {"content": "lo!"}},
+        {"message": {"content": ""}, "done": True},
+    ]])
+
+    chunks = list(agent.chat_stream("hi"))
+    assert chunks == ["Hel", "lo!"]
+    assert agent.messages[-1]["content"] == "Hello!"
+    assert agent.last_turn_stats["time_to_first_token"] is not None
+    assert agent.last_turn_stats["total"] >= agent.last_turn_stats["time_to_first_token"]
+    print("   ✅ Tokens streamed and timings recorded")
+
+
+def test_stream_runs_tool_calls():
+    """Tool calls in the stream are executed before the next model request"""
+    print("Testing chat_stream tool loop...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "note.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("streamed file")
+
+        agent = AIAgent()
+        agent.client = FakeStreamingClient([
+            [
+                {"message": {"content": "", "tool_calls": [
+                    {"function": {"name": "read_file", "arguments": {"path": path}}}
+                ]}},
+                {"message": {"content": ""}, "done": True},
+            ],
+            [{"message": {"content": "Done"}, "done": True}],
+        ])
+
+        assert "".join(agent.chat_stream("read it")) == "Done"
+        tool_message = agent.client.calls[1][-1]
+        assert tool_message["role"] == "tool"
+        assert "streamed file" in tool_message["content"]
+    print("   ✅ Tool calls assembled and executed")
+
+
+if __name__ == "__main__":
+    test_stream_yields_tokens()
+    test_stream_runs_tool_calls()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the stat-validated read_file/list_files result cache
+"""
+
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, ToolResultCache
+
+
+def test_hits_and_invalidation():
+    """Repeated reads hit the cache; edit_file invalidates the file and its directory"""
+    print("Testing read_file/list_files caching...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.txt")
+        agent._execute_tool("edit_file", {"path": path, "new_text": "v1"})
+
+        assert agent._execute_tool("read_file", {"path": path}).endswith("v1")
+        assert agent._execute_tool("read_file", {"path": path}).endswith("v1")
+        assert "a.txt" in agent._execute_tool("list_files", {"path": tmp})
+        assert agent._execute_tool("list_files", {"path": tmp}).count("[FILE]") == 1
+        assert agent.tool_cache.stats()["hits"] == 2
+
+        agent._execute_tool("edit_file", {"path": path, "old_text": "v1", "new_text": "v2"})
+        agent._execute_tool("edit_file", {"path": os.path.join(tmp, "b.txt"), "new_text": "b"})
+        assert agent._execute_tool("read_file", {"path": path}).endswith("v2")
+        assert "b.txt" in agent._execute_tool("list_files", {"path": tmp})
+    print(f"   ✅ Cache stats: {agent.tool_cache.stats()}")
+
+
+def test_outside_change_detected():
+    """A change made outside the agent is caught by the stat check"""
+    print("Testing stat validation...")
+    agent = AIAgent()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("old")
+        agent._execute_tool("read_file", {"path": path})
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("newer contents")
+        assert agent._execute_tool("read_file", {"path": path}).endswith("newer contents")
+    print("   ✅ Stale entry refreshed")
+
+
+def test_size_cap_evicts_oldest():
+    """The cache never holds more than max_bytes"""
+    print("Testing byte cap...")
+    cache = ToolResultCache(max_bytes=400)
+    for i in range(10):
+        cache.put(("read_file", str(i)), f"/p{i}", (1, 1, 1), "x" * 100)
+    assert cache.stats()["bytes"] <= 400
+    assert ("read_file", "0") not in cache._entries
+    assert ("read_file", "9") in cache._entries
+    print("   ✅ Oldest entries evicted")
+
+
+if __name__ == "__main__":
+    test_hits_and_invalidation()
+    test_outside_change_detected()
+    test_size_cap_evicts_oldest()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the tool registry: generated schemas, dispatch and
+lazily loaded tool modules
+"""
+
+import sys
+import os
+import tempfile
+import threading
+from typing import Annotated, List, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, ToolRegistry, json_schema, tool_registry
+
+
+def test_builtin_schemas():
+    """Built-in tools get their schemas from type hints and docstrings"""
+    print("Testing generated schemas...")
+    agent = AIAgent()
+    names = [tool.name for tool in agent.tools]
+    assert names == ["read_file", "list_files", "search_code", "edit_file", "apply_edits"]
+    # Built once per process and shared between agents
+    assert AIAgent().tools is agent.tools
+
+    edit = next(tool for tool in agent.tools if tool.name == "edit_file")
+    assert edit.description.startswith("Edit a file by replacing old_text")
+    assert edit.input_schema["required"] == ["path", "new_text"]
+    assert edit.input_schema["properties"]["expected_occurrences"]["type"] == "integer"
+
+    batch = next(tool for tool in agent.tools if tool.name == "apply_edits")
+    items = batch.input_schema["properties"]["edits"]["items"]
+    assert items["required"] == ["path", "new_text"]
+    assert "description" in items["properties"]["old_text"]
+
+    assert json_schema(Annotated[Optional[List[str]], "globs"]) == {
+        "type": "array", "items": {"type": "string"}, "description": "globs",
+    }
+    print("✅ Schemas are generated from type hints")
+
+
+def test_dispatch():
+    """Dispatch drops unknown arguments and coerces stringly typed numbers"""
+    print("Testing dispatch...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lines.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("".join(f"line {i}\n" for i in range(1, 6)))
+        agent = AIAgent()
+        result = agent._execute_tool("read_file", {"path": path, "start_line": "2", "end_line": 3, "bogus": 1})
+        assert result.startswith("Lines 2-3 of 5"), result
+        assert agent._execute_tool("no_such_tool", {}) == "Unknown tool: no_such_tool"
+        assert agent._execute_tool("read_file", {}).startswith("Error executing read_file")
+    print("✅ Tools dispatch through the registry")
+
+
+def test_lazy_tool_modules():
+    """Tool modules are described from source and imported on first call"""
+    print("Testing lazy tool modules...")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "word_count.py"), "w", encoding="utf-8") as f:
+            f.write(
+                "import sys\n"
+                "from typing import Annotated\n"
+                "sys.modules['word_count_loaded'] = sys\n\n\n"
+                "def word_count(text: Annotated[str, 'Text to count'], unique: bool = False) -> str:\n"
+                "    \"\"\"Count the words in a text.\"\"\"\n"
+                "    words = text.split()\n"
+                "    return str(len(set(words)) if unique else len(words))\n"
+            )
+        with open(os.path.join(tmp, "read_file.py"), "w", encoding="utf-8") as f:
+            f.write("def read_file(path: str) -> str:\n    return 'shadowed'\n")
+
+        registry = ToolRegistry()
+        registry.register("read_file")(lambda self, path: "built-in")
+        registry.add_directory(tmp)
+
+        tools = {tool.name: tool for tool in registry.tools()}
+        assert set(tools) == {"read_file", "word_count"}
+        schema = tools["word_count"].input_schema
+        assert tools["word_count"].description == "Count the words in a text."
+        assert schema["properties"]["text"] == {"type": "string", "description": "Text to count"}
+        assert schema["properties"]["unique"] == {"type": "boolean"}
+        assert schema["required"] == ["text"]
+        assert "word_count_loaded" not in sys.modules, "module must not load before its first call"
+
+        assert registry.call(None, "word_count", {"text": "a b a", "unique": "true"}) == "2"
+        assert "word_count_loaded" in sys.modules
+        assert registry.call(None, "read_file", {"path": "x"}) == "built-in"
+        del sys.modules["word_count_loaded"]
+
+        try:
+            registry.register("read_file")(lambda self: "")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+    print("✅ Tool modules load on first call")
+
+
+def test_standalone_tools_are_shadowed():
+    """The tutorial's tools/ copies do not replace the built-in tools"""
+    print("Testing tools/ directory...")
+    assert tool_registry.names()[:5] == ["read_file", "list_files", "search_code", "edit_file", "apply_edits"]
+    assert not any(name.startswith("agent_tools.") for name in sys.modules)
+    print("✅ Built-in tools take precedence")
+
+
+def test_broken_plugins_are_contained():
+    """A plugin with a syntax error is skipped and non-text results are converted"""
+    print("Testing broken tool plugins...")
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "broken.py"), "w", encoding="utf-8") as f:
+            f.write("def broken(x: str) -> str\n    return x\n")
+        with open(os.path.join(tmp, "fine.py"), "w", encoding="utf-8") as f:
+            f.write("def fine() -> str:\n    return 'ok'\n")
+        registry = ToolRegistry()
+        registry.add_directory(tmp)
+        assert [tool.name for tool in registry.tools()] == ["fine"]
+
+    tool_registry.register("count_things")(lambda self: 42)
+    try:
+        agent = AIAgent()
+        assert agent._execute_tool("count_things", {}) == "42"
+    finally:
+        del tool_registry._tools["count_things"]
+        tool_registry._tool_list = None
+    print("✅ Broken plugins do not break the agent")
+
+
+def test_concurrent_discovery():
+    """Agents built on several threads all see the plugin tools"""
+    print("Testing concurrent tool discovery...")
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(20):
+            with open(os.path.join(tmp, f"plugin_{i}.py"), "w", encoding="utf-8") as f:
+                f.write(f"def plugin_{i}() -> str:\n    return '{i}'\n")
+        registry = ToolRegistry()
+        registry.add_directory(tmp)
+        seen = []
+        barrier = threading.Barrier(8)
+
+        def build():
+            barrier.wait()
+            seen.append(len(registry.tools()))
+
+        threads = [threading.Thread(target=build) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert seen == [20] * 8, seen
+    print("✅ Every thread sees every plugin")
+
+
+if __name__ == "__main__":
+    print("🧪 Running tool registry tests...\n")
+    test_builtin_schemas()
+    test_dispatch()
+    test_lazy_tool_modules()
+    test_standalone_tools_are_shadowed()
+    test_broken_plugins_are_contained()
+    test_concurrent_discovery()
+    print("\n🎉 All tool registry tests passed!")
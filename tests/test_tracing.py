@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test script to verify per-turn timing spans exported as JSONL
+"""
+
+import sys
+import os
+import json
+import tempfile
+import contextvars
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent
+
+
+class TimedClient:
+    """Asks for two files, then answers, reporting server timings"""
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def chat(self, model, messages, tools, stream=False):
+        timings = {
+            "total_duration": 900, "load_duration": 100,
+            "prompt_eval_count": 12, "prompt_eval_duration": 300,
+            "eval_count": 5, "eval_duration": 400,
+        }
+        if messages[-1]["role"] == "user":
+            return {**timings, "message": {"content": "", "tool_calls": [
+                {"function": {"name": "read_file", "arguments": {"path": p}}} for p in self.paths
+            ]}}
+        return {**timings, "message": {"content": "done"}}
+
+
+def attributes(span):
+    return {a["key"]: list(a["value"].values())[0] for a in span["attributes"]}
+
+
+def test_turn_spans():
+    """A turn exports nested request, model and tool spans"""
+    print("Testing span export...")
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for name in ("a.txt", "b.txt"):
+            paths.append(os.path.join(tmp, name))
+            with open(paths[-1], "w", encoding="utf-8") as f:
+                f.write(name)
+        trace = os.path.join(tmp, "trace.jsonl")
+
+        agent = AIAgent(trace_path=trace)
+        agent.client = TimedClient(paths)
+        assert agent.chat("read both") == "done"
+
+        with open(trace, encoding="utf-8") as f:
+            spans = [json.loads(line) for line in f]
+
+    names = [span["name"] for span in spans]
+    assert names.count("agent.turn") == 1
+    assert names.count("model.call") == 2
+    assert names.count("request.build") == 2
+    assert names.count("tool.execute") == 2
+
+    turn = spans[names.index("agent.turn")]
+    assert all(span["traceId"] == turn["traceId"] for span in spans)
+    assert all(span["parentSpanId"] == turn["spanId"] for span in spans if span is not turn)
+    assert all(int(span["endTimeUnixNano"]) >= int(span["startTimeUnixNano"]) for span in spans)
+
+    model = attributes(spans[names.index("model.call")])
+    assert model["ollama.load_duration"] == "100"
+    assert model["ollama.prompt_eval_count"] == "12"
+    assert attributes(spans[names.index("tool.execute")])["tool.name"] == "read_file"
+    assert spans[0]["resource"]["attributes"][0]["key"] == "service.name"
+    print(f"   ✅ {len(spans)} spans exported")
+
+
+def test_tracing_disabled_by_default():
+    """Without a trace path no file is written"""
+    print("Testing disabled tracer...")
+    agent = AIAgent()
+    with agent.tracer.span("anything") as span:
+        span.set(ignored=True)
+    assert agent.tracer.path is None
+    print("   ✅ No-op tracer")
+
+
+def test_paused_stream_does_not_adopt_other_spans():
+    """Spans opened while a stream is paused are not children of its turn"""
+    print("Testing spans around a paused stream...")
+
+    class StreamingClient:
+        def chat(self, model, messages, tools, stream=False, **options):
+            if stream:
+                return iter([{"message": {"content": "a"}}, {"message": {"content": "b"}, "done": True}])
+            return {"message": {"content": "plain"}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        trace = os.path.join(tmp, "trace.jsonl")
+        streamer, other = AIAgent(trace_path=trace), AIAgent(trace_path=trace)
+        streamer.client = other.client = StreamingClient()
+
+        stream = streamer.chat_stream("hi")
+        assert next(stream) == "a"
+        assert other.chat("meanwhile") == "plain"
+        assert list(stream) == ["b"]
+
+        # A stream closed from another context must not fail resetting it
+        abandoned = streamer.chat_stream("again")
+        contextvars.copy_context().run(next, abandoned)
+        abandoned.close()
+
+        with open(trace, encoding="utf-8") as f:
+            spans = [json.loads(line) for line in f]
+    turns = [span for span in spans if span["name"] == "agent.turn"]
+    assert len(turns) == 3
+    assert all(turn["parentSpanId"] == "" for turn in turns)
+    assert len({turn["traceId"] for turn in turns}) == 3
+    by_id = {span["spanId"]: span for span in spans}
+    for span in spans:
+        if span["name"] != "agent.turn":
+            root = span
+            while root["parentSpanId"]:
+                root = by_id[root["parentSpanId"]]
+            assert root["traceId"] == span["traceId"] and root["name"] == "agent.turn"
+    print("   ✅ Turns stay separate")
+
+
+if __name__ == "__main__":
+    test_turn_spans()
+    test_tracing_disabled_by_default()
+    test_paused_stream_does_not_adopt_other_spans()
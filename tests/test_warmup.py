@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script to verify background model warm-up and unloading
+"""
+
+import sys
+import os
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import AIAgent, RoutingClient, request_key, parse_keep_alive
+
+
+class FakeClient:
+    """Records generate() calls; chat() reports the options it was given"""
+
+    def __init__(self, host=None):
+        self.generated = []
+        self.chat_options = None
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate(self, model, **options):
+        self.release.wait(5)
+        self.generated.append((model, options))
+        return {"done": True}
+
+    def chat(self, model, messages, tools, stream=False, **options):
+        self.chat_options = options
+        return {"message": {"content": "hi"}}
+
+
+def test_warm_up_in_background():
+    """Warm-up runs on its own thread and passes keep_alive"""
+    print("Testing background warm-up...")
+    agent = AIAgent(model="m", keep_alive="30m")
+    agent.client = FakeClient()
+    agent.client.release.clear()
+
+    warmer = agent.warm_up()
+    assert not warmer.wait(0.05), "warm-up must not block the caller"
+    agent.client.release.set()
+    assert warmer.wait(5)
+    assert warmer.error is None
+    assert warmer.load_seconds is not None
+    assert agent.client.generated == [("m", {"keep_alive": "30m"})]
+
+    # Every request repeats keep_alive so the server's idle timeout stays put
+    assert agent.chat("hello") == "hi"
+    assert agent.client.chat_options == {"keep_alive": "30m"}
+    print("✅ Model is preloaded in the background")
+
+
+def test_unload():
+    """unload() asks the server to drop the model right away"""
+    print("Testing unload...")
+    agent = AIAgent(model="m")
+    agent.client = FakeClient()
+    agent.unload()
+    assert agent.client.generated == [("m", {"keep_alive": 0})]
+    print("✅ Model is unloaded")
+
+
+def test_warm_up_every_server():
+    """With several servers each one is warmed"""
+    print("Testing warm-up across servers...")
+    agent = AIAgent(model="m")
+    agent.client = RoutingClient(["a", "b"], make_client=FakeClient, probe_interval=0)
+    agent.warm_up().wait(5)
+    assert all(len(node.client.generated) == 1 for node in agent.client.nodes)
+    print("✅ All servers are warmed")
+
+
+def test_warm_up_failure_is_logged():
+    """An unreachable server does not break startup"""
+    print("Testing failed warm-up...")
+
+    class Down(FakeClient):
+        def generate(self, model, **options):
+            raise ConnectionError("refused")
+
+    agent = AIAgent(model="m")
+    agent.client = Down()
+    warmer = agent.warm_up()
+    assert warmer.wait(5)
+    assert isinstance(warmer.error, ConnectionError)
+    print("✅ Warm-up errors are contained")
+
+
+def test_client_built_on_warm_up_thread():
+    """warm_up() returns before the client is built; the first turn shares it"""
+    print("Testing client construction during warm-up...")
+    agent = AIAgent(model="m")
+    building = threading.Event()
+    builders = []
+
+    def slow_create_client():
+        builders.append(threading.current_thread())
+        building.wait(5)
+        return FakeClient()
+
+    agent._create_client = slow_create_client
+    warmer = agent.warm_up()
+    assert agent._client is None
+    deadline = time.monotonic() + 5
+    while not builders and time.monotonic() < deadline:
+        time.sleep(0.01)
+    building.set()
+    assert agent.chat("hello") == "hi"
+    assert warmer.wait(5) and warmer.error is None
+    assert len(builders) == 1 and builders[0] is not threading.current_thread()
+    print("✅ Client built once, off the calling thread")
+
+
+def test_keep_alive_options():
+    """keep_alive parsing, and its absence from cache keys"""
+    print("Testing keep_alive handling...")
+    assert parse_keep_alive("-1") == -1.0
+    assert parse_keep_alive("300") == 300.0
+    assert parse_keep_alive("30m") == "30m"
+    assert request_key("m", [], None, keep_alive="5m") == request_key("m", [], None)
+    print("✅ keep_alive is parsed and not part of request keys")
+
+
+if __name__ == "__main__":
+    print("🧪 Running warm-up tests...\n")
+    test_warm_up_in_background()
+    test_unload()
+    test_warm_up_every_server()
+    test_warm_up_failure_is_logged()
+    test_client_built_on_warm_up_thread()
+    test_keep_alive_options()
+    print("\n🎉 All warm-up tests passed!")
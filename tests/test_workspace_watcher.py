@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the background workspace watcher
+"""
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import WorkspaceWatcher
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def check_backend(use_inotify):
+    with tempfile.TemporaryDirectory() as tmp:
+        existing = os.path.join(tmp, "existing.txt")
+        doomed = os.path.join(tmp, "doomed.txt")
+        for path in (existing, doomed):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("start")
+
+        watcher = WorkspaceWatcher(tmp, interval=0.1, use_inotify=use_inotify)
+        notified = []
+        watcher.subscribe(notified.append)
+        watcher.start()
+        try:
+            os.makedirs(os.path.join(tmp, "sub"))
+            added = os.path.join(tmp, "sub", "new.txt")
+            # Give inotify a moment to watch the new directory
+            time.sleep(0.3)
+            with open(added, "w", encoding="utf-8") as f:
+                f.write("hello")
+            with open(existing, "a", encoding="utf-8") as f:
+                f.write(" more")
+            os.remove(doomed)
+
+            expected = {added: "added", existing: "modified", doomed: "deleted"}
+            assert wait_for(lambda: watcher.changed_since_start() == expected), watcher.changed_since_start()
+            assert wait_for(lambda: set(expected) <= set(notified))
+        finally:
+            watcher.stop()
+        return watcher.backend
+
+
+def test_polling_backend():
+    """Polling detects added, modified and deleted files"""
+    print("Testing polling watcher...")
+    assert check_backend(use_inotify=False) == "polling"
+    print("   ✅ Polling backend reported all changes")
+
+
+def test_default_backend():
+    """The default backend (inotify on Linux) detects the same changes"""
+    print("Testing default watcher backend...")
+    backend = check_backend(use_inotify=True)
+    print(f"   ✅ {backend} backend reported all changes")
+
+
+if __name__ == "__main__":
+    test_polling_backend()
+    test_default_backend()
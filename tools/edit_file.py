@@ -1,30 +1,82 @@
 import os
+import shutil
+import tempfile
 
+CHUNK_CHARS = 1024 * 1024
 
-def edit_file(path: str, old_text: str, new_text: str) -> str:
-    if os.path.exists(path) and old_text:
-        with open(path, "r", encoding="utf-8") as f:
-            content = f.read()
 
-        if old_text not in content:
-            return f"Text not found in file: {old_text}"
+def _replace_stream(src, dst, old_text, new_text):
+    count = 0
+    pending = ""
+    while True:
+        chunk = src.read(CHUNK_CHARS)
+        # split() finds the same left-to-right, non-overlapping matches as
+        # str.replace, at C speed
+        parts = (pending + chunk).split(old_text)
+        count += len(parts) - 1
+        if not chunk:
+            dst.write(new_text.join(parts))
+            return count
+        last = parts.pop()
+        if parts:
+            dst.write(new_text.join(parts))
+            dst.write(new_text)
+        # Carry over a tail that could be the start of a match
+        keep = max(len(last) - len(old_text) + 1, 0)
+        dst.write(last[:keep])
+        pending = last[keep:]
 
-        content = content.replace(old_text, new_text)
 
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(content)
+def edit_file(
+    path: str,
+    old_text: str,
+    new_text: str,
+    expected_occurrences: int = None,
+    fsync: bool = False,
+) -> str:
+    # Only create directory if path contains subdirectories
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    # Follow symlinks, so the link survives and its target is edited
+    target = os.path.realpath(path)
 
-        return f"Successfully edited {path}"
-    else:
-        # Only create directory if path contains subdirectories
-        dir_name = os.path.dirname(path)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
+    editing = os.path.exists(target) and old_text
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+    try:
+        with open(fd, "w", encoding="utf-8", newline="") as dst:
+            if editing:
+                with open(target, "r", encoding="utf-8", newline="") as src:
+                    count = _replace_stream(src, dst, old_text, new_text)
+            else:
+                dst.write(new_text)
+            if fsync:
+                dst.flush()
+                os.fsync(dst.fileno())
 
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(new_text)
+        if editing:
+            if count == 0:
+                os.unlink(temp_path)
+                return f"Text not found in file: {old_text}"
+            if expected_occurrences is not None and count != expected_occurrences:
+                os.unlink(temp_path)
+                return (
+                    f"Expected {expected_occurrences} occurrence(s) of old_text in {path} "
+                    f"but found {count}; file not changed"
+                )
+            shutil.copymode(target, temp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
 
-        return f"Successfully created {path}"
+        os.replace(temp_path, target)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return f"Successfully edited {path}" if editing else f"Successfully created {path}"
 
 
 if __name__ == "__main__":
@@ -1,23 +1,84 @@
+import fnmatch
 import os
 
 
-def list_files(path: str) -> str:
+def list_files(
+    path: str,
+    depth: int = 1,
+    include: list = None,
+    exclude: list = None,
+    max_entries: int = 500,
+    cursor: str = None,
+) -> str:
     if not os.path.exists(path):
         return f"Path not found: {path}"
 
+    def as_patterns(value):
+        # Models send either a list or a comma-separated string
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = value.split(",")
+        return [pattern.strip() for pattern in value if pattern.strip()]
+
+    def matches(name, rel, patterns):
+        return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in patterns)
+
+    depth = max(int(depth), 1)
+    max_entries = max(int(max_entries), 1)
+    include = as_patterns(include)
+    exclude = as_patterns(exclude)
+    # Sorted depth-first order is the order of relative paths compared
+    # component by component, so the cursor can prune whole subtrees
+    after = tuple(cursor.split("/")) if cursor else None
+
     items = []
-    for item in sorted(os.listdir(path)):
-        item_path = os.path.join(path, item)
-        if os.path.isdir(item_path):
-            items.append(f"[DIR]  {item}/")
-        else:
-            items.append(f"[FILE] {item}")
+    last = None
+    truncated = False
+
+    def walk(directory, prefix, level):
+        nonlocal last, truncated
+        with os.scandir(directory) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        for entry in entries:
+            parts = prefix + (entry.name,)
+            rel = "/".join(parts)
+            is_dir = entry.is_dir()
+            if exclude and matches(entry.name, rel, exclude):
+                continue
+            if after is not None and parts <= after and after[:len(parts)] != parts:
+                continue  # Subtree entirely before the cursor
+            if after is None or parts > after:
+                if is_dir and not include:
+                    line = f"[DIR]  {rel}/"
+                elif not is_dir and (not include or matches(entry.name, rel, include)):
+                    line = f"[FILE] {rel}"
+                else:
+                    line = None
+                if line is not None:
+                    # Only stop once another entry exists beyond the limit
+                    if len(items) == max_entries:
+                        truncated = True
+                        return False
+                    items.append(line)
+                    last = rel
+            if is_dir and level < depth and not entry.is_symlink():
+                if not walk(entry.path, parts, level + 1):
+                    return False
+        return True
+
+    walk(path, (), 1)
 
     if not items:
+        if cursor:
+            return f"No more entries in {path}"
         return f"Empty directory: {path}"
 
-    return f"Contents of {path}:\n" + "\n".join(items)
+    result = f"Contents of {path}:\n" + "\n".join(items)
+    if truncated:
+        result += f"\nMore entries available; call list_files again with cursor=\"{last}\""
+    return result
 
 
 if __name__ == "__main__":
-    print(list_files(".."))
+    print(list_files("..", depth=2, exclude=[".git", "__pycache__"]))
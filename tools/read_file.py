@@ -1,8 +1,49 @@
-def read_file(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read()
-    return f"File contents of {path}:\n{content}"
+import mmap
+import os
+
+
+def read_file(
+    path: str,
+    start_line: int = None,
+    end_line: int = None,
+    offset: int = None,
+    length: int = None,
+    tail: int = None,
+) -> str:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return f"File contents of {path}:\n"
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if offset is not None or length is not None:
+                start = min(max(offset or 0, 0), size)
+                stop = size if length is None else min(start + length, size)
+                text = data[start:stop].decode("utf-8", errors="replace")
+                return f"Bytes {start}-{stop} of {size} in {path}:\n{text}"
+
+            if start_line is None and end_line is None and tail is None:
+                return f"File contents of {path}:\n" + data[:].decode("utf-8", errors="replace")
+
+            # Byte offsets at which each line starts, plus the end of the file
+            offsets = [0]
+            pos = data.find(b"\n")
+            while pos != -1:
+                offsets.append(pos + 1)
+                pos = data.find(b"\n", pos + 1)
+            if offsets[-1] != size:
+                offsets.append(size)
+
+            total = len(offsets) - 1
+            if tail is not None:
+                first, last = max(total - tail, 0) + 1, total
+            else:
+                first = max(start_line or 1, 1)
+                last = min(end_line if end_line is not None else total, total)
+            if first > last:
+                return f"No lines {first}-{last} in {path} ({total} lines)"
+            text = data[offsets[first - 1]:offsets[last]].decode("utf-8", errors="replace")
+            return f"Lines {first}-{last} of {total} in {path}:\n{text}"
 
 
 if __name__ == "__main__":
-    print(read_file("../main.py"))
+    print(read_file("../main.py", start_line=1, end_line=20))